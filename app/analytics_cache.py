@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+import sys
+import threading
+import time
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int # entries dropped to stay within max_entries or max_bytes
+    expirations: int # entries found past their time to live
+    invalidations: int # entries dropped because a write changed what they were computed from
+    entries: int
+    bytes: int
+
+'''
+Bounded LRU cache of read query results, keyed by (course_id, query, args). Entries are indexed by course and query, so a write
+drops exactly the results it may have changed: one query with given args, every entry of a query, or a whole course.
+max_bytes bounds an estimate of the memory held by keys and values, max_entries their number, and ttl in seconds how long an
+entry may be served at all, for results whose course can also change outside the owner of the cache.
+
+A result computed while its course was invalidated is returned but not stored, so a read racing a write never caches
+what the write replaced
+'''
+class AnalyticsCache:
+    ENTRY_OVERHEAD = 200 # rough bytes for an entry's tuple and its slots in the lru and course index dicts
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 16 * 2 ** 20, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: 'OrderedDict[Tuple, Tuple[Any, Optional[float], int]]' = OrderedDict() # { key : (value, expiry, size) }, least recently used first
+        self._keys_by_course: Dict[Any, Dict[str, set]] = dict() # { course_id : { query : set of args } }
+        self._course_versions: Dict[Any, int] = dict() # bumped by every invalidation of a course
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = self._expirations = self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, course_id, query: str, args: Tuple, compute: Callable[[], Any]) -> Any:
+        key = (course_id, query, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+                self._remove(key)
+                self._expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            self._misses += 1
+            version = self._course_versions.get(course_id, 0)
+        value = compute() # errors propagate and are not cached
+        with self._lock:
+            if self._course_versions.get(course_id, 0) == version:
+                self._store(key, value)
+        return value
+
+    def invalidate(self, course_id, query: Optional[str] = None, args: Optional[Tuple] = None) -> None:
+        # drops one entry when args are given, every entry of the query when only the query is, and the whole course otherwise
+        with self._lock:
+            self._course_versions[course_id] = self._course_versions.get(course_id, 0) + 1
+            queries = self._keys_by_course.get(course_id, {})
+            if query is None:
+                keys = [(course_id, query_name, query_args) for query_name, args_set in queries.items() for query_args in args_set]
+            elif args is None:
+                keys = [(course_id, query, query_args) for query_args in queries.get(query, ())]
+            else:
+                keys = [(course_id, query, args)] if args in queries.get(query, ()) else []
+            for key in keys:
+                self._remove(key)
+            self._invalidations += len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            for course_id in self._keys_by_course:
+                self._course_versions[course_id] = self._course_versions.get(course_id, 0) + 1
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_course.clear()
+            self._bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, self._expirations, self._invalidations, len(self._entries), self._bytes)
+
+    def _store(self, key, value) -> None:
+        if key in self._entries:
+            self._remove(key)
+        size = self.ENTRY_OVERHEAD + self._estimate_size(key) + self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, None if self.ttl is None else self.clock() + self.ttl, size)
+        self._keys_by_course.setdefault(key[0], dict()).setdefault(key[1], set()).add(key[2])
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _remove(self, key) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        course_id, query, args = key
+        queries = self._keys_by_course[course_id]
+        queries[query].discard(args)
+        if not queries[query]:
+            del queries[query]
+            if not queries:
+                del self._keys_by_course[course_id]
+
+    @staticmethod
+    def _estimate_size(value) -> int:
+        # shallow size plus the shallow sizes of the items of a list or tuple, which is what query results and keys are made of
+        size = sys.getsizeof(value)
+        if isinstance(value, (list, tuple)):
+            size += sum(AnalyticsCache._estimate_size(item) for item in value)
+        return size
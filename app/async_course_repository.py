@@ -0,0 +1,73 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+from app.model import Course, CourseSummary, TranscriptEntry
+
+# Coroutine version of CourseRepository for async callers. Mirrors CourseRepository method for method
+class AsyncCourseRepository(ABC):
+    @abstractmethod
+    async def get_all_courses(self) -> List[Course]:
+        pass
+
+    @abstractmethod
+    async def get_course(self, course_id: int) -> Course:
+        pass
+
+    @abstractmethod
+    async def save_course(self, course: Course) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_course(self, course_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    async def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        pass
+
+    @abstractmethod
+    async def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        pass
+
+    @abstractmethod
+    async def next_id(self) -> int:
+        pass
+
+    @abstractmethod
+    async def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    async def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    async def get_courses_for_student(self, student_id) -> List[Course]:
+        pass
+
+    @abstractmethod
+    async def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        pass
+
+    @abstractmethod
+    async def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        pass
+
+    @abstractmethod
+    async def get_grade_histogram(self, course_id: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        pass
@@ -0,0 +1,71 @@
+from app.async_course_repository import AsyncCourseRepository
+from app.course_repository import CourseRepository
+from app.model import Course, CourseSummary, TranscriptEntry
+from concurrent.futures import Executor
+from typing import List, Optional, Tuple
+import asyncio
+
+# AsyncCourseRepository that runs a synchronous CourseRepository on an executor, so that blocking storage never stalls the event loop.
+# Without an executor the calls run directly on the loop, which suits repositories that never block such as the in-memory one
+class AsyncCourseRepositoryImpl(AsyncCourseRepository):
+
+    def __init__(self, course_repository: CourseRepository, executor: Optional[Executor] = None) -> None:
+        self.course_repository = course_repository
+        self.executor = executor
+        super().__init__()
+
+    async def get_all_courses(self) -> List[Course]:
+        return await self._call(self.course_repository.get_all_courses)
+
+    async def get_course(self, course_id: int) -> Course:
+        return await self._call(self.course_repository.get_course, course_id)
+
+    async def save_course(self, course: Course) -> None:
+        return await self._call(self.course_repository.save_course, course)
+
+    async def delete_course(self, course_id: int) -> bool:
+        return await self._call(self.course_repository.delete_course, course_id)
+
+    async def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        return await self._call(self.course_repository.get_course_page, after_course_id, limit)
+
+    async def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        return await self._call(self.course_repository.get_course_summary_page, after_course_id, limit)
+
+    async def next_id(self) -> int:
+        return self.course_repository.next_id() # allocation is in memory and never blocks
+
+    async def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        return await self._call(self.course_repository.get_assignment_grade_total, course_id, assignment_id)
+
+    async def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        return await self._call(self.course_repository.get_student_grade_total, course_id, student_id)
+
+    async def get_courses_for_student(self, student_id) -> List[Course]:
+        return await self._call(self.course_repository.get_courses_for_student, student_id)
+
+    async def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        return await self._call(self.course_repository.get_student_transcript, student_id)
+
+    async def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        return await self._call(self.course_repository.get_assignment_grade_histogram, course_id, assignment_id)
+
+    async def get_grade_histogram(self, course_id: int) -> List[int]:
+        return await self._call(self.course_repository.get_grade_histogram, course_id)
+
+    async def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        return await self._call(self.course_repository.get_top_k_students, course_id, k)
+
+    async def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        return await self._call(self.course_repository.get_bottom_k_students, course_id, k)
+
+    async def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        return await self._call(self.course_repository.get_students_by_average, course_id, lowest, highest)
+
+    async def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        return await self._call(self.course_repository.get_students_by_average_in_all_courses, lowest, highest)
+
+    async def _call(self, method, *args):
+        if self.executor is None:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, method, *args)
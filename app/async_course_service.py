@@ -0,0 +1,137 @@
+from abc import ABC, abstractmethod
+from typing import List, Any, AsyncIterator, Iterable, Tuple
+
+
+# Coroutine version of CourseService for async front ends. Each method behaves like its CourseService counterpart
+class AsyncCourseService(ABC):
+    @abstractmethod
+    async def get_courses(self) -> List[Any]:
+        pass
+
+    @abstractmethod
+    def iter_courses(self, page_size: int = 100) -> AsyncIterator[Any]:
+        pass
+
+    @abstractmethod
+    async def get_course_summaries(self, after_course_id=None, limit: int = 100) -> List[Any]:
+        pass
+
+    @abstractmethod
+    def iter_course_summaries(self, page_size: int = 100) -> AsyncIterator[Any]:
+        pass
+
+    @abstractmethod
+    async def get_course_by_id(self, course_id) -> Any:
+        pass
+
+    @abstractmethod
+    async def create_course(self, course_name) -> int:
+        pass
+
+    @abstractmethod
+    async def delete_course(self, course_id) -> bool:
+        pass
+
+    @abstractmethod
+    async def create_assignment(self, course_id, assignment_name) -> int:
+        pass
+
+    @abstractmethod
+    async def enroll_student(self, course_id, student_id) -> bool:
+        pass
+
+    @abstractmethod
+    async def dropout_student(self, course_id, student_id) -> bool:
+        pass
+
+    @abstractmethod
+    async def submit_assignment(self, course_id, student_id, assignment_id, grade: int) -> bool:
+        pass
+
+    @abstractmethod
+    async def create_assignments(self, course_id, assignment_names: Iterable[str]) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def enroll_students(self, course_id, student_ids: Iterable) -> List[bool]:
+        pass
+
+    @abstractmethod
+    async def submit_assignments(self, course_id, submissions: Iterable[Tuple[Any, Any, int]]) -> List[bool]:
+        pass
+
+    @abstractmethod
+    async def get_assignment_grade_avg(self, course_id, assignment_id) -> int:
+        pass
+
+    @abstractmethod
+    async def get_student_grade_avg(self, course_id, student_id) -> int:
+        pass
+
+    @abstractmethod
+    async def get_courses_for_student(self, student_id) -> List[Any]:
+        pass
+
+    @abstractmethod
+    async def get_student_transcript(self, student_id) -> List[Any]:
+        pass
+
+    @abstractmethod
+    async def get_assignment_grade_distribution(self, course_id, assignment_id) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_assignment_median(self, course_id, assignment_id) -> int:
+        pass
+
+    @abstractmethod
+    async def get_assignment_grade_percentile(self, course_id, assignment_id, percentile: float) -> int:
+        pass
+
+    @abstractmethod
+    async def get_course_grade_distribution(self, course_id) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_course_median(self, course_id) -> int:
+        pass
+
+    @abstractmethod
+    async def get_course_grade_percentile(self, course_id, percentile: float) -> int:
+        pass
+
+    @abstractmethod
+    async def get_top_five_students(self, course_id) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_top_k_students(self, course_id, k: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_bottom_k_students(self, course_id, k: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_students_below_average(self, course_id, threshold: float) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_students_above_average(self, course_id, threshold: float) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_students_between_averages(self, course_id, lowest: float, highest: float) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def get_students_below_average_in_all_courses(self, threshold: float) -> List[Tuple[Any, Any]]:
+        pass
+
+    @abstractmethod
+    async def get_students_above_average_in_all_courses(self, threshold: float) -> List[Tuple[Any, Any]]:
+        pass
+
+    @abstractmethod
+    async def get_students_between_averages_in_all_courses(self, lowest: float, highest: float) -> List[Tuple[Any, Any]]:
+        pass
@@ -0,0 +1,238 @@
+from app.async_course_service import AsyncCourseService
+from app.async_course_repository import AsyncCourseRepository
+from app.model import Course, CourseSummary, TranscriptEntry, assignment_grade_average, student_grade_average, assignment_grade_distribution, assignment_grade_percentile, course_grade_percentile, below_threshold, above_threshold
+from typing import List, Any, AsyncIterator, Iterable, Optional, Tuple, Callable, Dict, Type
+import asyncio
+
+# Async orchestration layer. Writes to the same course that arrive while the course is being loaded or saved are queued and
+# applied together in the next load/save cycle. Identical reads that are already in flight share a single repository call,
+# until a write to the course they read completes
+class AsyncCourseServiceImpl(AsyncCourseService):
+    _CROSS_COURSE_READS = frozenset({'get_student_transcript', 'get_students_by_average_in_all_courses'}) # reads that any course write can change
+
+    def __init__(self, course_repository: AsyncCourseRepository, course_type: Type[Course] = Course) -> None:
+        self.course_repository = course_repository
+        self.course_type = course_type # storage engine of new courses, e.g. ColumnarCourse for compact gradebooks
+        self._pending_writes: Dict[Any, List[Tuple[Callable[[Course], Any], asyncio.Future]]] = dict() # { course_id : [ (operation, future) ] }
+        self._flushing_courses = set()
+        self._reads_in_flight: Dict[Tuple, asyncio.Future] = dict()
+        self._tasks = set() # the event loop only keeps weak references to tasks, so the ones running are kept here
+        super().__init__()
+
+    async def get_courses(self) -> List[Course]:
+        return await self.course_repository.get_all_courses()
+
+    def iter_courses(self, page_size: int = 100) -> AsyncIterator[Course]:
+        return self._iter_pages(self.course_repository.get_course_page, page_size)
+
+    async def get_course_summaries(self, after_course_id: Optional[int] = None, limit: int = 100) -> List[CourseSummary]:
+        return await self.course_repository.get_course_summary_page(after_course_id, limit)
+
+    def iter_course_summaries(self, page_size: int = 100) -> AsyncIterator[CourseSummary]:
+        return self._iter_pages(self.course_repository.get_course_summary_page, page_size)
+
+    @staticmethod
+    async def _iter_pages(get_page, page_size: int):
+        page = await get_page(None, page_size)
+        while page:
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                return
+            page = await get_page(page[-1].id, page_size)
+
+    async def get_course_by_id(self, course_id: int) -> Course:
+        return await self.course_repository.get_course(course_id)
+
+    async def create_course(self, course_name: str) -> int:
+        new_course_id = await self.course_repository.next_id()
+        await self.course_repository.save_course(self.course_type(id=new_course_id, name=course_name))
+        return new_course_id
+
+    async def delete_course(self, course_id: int) -> bool:
+        return await self._write(course_id, None)
+
+    async def create_assignment(self, course_id: int, assignment_name: str) -> int:
+        new_assignment_id = await self.course_repository.next_id()
+        return await self._write(course_id, lambda course: course.create_assignment(assignment_name, new_assignment_id))
+
+    async def enroll_student(self, course_id: int, student_id: int) -> bool:
+        return await self._write(course_id, lambda course: course.enroll_student(student_id))
+
+    async def dropout_student(self, course_id: int, student_id: int) -> bool:
+        return await self._write(course_id, lambda course: course.dropout_student(student_id))
+
+    async def submit_assignment(self, course_id: int, student_id: int, assignment_id: int, grade: int) -> bool:
+        return await self._write(course_id, lambda course: course.submit_assignment(student_id, assignment_id, grade))
+
+    async def create_assignments(self, course_id: int, assignment_names: Iterable[str]) -> List[int]:
+        new_assignments = [(assignment_name, await self.course_repository.next_id()) for assignment_name in assignment_names]
+        return await self._write(course_id, lambda course: [course.create_assignment(assignment_name, new_assignment_id) for assignment_name, new_assignment_id in new_assignments])
+
+    async def enroll_students(self, course_id: int, student_ids: Iterable[int]) -> List[bool]:
+        student_ids = list(student_ids)
+        return await self._write(course_id, lambda course: [course.enroll_student(student_id) for student_id in student_ids])
+
+    async def submit_assignments(self, course_id: int, submissions: Iterable[Tuple[int, int, int]]) -> List[bool]:
+        submissions = list(submissions)
+        return await self._write(course_id, lambda course: [course.submit_assignment(student_id, assignment_id, grade) for student_id, assignment_id, grade in submissions])
+
+    async def get_assignment_grade_avg(self, course_id: int, assignment_id: int) -> int:
+        grade_total = await self._read(self.course_repository.get_assignment_grade_total, course_id, assignment_id)
+        return assignment_grade_average(course_id, assignment_id, grade_total)
+
+    async def get_student_grade_avg(self, course_id: int, student_id: int) -> int:
+        grade_total = await self._read(self.course_repository.get_student_grade_total, course_id, student_id)
+        return student_grade_average(course_id, student_id, grade_total)
+
+    async def get_assignment_grade_distribution(self, course_id: int, assignment_id: int) -> List[int]:
+        grade_histogram = await self._read(self.course_repository.get_assignment_grade_histogram, course_id, assignment_id)
+        return assignment_grade_distribution(course_id, assignment_id, grade_histogram)
+
+    async def get_assignment_median(self, course_id: int, assignment_id: int) -> int:
+        return await self.get_assignment_grade_percentile(course_id, assignment_id, 50)
+
+    async def get_assignment_grade_percentile(self, course_id: int, assignment_id: int, percentile: float) -> int:
+        grade_histogram = await self._read(self.course_repository.get_assignment_grade_histogram, course_id, assignment_id)
+        return assignment_grade_percentile(course_id, assignment_id, grade_histogram, percentile)
+
+    async def get_course_grade_distribution(self, course_id: int) -> List[int]:
+        return list(await self._read(self.course_repository.get_grade_histogram, course_id))
+
+    async def get_course_median(self, course_id: int) -> int:
+        return await self.get_course_grade_percentile(course_id, 50)
+
+    async def get_course_grade_percentile(self, course_id: int, percentile: float) -> int:
+        return course_grade_percentile(course_id, await self._read(self.course_repository.get_grade_histogram, course_id), percentile)
+
+    async def get_courses_for_student(self, student_id: int) -> List[Course]:
+        return await self.course_repository.get_courses_for_student(student_id)
+
+    async def get_student_transcript(self, student_id: int) -> List[TranscriptEntry]:
+        return list(await self._read(self.course_repository.get_student_transcript, student_id))
+
+    async def get_top_five_students(self, course_id: int) -> List[int]:
+        return await self.get_top_k_students(course_id, 5)
+
+    async def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        return list(await self._read(self.course_repository.get_top_k_students, course_id, k))
+
+    async def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        return list(await self._read(self.course_repository.get_bottom_k_students, course_id, k))
+
+    async def get_students_below_average(self, course_id: int, threshold: float) -> List[int]:
+        return list(await self._read(self.course_repository.get_students_by_average, course_id, *below_threshold(threshold)))
+
+    async def get_students_above_average(self, course_id: int, threshold: float) -> List[int]:
+        return list(await self._read(self.course_repository.get_students_by_average, course_id, *above_threshold(threshold)))
+
+    async def get_students_between_averages(self, course_id: int, lowest: float, highest: float) -> List[int]:
+        return list(await self._read(self.course_repository.get_students_by_average, course_id, lowest, highest))
+
+    async def get_students_below_average_in_all_courses(self, threshold: float) -> List[Tuple[int, int]]:
+        return list(await self._read(self.course_repository.get_students_by_average_in_all_courses, *below_threshold(threshold)))
+
+    async def get_students_above_average_in_all_courses(self, threshold: float) -> List[Tuple[int, int]]:
+        return list(await self._read(self.course_repository.get_students_by_average_in_all_courses, *above_threshold(threshold)))
+
+    async def get_students_between_averages_in_all_courses(self, lowest: float, highest: float) -> List[Tuple[int, int]]:
+        return list(await self._read(self.course_repository.get_students_by_average_in_all_courses, lowest, highest))
+
+    async def _read(self, projection, *args):
+        key = (projection.__name__,) + args
+        read = self._reads_in_flight.get(key)
+        if read is None:
+            read = self._start(projection(*args))
+            self._reads_in_flight[key] = read
+            read.add_done_callback(lambda _: self._reads_in_flight.get(key) is read and self._reads_in_flight.pop(key))
+        return await asyncio.shield(read) # a cancelled caller must not cancel the read for everyone else waiting on it
+
+    def _start(self, coroutine) -> asyncio.Future:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _forget_reads(self, course_id) -> None:
+        # reads in flight may have missed a write to the course that just completed, so callers from now on start their own
+        for key in [key for key in self._reads_in_flight if key[0] in self._CROSS_COURSE_READS or key[1] == course_id]:
+            del self._reads_in_flight[key]
+
+    async def _write(self, course_id: int, operation):
+        # operation is applied to the loaded course. None stands for deleting the course
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.setdefault(course_id, []).append((operation, future))
+        if course_id not in self._flushing_courses:
+            self._flushing_courses.add(course_id)
+            self._start(self._flush_writes(course_id))
+        return await future
+
+    async def _flush_writes(self, course_id: int) -> None:
+        # only one flush runs per course, so load/save cycles of the same course never interleave
+        try:
+            while course_id in self._pending_writes:
+                await self._apply_writes(course_id, self._pending_writes.pop(course_id))
+        finally:
+            self._flushing_courses.discard(course_id)
+
+    async def _apply_writes(self, course_id: int, writes) -> None:
+        course = None
+        results = [] # (future, result) of operations that are settled once the course they were applied to is saved
+        for operation, future in writes:
+            try:
+                if operation is None:
+                    await self._save(course, results)
+                    course = None
+                    deleted = await self.course_repository.delete_course(course_id)
+                    self._forget_reads(course_id)
+                    self._settle(future, deleted)
+                    continue
+                if course is None:
+                    course = await self.course_repository.get_course(course_id)
+            except Exception as e:
+                self._settle(future, error=e)
+                continue
+            change_count = len(course.pending_changes)
+            try:
+                results.append((future, operation(course)))
+            except Exception as e:
+                # model operations validate before mutating, so only a batch can fail part way through. Its changes are undone
+                if len(course.pending_changes) > change_count:
+                    course = await self._rolled_back(course, change_count, results)
+                self._settle(future, error=e)
+        await self._save(course, results)
+
+    async def _rolled_back(self, course: Course, change_count: int, results) -> Optional[Course]:
+        # the course with only its first change_count pending changes: reloaded, and those changes replayed on it. When it can't be
+        # reloaded, the operations applied before fail too, as they can't be saved without the failed batch
+        try:
+            rolled_back = await self.course_repository.get_course(course.id)
+        except Exception as e:
+            for future, _ in results:
+                self._settle(future, error=e)
+            results.clear()
+            return None
+        rolled_back.apply_changes(course.pending_changes[:change_count])
+        return rolled_back
+
+    async def _save(self, course: Course, results) -> None:
+        try:
+            if course is not None:
+                await self.course_repository.save_course(course)
+                self._forget_reads(course.id)
+        except Exception as e:
+            for future, _ in results:
+                self._settle(future, error=e)
+        else:
+            for future, result in results:
+                self._settle(future, result)
+        results.clear()
+
+    @staticmethod
+    def _settle(future: asyncio.Future, result=None, error: Exception = None) -> None:
+        if future.done(): # the caller stopped waiting
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
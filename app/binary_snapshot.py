@@ -0,0 +1,341 @@
+from app.course_repository import CourseRepository
+from app.model import GRADE_BUCKETS, Course, CourseSummary, TranscriptEntry, transcript_entry, average_range
+from app.columnar_model import MISSING_GRADE
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+import mmap
+import os
+import struct
+import sys
+
+'''
+Compact read-only file format for archived courses, served straight from a memory map.
+
+    file header     magic, version, course count, offset of the course index
+    course records  one per course, each 8-byte aligned:
+                    header (name length, student count, former student count, assignment count, ranked student count,
+                    submission count), name, sorted student ids, sorted ids of former students who kept grades,
+                    sorted assignment ids, ends of the assignment names, assignment grade sums and counts,
+                    student grade sums and counts, ranked student ids best first, assignment names,
+                    uint8 grade matrix with one row per student, then per former student, and one column per assignment
+                    (MISSING_GRADE where there is none)
+    course index    sorted course ids followed by the offsets of their records
+
+Every number is a native little-endian uint64 apart from the grades, so sections are read through memoryview casts without copying.
+Ids must be ints that fit in 64 bits. Opening a file only maps it: a course is located by binary search in the index, and
+a query only touches the pages of the sections it reads, e.g. the first k ranked ids for a top-k
+'''
+MAGIC = b'CRSB'
+VERSION = 2 # 2 added the former students, whose grades stay in their courses
+FILE_HEADER = struct.Struct('<4sIQQ')
+COURSE_HEADER = struct.Struct('<IIIII4xQ')
+
+def write_binary_snapshot(path: str, courses: Iterable[Course]) -> None:
+    # writes to a temporary file first, so readers of an existing snapshot at path never see a partial one
+    try:
+        with open(path + '.tmp', 'wb') as snapshot_file:
+            _write_courses(snapshot_file, courses)
+    except:
+        os.remove(path + '.tmp')
+        raise
+    os.replace(path + '.tmp', path)
+
+def _write_courses(snapshot_file, courses: Iterable[Course]) -> None:
+    course_offsets = dict()
+    snapshot_file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, 0))
+    for course in courses:
+        if course.id in course_offsets:
+            raise ValueError(f"Course {course.id} appears more than once")
+        course_offsets[_checked_id(course.id)] = snapshot_file.tell()
+        snapshot_file.write(_encode_course(course))
+    index_offset = snapshot_file.tell()
+    course_ids = sorted(course_offsets)
+    snapshot_file.write(array('Q', course_ids).tobytes() + array('Q', [course_offsets[course_id] for course_id in course_ids]).tobytes())
+    snapshot_file.seek(0)
+    snapshot_file.write(FILE_HEADER.pack(MAGIC, VERSION, len(course_ids), index_offset))
+    snapshot_file.flush()
+    os.fsync(snapshot_file.fileno())
+
+def _encode_course(course: Course) -> bytes:
+    student_ids = sorted(_checked_id(student_id) for student_id in course.students)
+    former_student_ids = sorted(_checked_id(student_id) for student_id in course.student_submissions if student_id not in course.students)
+    assignment_ids = sorted(_checked_id(assignment_id) for assignment_id in course.assignments)
+    assignment_names = [course.assignments[assignment_id].encode() for assignment_id in assignment_ids]
+    name = course.name.encode()
+    assignment_indexes = {assignment_id: index for index, assignment_id in enumerate(assignment_ids)}
+    grades = array('B', [MISSING_GRADE]) * ((len(student_ids) + len(former_student_ids)) * len(assignment_ids))
+    for row, student_id in enumerate(student_ids + former_student_ids):
+        for assignment_id, grade in course.student_submissions.get(student_id, {}).items():
+            grades[row * len(assignment_ids) + assignment_indexes[assignment_id]] = int(grade) # whole grades stored as floats before submissions made them ints
+    assignment_totals = [course.assignment_grade_totals.get(assignment_id, (0, 0)) for assignment_id in assignment_ids]
+    student_totals = [course.student_grade_totals.get(student_id, (0, 0)) for student_id in student_ids]
+    name_ends, end = [], 0
+    for assignment_name in assignment_names:
+        end += len(assignment_name)
+        name_ends.append(end)
+    sections = [
+        COURSE_HEADER.pack(len(name), len(student_ids), len(former_student_ids), len(assignment_ids), len(course.student_rankings), sum(count for _, count in assignment_totals)),
+        _padded(name),
+        array('Q', student_ids).tobytes(),
+        array('Q', former_student_ids).tobytes(),
+        array('Q', assignment_ids).tobytes(),
+        array('Q', name_ends).tobytes(),
+        array('Q', [int(grade_sum) for grade_sum, _ in assignment_totals]).tobytes(),
+        array('Q', [count for _, count in assignment_totals]).tobytes(),
+        array('Q', [int(grade_sum) for grade_sum, _ in student_totals]).tobytes(),
+        array('Q', [count for _, count in student_totals]).tobytes(),
+        array('Q', [ranking[-1] for ranking in course.student_rankings]).tobytes(),
+        _padded(b''.join(assignment_names)),
+        _padded(grades.tobytes()),
+    ]
+    return b''.join(sections)
+
+def _checked_id(id) -> int:
+    if not isinstance(id, int) or not 0 <= id < 1 << 64:
+        raise ValueError(f"Id {id!r} does not fit in a binary snapshot, which stores ids as unsigned 64-bit ints")
+    return id
+
+def _grade_histogram(grades) -> List[int]:
+    histogram = [0] * GRADE_BUCKETS
+    for grade, count in Counter(grades).items():
+        if grade != MISSING_GRADE:
+            histogram[grade] = count
+    return histogram
+
+def _padded(data: bytes) -> bytes:
+    return data + bytes(-len(data) % 8)
+
+# View over one course record in the mapped file. Only the header is read up front. Sections are sliced out of the map
+# when used, so a query pays for the sections it reads
+class _CourseRecord:
+    def __init__(self, buffer: memoryview, course_id: int, offset: int) -> None:
+        self.id = course_id
+        self._buffer = buffer
+        name_length, self.student_count, self.former_student_count, self.assignment_count, self.ranked_count, self.submission_count = COURSE_HEADER.unpack_from(buffer, offset)
+        self._name_offset = offset + COURSE_HEADER.size
+        self._name_length = name_length
+        self._numbers_offset = self._name_offset + name_length + -name_length % 8
+
+    @property
+    def name(self) -> str:
+        return bytes(self._buffer[self._name_offset:self._name_offset + self._name_length]).decode()
+
+    # uint64 sections, located by their offset in words from the end of the name
+
+    @property
+    def student_ids(self) -> memoryview:
+        return self._numbers(0, self.student_count)
+
+    @property
+    def former_student_ids(self) -> memoryview:
+        return self._numbers(self.student_count, self.former_student_count)
+
+    @property
+    def assignment_ids(self) -> memoryview:
+        return self._numbers(self._row_count(), self.assignment_count)
+
+    @property
+    def assignment_name_ends(self) -> memoryview:
+        return self._numbers(self._row_count() + self.assignment_count, self.assignment_count)
+
+    @property
+    def assignment_grade_sums(self) -> memoryview:
+        return self._numbers(self._row_count() + 2 * self.assignment_count, self.assignment_count)
+
+    @property
+    def assignment_grade_counts(self) -> memoryview:
+        return self._numbers(self._row_count() + 3 * self.assignment_count, self.assignment_count)
+
+    @property
+    def student_grade_sums(self) -> memoryview:
+        return self._numbers(self._row_count() + 4 * self.assignment_count, self.student_count)
+
+    @property
+    def student_grade_counts(self) -> memoryview:
+        return self._numbers(self._row_count() + self.student_count + 4 * self.assignment_count, self.student_count)
+
+    @property
+    def rankings(self) -> memoryview:
+        return self._numbers(self._row_count() + 2 * self.student_count + 4 * self.assignment_count, self.ranked_count)
+
+    @property
+    def assignment_names(self) -> memoryview:
+        offset = self._numbers_offset + 8 * (self._row_count() + 2 * self.student_count + 4 * self.assignment_count + self.ranked_count)
+        return self._buffer[offset:offset + self._names_length()]
+
+    @property
+    def grades(self) -> memoryview:
+        names_length = self._names_length()
+        offset = self._numbers_offset + 8 * (self._row_count() + 2 * self.student_count + 4 * self.assignment_count + self.ranked_count) + names_length + -names_length % 8
+        return self._buffer[offset:offset + self._row_count() * self.assignment_count]
+
+    def _numbers(self, word_offset: int, length: int) -> memoryview:
+        offset = self._numbers_offset + 8 * word_offset
+        return self._buffer[offset:offset + 8 * length].cast('Q')
+
+    def _row_count(self) -> int:
+        # rows of the grade matrix: the students, then the former students
+        return self.student_count + self.former_student_count
+
+    def _names_length(self) -> int:
+        return self.assignment_name_ends[-1] if self.assignment_count else 0
+
+    def student_index(self, student_id) -> Optional[int]:
+        return self._index_of(self.student_ids, student_id)
+
+    def assignment_index(self, assignment_id) -> Optional[int]:
+        return self._index_of(self.assignment_ids, assignment_id)
+
+    def assignment_name(self, index: int) -> str:
+        start = self.assignment_name_ends[index - 1] if index else 0
+        return bytes(self.assignment_names[start:self.assignment_name_ends[index]]).decode()
+
+    def students_by_average(self, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        # rankings hold only ids, so each probe of the searches finds the student's totals by a search of its own
+        rankings, student_ids, grade_sums, grade_counts = self.rankings, self.student_ids, self.student_grade_sums, self.student_grade_counts
+
+        def negated_average(student_id) -> float:
+            index = bisect_left(student_ids, student_id)
+            return -(grade_sums[index] / grade_counts[index])
+        start, stop = average_range(rankings, lowest, highest, negated_average)
+        return rankings[start:stop].tolist()
+
+    def to_course(self) -> Course:
+        # the course is not marked as persisted, so saving it to a writable repository stores it whole
+        students = set(self.student_ids)
+        assignment_ids = self.assignment_ids.tolist()
+        assignments = {assignment_id: self.assignment_name(index) for index, assignment_id in enumerate(assignment_ids)}
+        submissions = dict()
+        grades = self.grades
+        for row, student_id in enumerate(self.student_ids.tolist() + self.former_student_ids.tolist()):
+            start = row * self.assignment_count
+            for column, grade in enumerate(grades[start:start + self.assignment_count]):
+                if grade != MISSING_GRADE:
+                    submissions[(student_id, assignment_ids[column])] = grade
+        return Course(self.id, self.name, students, assignments, submissions)
+
+    def to_summary(self) -> CourseSummary:
+        return CourseSummary(self.id, self.name, self.student_count, self.assignment_count, self.submission_count)
+
+    @staticmethod
+    def _index_of(sorted_ids: memoryview, id) -> Optional[int]:
+        if not isinstance(id, int) or not 0 <= id < 1 << 64:
+            return None
+        index = bisect_left(sorted_ids, id)
+        return index if index < len(sorted_ids) and sorted_ids[index] == id else None
+
+'''
+Read-only CourseRepository over a binary snapshot file. Opening maps the file without reading it, and the resident memory is
+whatever pages the queries have touched, which the OS can drop again at any time. Writes raise, as archived courses do not change
+'''
+class BinarySnapshotCourseRepository(CourseRepository):
+    def __init__(self, path: str) -> None:
+        if sys.byteorder != 'little':
+            raise Exception("Binary snapshots can only be read on little-endian machines!")
+        with open(path, 'rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._map)
+        magic, version, course_count, index_offset = FILE_HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception(f"{path} is not a version {VERSION} binary course snapshot!")
+        self._course_ids = self._buffer[index_offset:index_offset + 8 * course_count].cast('Q')
+        self._course_offsets = self._buffer[index_offset + 8 * course_count:index_offset + 16 * course_count].cast('Q')
+
+    def close(self) -> None:
+        self._course_ids.release()
+        self._course_offsets.release()
+        self._buffer.release()
+        self._map.close()
+
+    def get_all_courses(self) -> List[Course]:
+        return [self._record_at(index).to_course() for index in range(len(self._course_ids))]
+
+    def get_course(self, course_id: int) -> Course:
+        return self._get_record(course_id).to_course()
+
+    def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        return [record.to_course() for record in self._page(after_course_id, limit)]
+
+    def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        return [record.to_summary() for record in self._page(after_course_id, limit)]
+
+    def save_course(self, course: Course) -> None:
+        raise Exception("Binary snapshots are read-only!")
+
+    def delete_course(self, course_id: int) -> bool:
+        return False
+
+    def next_id(self) -> int:
+        raise Exception("Binary snapshots are read-only!")
+
+    def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        record = self._get_record(course_id)
+        index = record.assignment_index(assignment_id)
+        if index is None:
+            return None
+        return (record.assignment_grade_sums[index], record.assignment_grade_counts[index])
+
+    def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        record = self._get_record(course_id)
+        index = record.student_index(student_id)
+        if index is None:
+            return None
+        return (record.student_grade_sums[index], record.student_grade_counts[index])
+
+    # archives keep no student index. These scan the course index and binary search each roster, which is cheap
+    # for how rarely archives are asked
+
+    def get_courses_for_student(self, student_id) -> List[Course]:
+        return [record.to_course() for record in self._records_for_student(student_id)]
+
+    def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        transcript = []
+        for record in self._records_for_student(student_id):
+            index = record.student_index(student_id)
+            transcript.append(transcript_entry(record.id, record.name, (record.student_grade_sums[index], record.student_grade_counts[index])))
+        return transcript
+
+    # archives store no histograms. These count the grades of the matrix, so they scan the column or the whole course
+
+    def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        record = self._get_record(course_id)
+        index = record.assignment_index(assignment_id)
+        if index is None:
+            return None
+        return _grade_histogram(record.grades[index::record.assignment_count] if record.assignment_count else ())
+
+    def get_grade_histogram(self, course_id: int) -> List[int]:
+        return _grade_histogram(self._get_record(course_id).grades)
+
+    def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        return self._get_record(course_id).rankings[:max(k, 0)].tolist()
+
+    def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        rankings = self._get_record(course_id).rankings
+        return rankings[len(rankings) - min(max(k, 0), len(rankings)):].tolist()[::-1]
+
+    def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        return self._get_record(course_id).students_by_average(lowest, highest)
+
+    def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        records = (self._record_at(index) for index in range(len(self._course_ids)))
+        return [(record.id, student_id) for record in records for student_id in record.students_by_average(lowest, highest)]
+
+    def _get_record(self, course_id: int) -> _CourseRecord:
+        index = _CourseRecord._index_of(self._course_ids, course_id)
+        if index is None:
+            raise Exception(f"Course {course_id} does not exist!")
+        return self._record_at(index)
+
+    def _record_at(self, index: int) -> _CourseRecord:
+        return _CourseRecord(self._buffer, self._course_ids[index], self._course_offsets[index])
+
+    def _records_for_student(self, student_id) -> List[_CourseRecord]:
+        records = (self._record_at(index) for index in range(len(self._course_ids)))
+        return [record for record in records if record.student_index(student_id) is not None]
+
+    def _page(self, after_course_id: Optional[int], limit: int) -> List[_CourseRecord]:
+        start = 0 if after_course_id is None else bisect_right(self._course_ids, after_course_id)
+        return [self._record_at(index) for index in range(start, min(start + limit, len(self._course_ids)))]
@@ -0,0 +1,256 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from functools import partial
+from math import floor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from app.model import AssignmentSubmitted, Course, CourseDeleted, StudentDroppedOut, StudentEnrolled
+import threading
+
+class ChangeEvent(NamedTuple):
+    sequence: int # 1 for the first event of a feed, then one more for each event
+    course_id: Any
+    change: Any # CourseCreated, StudentEnrolled, StudentDroppedOut, AssignmentCreated, AssignmentSubmitted or CourseDeleted
+
+'''
+Ordered stream of the changes saved to a repository, each numbered with a sequence. The changes of one save are published
+together with consecutive sequences, and saves of one course are published in the order they were stored as long as the
+writers of a course are serialised, as the services do. The latest retention events are kept in memory, so a consumer that
+remembers the last sequence it handled can resume from it with read or subscribe; one that fell further behind gets an
+error and has to rebuild from the repository. Sequences start over with a new feed, so resuming after a sequence the feed
+has not reached is an error too.
+
+Views attached to the feed are updated in the publishing thread, before the save that made the changes returns
+'''
+class ChangeFeed:
+    def __init__(self, retention: Optional[int] = 100_000) -> None:
+        if retention is not None and retention < 1:
+            raise ValueError("Retention must be at least one event")
+        self.retention = retention # None keeps every event
+        self._events: List[ChangeEvent] = []
+        self._first_sequence = 1 # sequence of _events[0], or the next sequence while nothing is retained
+        self._last_sequence = 0
+        self._views: List['MaterializedView'] = []
+        self._published = threading.Condition()
+
+    @property
+    def last_sequence(self) -> int:
+        return self._last_sequence
+
+    def publish(self, course_id, changes: Iterable) -> None:
+        with self._published:
+            for change in changes:
+                self._last_sequence += 1
+                event = ChangeEvent(self._last_sequence, course_id, change)
+                self._events.append(event)
+                for view in self._views:
+                    view.apply(event)
+                    view.sequence = event.sequence
+            # trimmed in bulk, so that appends stay amortised O(1)
+            if self.retention is not None and len(self._events) > 2 * self.retention:
+                del self._events[:len(self._events) - self.retention]
+                self._first_sequence = self._events[0].sequence
+            self._published.notify_all()
+
+    def read(self, after_sequence: int, limit: int = 1000, timeout: Optional[float] = 0) -> List[ChangeEvent]:
+        # up to limit events following after_sequence, oldest first. When there are none yet, waits up to timeout seconds for
+        # one to be published, or indefinitely when timeout is None
+        with self._published:
+            self._check_resumable(after_sequence)
+            if timeout != 0:
+                self._published.wait_for(lambda: self._last_sequence > after_sequence, timeout)
+                self._check_resumable(after_sequence) # the events published meanwhile may have trimmed the ones following it
+            start = after_sequence + 1 - self._first_sequence
+            return self._events[start:start + limit]
+
+    def subscribe(self, after_sequence: Optional[int] = None) -> 'Subscription':
+        # a subscription to the events following after_sequence: 0 for every retained event since the feed started, None for
+        # the events published from now on
+        with self._published:
+            if after_sequence is None:
+                return Subscription(self, self._last_sequence)
+            self._check_resumable(after_sequence)
+            return Subscription(self, after_sequence)
+
+    def attach(self, view: 'MaterializedView') -> None:
+        # applies the retained events the view has not seen, then keeps it up to date with every event published after. A new
+        # view starts from the oldest event retained, one that stopped at an event no longer retained can't resume
+        with self._published:
+            for event in self.read(view.sequence or self._first_sequence - 1, limit=len(self._events)):
+                view.apply(event)
+                view.sequence = event.sequence
+            self._views.append(view)
+
+    def detach(self, view: 'MaterializedView') -> None:
+        with self._published:
+            self._views.remove(view)
+
+    def _check_resumable(self, after_sequence: int) -> None:
+        if after_sequence < self._first_sequence - 1:
+            raise Exception(f"Events after sequence {after_sequence} are no longer retained!")
+        if after_sequence > self._last_sequence:
+            raise Exception(f"Sequence {after_sequence} has not been published, the feed is at {self._last_sequence}!")
+
+# Cursor over a change feed. sequence is the last event polled, and what to subscribe after to resume where it left off
+class Subscription:
+    def __init__(self, change_feed: ChangeFeed, after_sequence: int) -> None:
+        self.change_feed = change_feed
+        self.sequence = after_sequence
+
+    def poll(self, limit: int = 1000, timeout: Optional[float] = 0) -> List[ChangeEvent]:
+        events = self.change_feed.read(self.sequence, limit, timeout)
+        if events:
+            self.sequence = events[-1].sequence
+        return events
+
+'''
+Proxy of a CourseRepository that publishes to a change feed the changes of every course it saves, after they are stored,
+and a CourseDeleted event for every course it deletes. Other attributes are passed through. Services built on it, their
+transactions and async services over it all publish, as every write goes through save_course, delete_course or, when the
+repository has it, update_course
+'''
+class ChangeFeedRepository:
+    def __init__(self, course_repository, change_feed: ChangeFeed) -> None:
+        self.course_repository = course_repository
+        self.change_feed = change_feed
+
+    def __getattr__(self, name):
+        attribute = getattr(self.course_repository, name)
+        if name == 'update_course': # only offered when the repository has it, see CourseServiceImpl._update
+            return partial(self._update_course, attribute)
+        return attribute
+
+    def _update_course(self, update_course, course_id, mutator: str, calls) -> Tuple[List, List]:
+        results, changes = update_course(course_id, mutator, calls)
+        if changes:
+            self.change_feed.publish(course_id, changes)
+        return results, changes
+
+    def save_course(self, course: Course) -> None:
+        changes = course.pending_changes # the save replaces the list
+        self.course_repository.save_course(course)
+        if changes:
+            self.change_feed.publish(course.id, changes)
+
+    def delete_course(self, course_id) -> bool:
+        deleted = self.course_repository.delete_course(course_id)
+        if deleted:
+            self.change_feed.publish(course_id, (CourseDeleted(),))
+        return deleted
+
+'''
+Query result kept up to date from a change feed one event at a time, instead of recomputed from every course. sequence is
+the last event applied, set by the feed, so a view attached again resumes where it stopped. apply runs while the feed is
+locked and must not raise; reads see the view as it was between two events
+'''
+class MaterializedView(ABC):
+    def __init__(self) -> None:
+        self.sequence = 0
+
+    @abstractmethod
+    def apply(self, event: ChangeEvent) -> None:
+        pass
+
+'''
+Average grade of every student over their submissions in all courses, floored like the per course averages, and the
+students ranked by it for top-N queries. Grade totals are kept per course and student, so a dropout or a deleted course
+takes back exactly the grades it removed. A course keeps the grades of its dropouts, so a student who enrols again gets
+them back, as in the rankings of the course. Only the events seen by the view count: courses saved before it was attached,
+and no longer retained by the feed, are not in it
+'''
+class StudentGpaView(MaterializedView):
+    def __init__(self) -> None:
+        super().__init__()
+        self.course_grade_totals: Dict[Any, Dict[Any, Tuple[int, int]]] = dict() # { course_id : { student_id : (grade_sum, grade_count) } }
+        self.student_grade_totals: Dict[Any, Tuple[int, int]] = dict() # { student_id : (grade_sum, grade_count) } over all courses
+        self.dropped_grade_totals: Dict[Any, Dict[Any, Tuple[int, int]]] = dict() # { course_id : { student_id : (grade_sum, grade_count) } } of dropouts
+        self.student_rankings = _ChunkedRankings() # keys of Course._ranking_key, best first, ordered as the rankings of a course
+
+    def apply(self, event: ChangeEvent) -> None:
+        change = event.change
+        if isinstance(change, AssignmentSubmitted):
+            self._add(event.course_id, change.student_id, change.grade, 1)
+        elif isinstance(change, StudentDroppedOut):
+            grade_total = self.course_grade_totals.get(event.course_id, {}).get(change.student_id)
+            if grade_total is not None:
+                self._add(event.course_id, change.student_id, -grade_total[0], -grade_total[1])
+                self.dropped_grade_totals.setdefault(event.course_id, dict())[change.student_id] = grade_total
+        elif isinstance(change, StudentEnrolled):
+            dropped_totals = self.dropped_grade_totals.get(event.course_id)
+            grade_total = dropped_totals.pop(change.student_id, None) if dropped_totals is not None else None
+            if grade_total is not None:
+                if not dropped_totals:
+                    del self.dropped_grade_totals[event.course_id]
+                self._add(event.course_id, change.student_id, *grade_total)
+        elif isinstance(change, CourseDeleted):
+            for student_id, (grade_sum, grade_count) in list(self.course_grade_totals.get(event.course_id, {}).items()):
+                self._add(event.course_id, student_id, -grade_sum, -grade_count)
+            self.dropped_grade_totals.pop(event.course_id, None)
+
+    def get_gpa(self, student_id) -> Optional[int]:
+        # None when the student has no submissions
+        grade_total = self.student_grade_totals.get(student_id)
+        return None if grade_total is None else floor(grade_total[0] / grade_total[1])
+
+    def get_top_students(self, n: int) -> List:
+        return [ranking[-1] for ranking in self.student_rankings.first(n)]
+
+    def _add(self, course_id, student_id, grade_sum: int, grade_count: int) -> None:
+        course_totals = self.course_grade_totals.setdefault(course_id, dict())
+        self._add_to_total(course_totals, student_id, grade_sum, grade_count)
+        if not course_totals:
+            del self.course_grade_totals[course_id]
+        previous_total = self.student_grade_totals.get(student_id)
+        if previous_total is not None:
+            self.student_rankings.remove(Course._ranking_key(student_id, previous_total))
+        grade_total = self._add_to_total(self.student_grade_totals, student_id, grade_sum, grade_count)
+        if grade_total is not None:
+            self.student_rankings.add(Course._ranking_key(student_id, grade_total))
+
+    @staticmethod
+    def _add_to_total(grade_totals: Dict, key, grade_sum: int, grade_count: int) -> Optional[Tuple[int, int]]:
+        previous_sum, previous_count = grade_totals.get(key, (0, 0))
+        if previous_count + grade_count == 0:
+            grade_totals.pop(key, None)
+            return None
+        grade_totals[key] = grade_total = (previous_sum + grade_sum, previous_count + grade_count)
+        return grade_total
+
+# Sorted keys held in chunks of at most 2 * CHUNK_SIZE, so an insertion or removal moves one chunk rather than every key of
+# an institution-wide ranking
+class _ChunkedRankings:
+    CHUNK_SIZE = 500
+
+    def __init__(self) -> None:
+        self._chunks: List[list] = []
+        self._maxes: list = [] # last key of each chunk
+
+    def add(self, key) -> None:
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            return
+        index = min(bisect_left(self._maxes, key), len(self._chunks) - 1)
+        chunk = self._chunks[index]
+        insort(chunk, key)
+        self._maxes[index] = chunk[-1]
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            self._chunks[index:index + 1] = [chunk[:self.CHUNK_SIZE], chunk[self.CHUNK_SIZE:]]
+            self._maxes[index:index + 1] = [chunk[self.CHUNK_SIZE - 1], chunk[-1]]
+
+    def remove(self, key) -> None:
+        index = bisect_left(self._maxes, key)
+        chunk = self._chunks[index]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self._maxes[index] = chunk[-1]
+        else:
+            del self._chunks[index]
+            del self._maxes[index]
+
+    def first(self, n: int) -> list:
+        keys = []
+        for chunk in self._chunks:
+            if len(keys) >= n:
+                break
+            keys.extend(chunk[:n - len(keys)])
+        return keys
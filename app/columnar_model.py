@@ -0,0 +1,172 @@
+from app.model import Course, GRADE_BUCKETS, note_grades_scanned
+from app.id_allocator import IdInterner
+from app.read_only_containers import WritableArray
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+
+MISSING_GRADE = 255 # grades are 0 to 100, so a uint8 cell can mark "no submission" with a value no grade takes
+
+'''
+Course with a compact gradebook. Every student who has submitted anything is interned to a dense slot number, and every assignment
+with submissions gets a uint8 column of grades indexed by slot. A grade costs one byte instead of a dict entry in
+each submission index. The averages and rankings are served by the same running aggregates as Course,
+while rebuilding them reduces whole columns at once. submissions, student_submissions and assignment_submissions are read-only views
+over the columns, so code written against Course reads a ColumnarCourse the same way
+'''
+class ColumnarCourse(Course):
+    CONTAINERS = ('students', 'assignments', 'student_slots', 'grade_columns', 'student_grade_totals', 'assignment_grade_totals', 'student_rankings', 'assignment_grade_histograms', 'grade_histogram')
+    ROW_CONTAINERS = ('grade_columns', 'assignment_grade_histograms')
+    _ALL_SHARED = frozenset(CONTAINERS)
+    __slots__ = ('student_slots', 'grade_columns') # the slots of the submission indexes of Course stay unset, properties present the columns in their place
+
+    def __init__(self, id, name, students=None, assignments=None, submissions=None, student_slots=None, grade_columns=None, student_grade_totals=None, assignment_grade_totals=None, student_rankings=None, assignment_grade_histograms=None, grade_histogram=None) -> None:
+        if not name:
+            raise ValueError("Name must be present")
+        self.id = id
+        self.name = name
+        self.students = students if students is not None else set()
+        self.assignments = assignments if assignments is not None else dict() # { assignment_id : assignment_name }
+        self.student_slots = student_slots if student_slots is not None else IdInterner() # student_id <-> slot
+        self.grade_columns = grade_columns if grade_columns is not None else dict() # { assignment_id : array('B') of grades indexed by slot }
+        self._init_bookkeeping()
+        for (student_id, assignment_id), grade in (submissions or {}).items():
+            self._store_grade(student_id, assignment_id, grade)
+        self._init_aggregates(student_grade_totals, assignment_grade_totals, student_rankings, assignment_grade_histograms, grade_histogram)
+
+    @classmethod
+    def from_persisted(cls, id, name, students, assignments, student_slots, grade_columns, student_grade_totals, assignment_grade_totals, student_rankings, assignment_grade_histograms, grade_histogram) -> 'ColumnarCourse':
+        course = cls.__new__(cls)
+        course.id = id
+        course.name = name
+        course.students = students
+        course.assignments = assignments
+        course.student_slots = student_slots
+        course.grade_columns = grade_columns
+        course.student_grade_totals = student_grade_totals
+        course.assignment_grade_totals = assignment_grade_totals
+        course.student_rankings = student_rankings
+        course.assignment_grade_histograms = assignment_grade_histograms
+        course.grade_histogram = grade_histogram
+        course.mark_persisted()
+        return course
+
+    @property
+    def submissions(self):
+        return _SubmissionsView(self)
+
+    @property
+    def student_submissions(self):
+        return _StudentSubmissionsView(self)
+
+    @property
+    def assignment_submissions(self):
+        return _AssignmentSubmissionsView(self)
+
+    def get_grade(self, student_id, assignment_id):
+        slot = self.student_slots.index_of(student_id)
+        column = self.grade_columns.get(assignment_id)
+        if slot is None or column is None or slot >= len(column) or column[slot] == MISSING_GRADE:
+            return None
+        return column[slot]
+
+    def _store_grade(self, student_id, assignment_id, grade) -> None:
+        slot = self.student_slots.index_of(student_id)
+        if slot is None:
+            slot = self._writable('student_slots').intern(student_id)
+        column = self._writable_row('grade_columns', assignment_id)
+        if slot >= len(column): # columns only grow when a slot past their end is written
+            column.extend(array('B', [MISSING_GRADE]) * (slot + 1 - len(column)))
+        column[slot] = int(grade)
+
+    def _writable_row(self, index_name, key):
+        if key not in getattr(self, index_name):
+            self._writable(index_name)[key] = WritableArray('B')
+            self._owned_rows.add((index_name, key))
+        return super()._writable_row(index_name, key)
+
+    def _storage_is_consistent(self) -> bool:
+        return all(self.student_slots.index_of(student_id) == slot for slot, student_id in enumerate(self.student_slots))
+
+    def _build_aggregates(self):
+        assignment_grade_totals = dict()
+        student_grade_sums = [0] * len(self.student_slots)
+        student_grade_counts = [0] * len(self.student_slots)
+        for assignment_id, column in self.grade_columns.items():
+            note_grades_scanned(len(column))
+            missing = column.count(MISSING_GRADE)
+            if missing < len(column):
+                assignment_grade_totals[assignment_id] = (sum(column) - missing * MISSING_GRADE, len(column) - missing)
+            for slot, grade in enumerate(column):
+                if grade != MISSING_GRADE:
+                    student_grade_sums[slot] += grade
+                    student_grade_counts[slot] += 1
+        student_grade_totals = {self.student_slots.external_id(slot): (student_grade_sums[slot], count) for slot, count in enumerate(student_grade_counts) if count}
+        return student_grade_totals, assignment_grade_totals, self._build_rankings(student_grade_totals)
+
+    def _build_histograms(self):
+        assignment_grade_histograms = dict()
+        for assignment_id, column in self.grade_columns.items():
+            note_grades_scanned(len(column))
+            histogram = [0] * GRADE_BUCKETS
+            for grade, count in Counter(column).items():
+                if grade != MISSING_GRADE:
+                    histogram[grade] = count
+            if any(histogram):
+                assignment_grade_histograms[assignment_id] = histogram
+        return assignment_grade_histograms, self._sum_histograms(assignment_grade_histograms.values())
+
+# Read-only mapping views that present the columns in the shapes used by Course
+
+class _SubmissionsView(Mapping):
+    def __init__(self, course: ColumnarCourse) -> None:
+        self.course = course
+
+    def __getitem__(self, key):
+        grade = self.course.get_grade(*key)
+        if grade is None:
+            raise KeyError(key)
+        return grade
+
+    def __iter__(self):
+        for assignment_id, column in self.course.grade_columns.items():
+            for slot, grade in enumerate(column):
+                if grade != MISSING_GRADE:
+                    yield (self.course.student_slots.external_id(slot), assignment_id)
+
+    def __len__(self) -> int:
+        return sum(len(column) - column.count(MISSING_GRADE) for column in self.course.grade_columns.values())
+
+class _StudentSubmissionsView(Mapping):
+    def __init__(self, course: ColumnarCourse) -> None:
+        self.course = course
+
+    def __getitem__(self, student_id):
+        slot = self.course.student_slots.index_of(student_id)
+        row = {} if slot is None else {assignment_id: column[slot] for assignment_id, column in self.course.grade_columns.items() if slot < len(column) and column[slot] != MISSING_GRADE}
+        if not row:
+            raise KeyError(student_id)
+        return row
+
+    def __iter__(self):
+        return (student_id for student_id in self.course.student_slots if student_id in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+class _AssignmentSubmissionsView(Mapping):
+    def __init__(self, course: ColumnarCourse) -> None:
+        self.course = course
+
+    def __getitem__(self, assignment_id):
+        column = self.course.grade_columns.get(assignment_id, [])
+        row = {self.course.student_slots.external_id(slot): grade for slot, grade in enumerate(column) if grade != MISSING_GRADE}
+        if not row:
+            raise KeyError(assignment_id)
+        return row
+
+    def __iter__(self):
+        return (assignment_id for assignment_id in self.course.grade_columns if assignment_id in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List
-from app.model import Course
+from typing import List, Optional, Tuple
+from app.model import Course, CourseSummary, TranscriptEntry
 
 # Repository interface that abstracts the persistence logic from the rest of the app. 
 # This allows for the possibility of replacing the db without affecting the rest of the app
@@ -19,4 +19,68 @@ class CourseRepository(ABC):
 
     @abstractmethod
     def delete_course(self, course_id: int) -> bool:
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        # up to limit courses ordered by id, starting after the given cursor id or at the beginning when it is None
+        pass
+
+    @abstractmethod
+    def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        # same paging as get_course_page, without building courses
+        pass
+
+    @abstractmethod
+    def next_id(self) -> int:
+        # allocates an id for a new course or assignment that is unique within this repository
+        pass
+
+    # Read-side projections that answer from stored data without building a Course
+
+    @abstractmethod
+    def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        # (grade_sum, grade_count) of an assignment. None when the assignment does not exist in the course
+        pass
+
+    @abstractmethod
+    def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        # (grade_sum, grade_count) of a student. None when the student is not enrolled in the course
+        pass
+
+    @abstractmethod
+    def get_courses_for_student(self, student_id) -> List[Course]:
+        # courses the student is enrolled in, ordered by id. Answered from a student index rather than a scan of all courses
+        pass
+
+    @abstractmethod
+    def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        # the student's average in each course they are enrolled in, ordered by course id
+        pass
+
+    @abstractmethod
+    def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        pass
+
+    @abstractmethod
+    def get_grade_histogram(self, course_id: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        # students whose floored average is from lowest to highest inclusive, best first, in time proportional to log n plus
+        # the students returned. None leaves that side open. Students without submissions have no average and are never returned
+        pass
+
+    @abstractmethod
+    def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        # (course_id, student_id) of every course's get_students_by_average, ordered by course id
+        pass
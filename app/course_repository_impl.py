@@ -1,16 +1,24 @@
 from app.course_repository import CourseRepository
-from app.model import Course
-from typing import List, Tuple, Dict, Set
-from copy import deepcopy
+from app.model import GRADE_BUCKETS, EMPTY_HISTOGRAM, Course, CourseSummary, TranscriptEntry, StudentEnrolled, StudentDroppedOut, transcript_entry, top_k_students, bottom_k_students, students_by_average
+from app.columnar_model import ColumnarCourse
+from app.id_allocator import IdAllocator, IdInterner, CounterIdAllocator
+from app.read_only_containers import plain_rows, read_only, read_only_rows
+from typing import List, Tuple, Dict, Set, Optional, Sequence
+from bisect import insort, bisect_left, bisect_right
+import threading
 
 # CourseRepository implementation that is coupled to the in-memory DB. A new implementation would be required if the database implementation changes
 class CourseRepositoryImpl(CourseRepository):
 
-    def __init__(self) -> None:
+    def __init__(self, id_allocator: IdAllocator = None) -> None:
         self.database = Database()
         self.mapper = Mapper()
+        self.id_allocator = id_allocator if id_allocator is not None else CounterIdAllocator()
         super().__init__()
 
+    def next_id(self) -> int:
+        return self.id_allocator.next_id()
+
     def get_all_courses(self) -> List[Course]:
         all_course_documents = self.database.get_all()
         return list(map(lambda course_document: self.mapper.to_course_from_course_document(course_document), all_course_documents))
@@ -18,8 +26,20 @@ class CourseRepositoryImpl(CourseRepository):
     def get_course(self, course_id: int) -> Course:
         return self.mapper.to_course_from_course_document(self.database.get(course_id))
 
+    def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        return [self.mapper.to_course_from_course_document(course_document) for course_document in self.database.get_page(after_course_id, limit)]
+
+    def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        return [self.mapper.to_course_summary_from_course_document(course_document) for course_document in self.database.get_page(after_course_id, limit)]
+
     def save_course(self, course: Course) -> None:
-        self.database.save(self.mapper.to_course_document_from_course(course))
+        if not course.pending_changes: # nothing changed since the course was loaded or last saved
+            return
+        if course.is_new() or not self.database.contains(course.id):
+            self.database.save(self.mapper.to_course_document_from_course(course))
+        else:
+            self.database.update(course.id, self.mapper.to_document_fields_from_course(course), course.pending_changes)
+        course.mark_persisted()
 
     def delete_course(self, course_id: int) -> bool:
         try:
@@ -28,41 +48,261 @@ class CourseRepositoryImpl(CourseRepository):
         except:
             return False
 
+    # Projections read the stored documents directly. They never modify them, so nothing is copied
+
+    def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        course_document = self._get_course_document(course_id)
+        if assignment_id not in course_document.assignments:
+            return None
+        return course_document.assignment_grade_totals.get(assignment_id, (0, 0))
+
+    def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        course_document = self._get_course_document(course_id)
+        if student_id not in course_document.students:
+            return None
+        return course_document.student_grade_totals.get(student_id, (0, 0))
+
+    def get_courses_for_student(self, student_id) -> List[Course]:
+        return [self.mapper.to_course_from_course_document(course_document) for course_document in self._get_course_documents_for_student(student_id)]
+
+    def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        return [self.mapper.to_transcript_entry_from_course_document(course_document, student_id) for course_document in self._get_course_documents_for_student(student_id)]
+
+    def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        course_document = self._get_course_document(course_id)
+        if assignment_id not in course_document.assignments:
+            return None
+        return list(course_document.assignment_grade_histograms.get(assignment_id, EMPTY_HISTOGRAM))
+
+    def get_grade_histogram(self, course_id: int) -> List[int]:
+        return list(self._get_course_document(course_id).grade_histogram)
+
+    def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        return top_k_students(self._get_course_document(course_id).student_rankings, k)
+
+    def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        return bottom_k_students(self._get_course_document(course_id).student_rankings, k)
+
+    def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        return students_by_average(self._get_course_document(course_id).student_rankings, lowest, highest)
+
+    def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        # one range search in the ranking of each course, log n per course plus the students returned
+        course_documents = self.database.get_page(None, len(self.database.course_ids))
+        return [(course_document.id, student_id) for course_document in course_documents for student_id in students_by_average(course_document.student_rankings, lowest, highest)]
+
+    def _get_course_document(self, course_id: int) -> 'CourseDocument':
+        course_document = self.database.get(course_id)
+        if course_document is None:
+            raise Exception(f"Course {course_id} does not exist!")
+        return course_document
+
+    def _get_course_documents_for_student(self, student_id) -> List['CourseDocument']:
+        # a course deleted after its id was read is left out
+        course_documents = map(self.database.get, self.database.get_course_ids_for_student(student_id))
+        return [course_document for course_document in course_documents if course_document is not None]
+
+'''
+Base of the storage documents, which keep their fields in slots. Their containers are read-only, see app.read_only_containers.
+replace makes a new version of a document that shares every field it does not replace. Documents pickle as a tuple of their
+fields in the order of FIELDS, _fields without copying. Pickles of documents from before they had slots hold a dict of fields instead, possibly without
+the grade histograms, which then load as None so that courses loaded from them rebuild theirs. Rankings pickled before their keys
+held the type of the student id are rekeyed as they load
+'''
+class _Document:
+    FIELDS = ()
+    ROW_FIELDS = ()
+    __slots__ = ()
+
+    def replace(self, fields: Dict[str, object]) -> '_Document':
+        document = self.__class__.__new__(self.__class__)
+        document._set_fields(self._fields())
+        for field_name, value in fields.items():
+            setattr(document, field_name, value)
+        return document
+
+    def __getstate__(self) -> Tuple:
+        return tuple(plain_rows(value) if field_name in self.ROW_FIELDS and value is not None else value for field_name, value in zip(self.FIELDS, self._fields()))
+
+    def __setstate__(self, state) -> None:
+        self._set_fields(tuple(map(state.get, self.FIELDS)) if isinstance(state, dict) else state)
+        if self.student_rankings and len(self.student_rankings[0]) == 2:
+            self.student_rankings = sorted((negated_average, type(student_id).__name__, student_id) for negated_average, student_id in self.student_rankings)
+        # rows are pickled as plain containers, and so is everything pickled before containers were read-only
+        for field_name in self.FIELDS[2:]:
+            container = getattr(self, field_name)
+            if container is not None:
+                setattr(self, field_name, read_only_rows(container) if field_name in self.ROW_FIELDS else read_only(container))
+
 # This class is used only for storage purposes in the DB
-class CourseDocument:
-    def __init__(self, id, name, students=None, assignments=None, submissions=None) -> None:
+class CourseDocument(_Document):
+    FIELDS = ('id', 'name', *Course.CONTAINERS)
+    ROW_FIELDS = Course.ROW_CONTAINERS
+    __slots__ = FIELDS
+
+    def __init__(self, id, name, students=None, assignments=None, student_submissions=None, assignment_submissions=None, student_grade_totals=None, assignment_grade_totals=None, student_rankings=None, assignment_grade_histograms=None, grade_histogram=None) -> None:
         self.id = id
         self.name = name
         self.students = students if students is not None else set()
         self.assignments = assignments if assignments is not None else dict()
-        self.submissions = submissions if submissions is not None else dict()
+        self.student_submissions = student_submissions if student_submissions is not None else dict()
+        self.assignment_submissions = assignment_submissions if assignment_submissions is not None else dict()
+        self.student_grade_totals = student_grade_totals if student_grade_totals is not None else dict()
+        self.assignment_grade_totals = assignment_grade_totals if assignment_grade_totals is not None else dict()
+        self.student_rankings = student_rankings if student_rankings is not None else list()
+        self.assignment_grade_histograms = assignment_grade_histograms if assignment_grade_histograms is not None else dict()
+        self.grade_histogram = grade_histogram if grade_histogram is not None else [0] * GRADE_BUCKETS
+
+    def _fields(self) -> Tuple:
+        return (self.id, self.name, self.students, self.assignments, self.student_submissions, self.assignment_submissions,
+                self.student_grade_totals, self.assignment_grade_totals, self.student_rankings, self.assignment_grade_histograms, self.grade_histogram)
+
+    def __setstate__(self, state) -> None:
+        # pickles from before the flat submissions dict was dropped hold it as well, right after assignments. Those from before the
+        # submission indexes hold nothing else, so the indexes are built from it
+        if isinstance(state, dict) and state.get('student_submissions') is None and state.get('submissions') is not None:
+            student_submissions, assignment_submissions = Course._build_submission_indexes(state['submissions'])
+            state = dict(state, student_submissions=student_submissions, assignment_submissions=assignment_submissions)
+        elif isinstance(state, tuple) and len(state) == len(self.FIELDS) + 1:
+            state = state[:4] + state[5:]
+        super().__setstate__(state)
+
+    def _set_fields(self, fields: Tuple) -> None:
+        (self.id, self.name, self.students, self.assignments, self.student_submissions, self.assignment_submissions,
+         self.student_grade_totals, self.assignment_grade_totals, self.student_rankings, self.assignment_grade_histograms, self.grade_histogram) = fields
+
+# Storage document for a ColumnarCourse. It keeps the grade columns instead of the submission dicts
+class ColumnarCourseDocument(_Document):
+    FIELDS = ('id', 'name', *ColumnarCourse.CONTAINERS)
+    ROW_FIELDS = ColumnarCourse.ROW_CONTAINERS
+    __slots__ = FIELDS
+
+    def __init__(self, id, name, students=None, assignments=None, student_slots=None, grade_columns=None, student_grade_totals=None, assignment_grade_totals=None, student_rankings=None, assignment_grade_histograms=None, grade_histogram=None) -> None:
+        self.id = id
+        self.name = name
+        self.students = students if students is not None else set()
+        self.assignments = assignments if assignments is not None else dict()
+        self.student_slots = student_slots if student_slots is not None else IdInterner()
+        self.grade_columns = grade_columns if grade_columns is not None else dict()
+        self.student_grade_totals = student_grade_totals if student_grade_totals is not None else dict()
+        self.assignment_grade_totals = assignment_grade_totals if assignment_grade_totals is not None else dict()
+        self.student_rankings = student_rankings if student_rankings is not None else list()
+        self.assignment_grade_histograms = assignment_grade_histograms if assignment_grade_histograms is not None else dict()
+        self.grade_histogram = grade_histogram if grade_histogram is not None else [0] * GRADE_BUCKETS
+
+    def _fields(self) -> Tuple:
+        return (self.id, self.name, self.students, self.assignments, self.student_slots, self.grade_columns,
+                self.student_grade_totals, self.assignment_grade_totals, self.student_rankings, self.assignment_grade_histograms, self.grade_histogram)
 
-# In-memory document oriented DB. Deep copy is used to ensure that callers do not modify DB directly
+    def _set_fields(self, fields: Tuple) -> None:
+        (self.id, self.name, self.students, self.assignments, self.student_slots, self.grade_columns,
+         self.student_grade_totals, self.assignment_grade_totals, self.student_rankings, self.assignment_grade_histograms, self.grade_histogram) = fields
+
+# In-memory document oriented DB. Stored documents are never modified in place, so they are handed out without copying.
+# Callers can't modify the DB directly because the containers of the documents are read-only, and courses built from them
+# copy a container before they first write to it
 class Database():
     def __init__(self) -> None:
         self.courses = dict()
+        self.course_ids = list() # sorted ids of the stored courses, used as cursors for paging
+        self._course_ids_lock = threading.Lock()
+        self.student_courses = dict() # { student_id : set of the ids of the courses they are enrolled in }
+        self._student_courses_lock = threading.Lock()
 
     def save(self, course_document: CourseDocument) -> None:
-        self.courses.update(deepcopy({course_document.id: course_document}))
+        with self._course_ids_lock:
+            previous_document = self.courses.get(course_document.id)
+            if previous_document is None:
+                insort(self.course_ids, course_document.id)
+            self.courses[course_document.id] = course_document
+        previous_students = previous_document.students if previous_document is not None else set()
+        self._index_students(course_document.id, course_document.students - previous_students, previous_students - course_document.students)
+
+    def update(self, id: int, fields: Dict[str, object], changes: Sequence = ()) -> None:
+        # stores a new version of the document that only replaces the given fields and shares everything else with the old one.
+        # changes are the model changes that produced the fields, for storage that records them instead of whole containers
+        previous_document = self.courses[id]
+        course_document = previous_document.replace(fields)
+        self.courses[id] = course_document
+        if changes: # the enrolments and dropouts among the changes update the student index without comparing whole rosters
+            for change in changes:
+                if isinstance(change, StudentEnrolled):
+                    self._index_students(id, [change.student_id], [])
+                elif isinstance(change, StudentDroppedOut):
+                    self._index_students(id, [], [change.student_id])
+        elif 'students' in fields:
+            self._index_students(id, course_document.students - previous_document.students, previous_document.students - course_document.students)
+
+    def contains(self, id: int) -> bool:
+        return id in self.courses
 
     def delete(self, id: int) -> None:
-        del self.courses[id]
+        with self._course_ids_lock:
+            course_document = self.courses.pop(id)
+            del self.course_ids[bisect_left(self.course_ids, id)]
+        self._index_students(id, [], course_document.students)
 
     def get(self, id: int) -> CourseDocument:
-        return deepcopy(self.courses.get(id))
+        return self.courses.get(id)
     
     def get_all(self) -> List[CourseDocument]:
-        return deepcopy(list(self.courses.values()))
+        return list(self.courses.values())
+
+    def get_page(self, after_id: Optional[int], limit: int) -> List[CourseDocument]:
+        start = 0 if after_id is None else bisect_right(self.course_ids, after_id)
+        return [self.courses[id] for id in self.course_ids[start:start + limit] if id in self.courses]
+
+    def get_course_ids_for_student(self, student_id) -> List[int]:
+        with self._student_courses_lock:
+            return sorted(self.student_courses.get(student_id, ()))
+
+    def _index_students(self, course_id: int, enrolled_student_ids, dropped_student_ids) -> None:
+        with self._student_courses_lock:
+            for student_id in enrolled_student_ids:
+                self.student_courses.setdefault(student_id, set()).add(course_id)
+            for student_id in dropped_student_ids:
+                course_ids = self.student_courses.get(student_id)
+                if course_ids is not None:
+                    course_ids.discard(course_id)
+                    if not course_ids:
+                        del self.student_courses[student_id]
 
 # Mapper that converts the in-memory DB documents to the models used by the application  
 class Mapper():
     def __init__(self) -> None:
         pass
 
+    # Both conversions share containers between the course and the document rather than copying them, once the course
+    # has made them read-only. From then on the course copies a container before mutating it
+
     def to_course_document_from_course(self, course: Course) -> CourseDocument:
-        return CourseDocument(course.id, course.name, course.students, course.assignments, course.submissions)
+        course.freeze_containers()
+        if isinstance(course, ColumnarCourse):
+            return ColumnarCourseDocument(course.id, course.name, course.students, course.assignments, course.student_slots, course.grade_columns, course.student_grade_totals, course.assignment_grade_totals, course.student_rankings, course.assignment_grade_histograms, course.grade_histogram)
+        return CourseDocument(course.id, course.name, course.students, course.assignments, course.student_submissions, course.assignment_submissions, course.student_grade_totals, course.assignment_grade_totals, course.student_rankings, course.assignment_grade_histograms, course.grade_histogram)
     
     def to_course_from_course_document(self, course_document: CourseDocument) -> Course:
-        return Course(course_document.id, course_document.name, course_document.students, course_document.assignments, course_document.submissions)
+        course_type = ColumnarCourse if isinstance(course_document, ColumnarCourseDocument) else Course
+        if course_document.grade_histogram is not None:
+            return course_type.from_persisted(*course_document._fields())
+        # stored before grade histograms existed. The constructors rebuild them
+        if course_type is ColumnarCourse:
+            course = ColumnarCourse(course_document.id, course_document.name, course_document.students, course_document.assignments, None, course_document.student_slots, course_document.grade_columns, course_document.student_grade_totals, course_document.assignment_grade_totals, course_document.student_rankings)
+        else:
+            course = Course(course_document.id, course_document.name, course_document.students, course_document.assignments, None, course_document.student_submissions, course_document.assignment_submissions, course_document.student_grade_totals, course_document.assignment_grade_totals, course_document.student_rankings)
+        course.mark_persisted()
+        return course
+
+    def to_course_summary_from_course_document(self, course_document: CourseDocument) -> CourseSummary:
+        submission_count = sum(grade_count for _, grade_count in course_document.assignment_grade_totals.values())
+        return CourseSummary(course_document.id, course_document.name, len(course_document.students), len(course_document.assignments), submission_count)
+
+    def to_transcript_entry_from_course_document(self, course_document: CourseDocument, student_id) -> TranscriptEntry:
+        return transcript_entry(course_document.id, course_document.name, course_document.student_grade_totals.get(student_id, (0, 0)))
+
+    def to_document_fields_from_course(self, course: Course) -> Dict[str, object]:
+        container_names = course.changed_containers()
+        course.freeze_containers()
+        return {container_name: getattr(course, container_name) for container_name in container_names}
 
     
\ No newline at end of file
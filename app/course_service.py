@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Any, ContextManager, Iterable, Iterator, Tuple
 
 
 class CourseService(ABC):
@@ -10,6 +10,28 @@ class CourseService(ABC):
         """
         pass
 
+    @abstractmethod
+    def iter_courses(self, page_size: int = 100) -> Iterator[Any]:
+        """
+        Lazily yields all courses ordered by id, loading them one page at a time.
+        """
+        pass
+
+    @abstractmethod
+    def get_course_summaries(self, after_course_id=None, limit: int = 100) -> List[Any]:
+        """
+        Returns up to limit course summaries (id, name and counts) ordered by id, starting after the given course id.
+        Pass the id of the last summary of a page to get the next page.
+        """
+        pass
+
+    @abstractmethod
+    def iter_course_summaries(self, page_size: int = 100) -> Iterator[Any]:
+        """
+        Lazily yields the summaries of all courses ordered by id, loading them one page at a time.
+        """
+        pass
+
     @abstractmethod
     def get_course_by_id(self, course_id) -> Any:
         """
@@ -65,6 +87,40 @@ class CourseService(ABC):
         """
         pass
 
+    @abstractmethod
+    def create_assignments(self, course_id, assignment_names: Iterable[str]) -> List[int]:
+        """
+        Creates several assignments for a course in a single load and save of the course.
+        Returns the ids of the new assignments in the order of the names.
+        """
+        pass
+
+    @abstractmethod
+    def enroll_students(self, course_id, student_ids: Iterable) -> List[bool]:
+        """
+        Enrolls several students in a course in a single load and save of the course.
+        Returns whether each student was enrolled successfully, in the order of the ids.
+        """
+        pass
+
+    @abstractmethod
+    def submit_assignments(self, course_id, submissions: Iterable[Tuple[Any, Any, int]]) -> List[bool]:
+        """
+        Submits several (student_id, assignment_id, grade) assignments in a single load and save of the course.
+        Returns whether each assignment was submitted successfully, in the order of the submissions.
+        """
+        pass
+
+    @abstractmethod
+    def transaction(self, *course_ids) -> ContextManager['CourseService']:
+        """
+        Opens a unit of work over the given courses, used as `with service.transaction(course_id) as transaction:`.
+        Operations on the yielded service see each other's changes, and they are saved together when the block exits.
+        If the block raises, none of them are saved. Courses created in the block are part of the transaction too.
+        Inside the block, write through the yielded service only, listing every course to change; this service raises for writes.
+        """
+        pass
+
     @abstractmethod
     def get_assignment_grade_avg(self, course_id, assignment_id) -> int:
         """
@@ -79,9 +135,124 @@ class CourseService(ABC):
         """
         pass
 
+    @abstractmethod
+    def get_assignment_grade_distribution(self, course_id, assignment_id) -> List[int]:
+        """
+        Returns the number of submissions of an assignment with each grade, as a list of 101 counts indexed by grade.
+        """
+        pass
+
+    @abstractmethod
+    def get_assignment_median(self, course_id, assignment_id) -> int:
+        """
+        Returns the median grade of an assignment. With an even number of submissions it is the lower of the two middle grades.
+        """
+        pass
+
+    @abstractmethod
+    def get_assignment_grade_percentile(self, course_id, assignment_id, percentile: float) -> int:
+        """
+        Returns the lowest grade of an assignment that at least percentile % (0 to 100) of its submissions are at or below.
+        """
+        pass
+
+    @abstractmethod
+    def get_course_grade_distribution(self, course_id) -> List[int]:
+        """
+        Returns the number of submissions with each grade over all assignments of a course, as a list of 101 counts indexed by grade.
+        """
+        pass
+
+    @abstractmethod
+    def get_course_median(self, course_id) -> int:
+        """
+        Returns the median grade over all submissions of a course, the lower of the two middle grades for an even number of them.
+        """
+        pass
+
+    @abstractmethod
+    def get_course_grade_percentile(self, course_id, percentile: float) -> int:
+        """
+        Returns the lowest grade that at least percentile % (0 to 100) of the submissions of a course are at or below.
+        """
+        pass
+
+    @abstractmethod
+    def get_courses_for_student(self, student_id) -> List[Any]:
+        """
+        Returns the courses a student is enrolled in, ordered by id.
+        """
+        pass
+
+    @abstractmethod
+    def get_student_transcript(self, student_id) -> List[Any]:
+        """
+        Returns the student's average grade in each course they are enrolled in, ordered by course id.
+        The average is None for courses where they have not submitted any assignment yet.
+        """
+        pass
+
     @abstractmethod
     def get_top_five_students(self, course_id) -> List[int]:
         """
         Returns the IDs of the top 5 students in a course based on their average grades of all assignments.
         """
         pass
+
+    @abstractmethod
+    def get_top_k_students(self, course_id, k: int) -> List[int]:
+        """
+        Returns the IDs of the top k students in a course based on their average grades of all assignments.
+        Students with equal averages are ordered by their IDs.
+        """
+        pass
+
+    @abstractmethod
+    def get_bottom_k_students(self, course_id, k: int) -> List[int]:
+        """
+        Returns the IDs of the bottom k students in a course based on their average grades of all assignments, lowest first.
+        """
+        pass
+
+    @abstractmethod
+    def get_students_below_average(self, course_id, threshold: float) -> List[int]:
+        """
+        Returns the IDs of the students in a course whose average grade, floored as get_student_grade_avg reports it, is below
+        the threshold, best first. Students who have not submitted anything have no average and are left out.
+        """
+        pass
+
+    @abstractmethod
+    def get_students_above_average(self, course_id, threshold: float) -> List[int]:
+        """
+        Returns the IDs of the students in a course whose floored average grade is above the threshold, best first.
+        """
+        pass
+
+    @abstractmethod
+    def get_students_between_averages(self, course_id, lowest: float, highest: float) -> List[int]:
+        """
+        Returns the IDs of the students in a course whose floored average grade is from lowest to highest inclusive, best first.
+        """
+        pass
+
+    @abstractmethod
+    def get_students_below_average_in_all_courses(self, threshold: float) -> List[Tuple[Any, Any]]:
+        """
+        Returns (course_id, student_id) for every course and student of get_students_below_average, ordered by course id.
+        """
+        pass
+
+    @abstractmethod
+    def get_students_above_average_in_all_courses(self, threshold: float) -> List[Tuple[Any, Any]]:
+        """
+        Returns (course_id, student_id) for every course and student of get_students_above_average, ordered by course id.
+        """
+        pass
+
+    @abstractmethod
+    def get_students_between_averages_in_all_courses(self, lowest: float, highest: float) -> List[Tuple[Any, Any]]:
+        """
+        Returns (course_id, student_id) for every course and student of get_students_between_averages, ordered by course id.
+        """
+        pass
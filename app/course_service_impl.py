@@ -1,63 +1,283 @@
 from app.course_service import CourseService
-from app.model import Course
-from typing import List
+from app.model import Course, CourseSummary, TranscriptEntry, StudentEnrolled, StudentDroppedOut, AssignmentCreated, AssignmentSubmitted, assignment_grade_average, student_grade_average, assignment_grade_distribution, assignment_grade_percentile, course_grade_percentile, below_threshold, above_threshold
+from typing import List, Iterable, Iterator, Optional, Tuple, Type
 from app.course_repository import CourseRepository
-from uuid import uuid4
+from app.analytics_cache import AnalyticsCache
+from app.unit_of_work import UnitOfWork
+from contextlib import ExitStack, contextmanager
+import threading
 
 # Orechestration layer that controls the workflow
 class CourseServiceImpl(CourseService):
     
-    def __init__(self, course_repository: CourseRepository) -> None:
+    def __init__(self, course_repository: CourseRepository, lock_stripes: int = 64, course_type: Type[Course] = Course, analytics_cache: Optional[AnalyticsCache] = None) -> None:
         self.course_repository = course_repository
+        self.course_type = course_type # storage engine of new courses, e.g. ColumnarCourse for compact gradebooks
+        # Caches grade averages and rankings until a write through this service changes them. Only pass one when every write to
+        # the repository goes through this service, or give the cache a ttl that bounds how stale other writers can make it
+        self.analytics_cache = analytics_cache
+        # Writes are read-modify-write cycles on a course, so they hold that course's lock. Locks are striped by course id
+        # so that writes to different courses mostly run in parallel without keeping a lock per course
+        self._course_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._open_transaction = threading.local() # .course_ids of the transaction the current thread is in, if any
         super().__init__()
 
+    def _lock_for(self, course_id: int):
+        # the lock of the stripe of a course. A thread in a transaction holds the stripes of its courses, and taking another one
+        # while holding them could deadlock with a transaction holding that one, so its writes all go through the transaction
+        if getattr(self._open_transaction, 'course_ids', None) is not None:
+            raise Exception(f"A transaction is open in this thread, change course {course_id} through the service it yields!")
+        return self._course_locks[self._stripe_for(course_id)]
+
+    def _stripe_for(self, course_id: int) -> int:
+        return hash(course_id) % len(self._course_locks)
+
     def get_courses(self) -> List[Course]:
         return self.course_repository.get_all_courses()
     
+    def iter_courses(self, page_size: int = 100) -> Iterator[Course]:
+        return self._iter_pages(self.course_repository.get_course_page, page_size)
+
+    def get_course_summaries(self, after_course_id: Optional[int] = None, limit: int = 100) -> List[CourseSummary]:
+        return self.course_repository.get_course_summary_page(after_course_id, limit)
+
+    def iter_course_summaries(self, page_size: int = 100) -> Iterator[CourseSummary]:
+        return self._iter_pages(self.course_repository.get_course_summary_page, page_size)
+
+    @staticmethod
+    def _iter_pages(get_page, page_size: int):
+        # each page starts after the id of the last item of the previous one, so courses added or deleted meanwhile don't shift it
+        page = get_page(None, page_size)
+        while page:
+            yield from page
+            if len(page) < page_size:
+                return
+            page = get_page(page[-1].id, page_size)
+
     def get_course_by_id(self, course_id: int) -> Course:
         return self.course_repository.get_course(course_id)
     
     def create_course(self, course_name: str) -> int:
-        new_course_id = uuid4().int
-        course = Course(id=new_course_id, name=course_name)
+        new_course_id = self.course_repository.next_id()
+        course = self.course_type(id=new_course_id, name=course_name)
         self.course_repository.save_course(course)
         return new_course_id
     
     def delete_course(self, course_id: int) -> bool:
-        return self.course_repository.delete_course(course_id)
+        with self._lock_for(course_id):
+            deleted = self.course_repository.delete_course(course_id)
+            if self.analytics_cache is not None:
+                self.analytics_cache.invalidate(course_id)
+            return deleted
     
     def create_assignment(self, course_id: int, assignment_name: str) -> int:
-        course = self.course_repository.get_course(course_id)
-        new_assignment_id = course.create_assignment(assignment_name)
-        self.course_repository.save_course(course)
-        return new_assignment_id
+        with self._lock_for(course_id):
+            return self._update(course_id, 'create_assignment', [(assignment_name, self.course_repository.next_id())])[0]
     
     def enroll_student(self, course_id: int, student_id: int) -> bool:
-        course = self.course_repository.get_course(course_id)
-        enroll_succeeded = course.enroll_student(student_id)
-        self.course_repository.save_course(course)
-        return enroll_succeeded
+        with self._lock_for(course_id):
+            return self._update(course_id, 'enroll_student', [(student_id,)])[0]
 
     def dropout_student(self, course_id: int, student_id: int) -> bool:
-        course = self.course_repository.get_course(course_id)
-        dropout_succeeded = course.dropout_student(student_id)
-        self.course_repository.save_course(course)
-        return dropout_succeeded
+        with self._lock_for(course_id):
+            return self._update(course_id, 'dropout_student', [(student_id,)])[0]
 
     def submit_assignment(self, course_id: int, student_id: int, assignment_id: int, grade: int) -> bool:
+        with self._lock_for(course_id):
+            return self._update(course_id, 'submit_assignment', [(student_id, assignment_id, grade)])[0]
+
+    # Batch operations apply every item to one loaded course and save it once. If an item raises, nothing is saved
+
+    def create_assignments(self, course_id: int, assignment_names: Iterable[str]) -> List[int]:
+        with self._lock_for(course_id):
+            return self._update(course_id, 'create_assignment', [(assignment_name, self.course_repository.next_id()) for assignment_name in assignment_names])
+
+    def enroll_students(self, course_id: int, student_ids: Iterable[int]) -> List[bool]:
+        with self._lock_for(course_id):
+            return self._update(course_id, 'enroll_student', [(student_id,) for student_id in student_ids])
+
+    def submit_assignments(self, course_id: int, submissions: Iterable[Tuple[int, int, int]]) -> List[bool]:
+        with self._lock_for(course_id):
+            return self._update(course_id, 'submit_assignment', list(submissions))
+
+    def _update(self, course_id: int, mutator: str, calls: List[Tuple]) -> List:
+        # one write: calls a mutator of the course once per args tuple of calls, then saves it unless a call raised, and returns the
+        # results. A repository that holds its courses out of process, like ShardedCourseRepository, offers update_course to run
+        # all of it where the course is, in one request
+        update_course = getattr(self.course_repository, 'update_course', None)
+        if update_course is not None:
+            results, changes = update_course(course_id, mutator, calls)
+            self._invalidate(course_id, changes)
+            return results
         course = self.course_repository.get_course(course_id)
-        submit_succeeded = course.submit_assignment(student_id, assignment_id, grade)
+        results = [getattr(course, mutator)(*args) for args in calls]
+        self._save(course)
+        return results
+
+    @contextmanager
+    def transaction(self, *course_ids) -> Iterator[CourseService]:
+        # the yielded service works on a UnitOfWork while this one holds the locks of the courses, taken in stripe order so that two
+        # transactions never wait on each other. Inside the block this service refuses writes, see _lock_for, and transactions
+        # don't nest, as taking more stripes while holding some could deadlock with another transaction
+        if getattr(self._open_transaction, 'course_ids', None) is not None:
+            raise Exception("A transaction is already open in this thread, add the courses to it instead!")
+        stripes = sorted({self._stripe_for(course_id) for course_id in course_ids})
+        with ExitStack() as held_locks:
+            for stripe in stripes:
+                held_locks.enter_context(self._course_locks[stripe])
+            self._open_transaction.course_ids = frozenset(course_ids)
+            try:
+                unit_of_work = UnitOfWork(self.course_repository, course_ids)
+                yield CourseServiceImpl(unit_of_work, course_type=self.course_type)
+                self._commit(unit_of_work)
+            finally:
+                self._open_transaction.course_ids = None
+
+    def _commit(self, unit_of_work: UnitOfWork) -> None:
+        # one save per changed course, with the changes of every operation on it. If a delete or save fails, the courses written
+        # before it are put back as they were, see _roll_back, and the error is raised
+        database = getattr(self.course_repository, 'database', None)
+        documents = None # { course_id : stored document before the commit, or None for a course created in the transaction }
+        if database is not None:
+            documents = {course_id: database.get(course_id) for course_id in [*unit_of_work.deleted_course_ids, *unit_of_work.courses]}
+        written_course_ids = []
+        try:
+            for course_id in unit_of_work.deleted_course_ids:
+                self.course_repository.delete_course(course_id)
+                written_course_ids.append(course_id)
+                if self.analytics_cache is not None:
+                    self.analytics_cache.invalidate(course_id)
+            for course in unit_of_work.courses.values():
+                if course.pending_changes:
+                    written_course_ids.append(course.id) # before the save, which may have stored the course before failing
+                self._save(course)
+        except Exception as error:
+            if written_course_ids:
+                self._roll_back(database, documents, written_course_ids, error)
+            raise
+
+    def _roll_back(self, database, documents, course_ids: List, error: Exception) -> None:
+        # stores the documents the courses had before a failed commit again. Repositories without a database can't restore them,
+        # and then the error names the courses the commit wrote. A change feed keeps the events of the writes rolled back
+        try:
+            if documents is None:
+                raise Exception(f"{type(self.course_repository).__name__} has no stored documents to restore")
+            for course_id in course_ids:
+                if documents[course_id] is not None:
+                    database.save(documents[course_id])
+                elif database.contains(course_id):
+                    database.delete(course_id)
+                if self.analytics_cache is not None:
+                    self.analytics_cache.invalidate(course_id)
+        except Exception:
+            raise Exception(f"The transaction failed after writing courses {course_ids}, which could not be rolled back!") from error
+
+    def _save(self, course: Course) -> None:
+        # saves a loaded course, then drops the cached results that its changes may have made stale
+        if self.analytics_cache is None:
+            self.course_repository.save_course(course)
+            return
+        changes = course.pending_changes
         self.course_repository.save_course(course)
-        return submit_succeeded
+        self._invalidate(course.id, changes)
+
+    def _invalidate(self, course_id: int, changes) -> None:
+        if self.analytics_cache is None:
+            return
+        for change in changes:
+            if isinstance(change, AssignmentSubmitted):
+                self.analytics_cache.invalidate(course_id, 'assignment_grade_avg', (change.assignment_id,))
+                self.analytics_cache.invalidate(course_id, 'assignment_grade_distribution', (change.assignment_id,))
+                self.analytics_cache.invalidate(course_id, 'course_grade_distribution')
+                self.analytics_cache.invalidate(course_id, 'student_grade_avg', (change.student_id,))
+                self.analytics_cache.invalidate(course_id, 'top_k_students')
+                self.analytics_cache.invalidate(course_id, 'bottom_k_students')
+                self.analytics_cache.invalidate(course_id, 'students_by_average')
+            elif isinstance(change, (StudentEnrolled, StudentDroppedOut)): # a student's grades stay in the course, but only rank while they are enrolled
+                self.analytics_cache.invalidate(course_id, 'student_grade_avg', (change.student_id,))
+                self.analytics_cache.invalidate(course_id, 'top_k_students')
+                self.analytics_cache.invalidate(course_id, 'bottom_k_students')
+                self.analytics_cache.invalidate(course_id, 'students_by_average')
+            elif isinstance(change, AssignmentCreated):
+                self.analytics_cache.invalidate(course_id, 'assignment_grade_avg', (change.assignment_id,))
+                self.analytics_cache.invalidate(course_id, 'assignment_grade_distribution', (change.assignment_id,))
+
+    # Read methods are answered by repository projections instead of loading the whole course, and by the analytics cache when there is one
 
     def get_assignment_grade_avg(self, course_id: int, assignment_id: int) -> int:
-        course = self.course_repository.get_course(course_id)
-        return course.get_assignment_grade_average(assignment_id)
+        return self._cached(course_id, 'assignment_grade_avg', (assignment_id,), lambda: assignment_grade_average(
+            course_id, assignment_id, self.course_repository.get_assignment_grade_total(course_id, assignment_id)))
 
     def get_student_grade_avg(self, course_id: int, student_id: int) -> int:
-        course = self.course_repository.get_course(course_id)  
-        return course.get_student_grade_average(student_id)
+        return self._cached(course_id, 'student_grade_avg', (student_id,), lambda: student_grade_average(
+            course_id, student_id, self.course_repository.get_student_grade_total(course_id, student_id)))
+
+    # Distributions, medians and percentiles read the 101-bucket grade histograms, so they cost the same for any class size
+
+    def get_assignment_grade_distribution(self, course_id: int, assignment_id: int) -> List[int]:
+        return list(self._assignment_grade_histogram(course_id, assignment_id))
+
+    def get_assignment_median(self, course_id: int, assignment_id: int) -> int:
+        return self.get_assignment_grade_percentile(course_id, assignment_id, 50)
+
+    def get_assignment_grade_percentile(self, course_id: int, assignment_id: int, percentile: float) -> int:
+        return assignment_grade_percentile(course_id, assignment_id, self._assignment_grade_histogram(course_id, assignment_id), percentile)
+
+    def get_course_grade_distribution(self, course_id: int) -> List[int]:
+        return list(self._course_grade_histogram(course_id))
+
+    def get_course_median(self, course_id: int) -> int:
+        return self.get_course_grade_percentile(course_id, 50)
+
+    def get_course_grade_percentile(self, course_id: int, percentile: float) -> int:
+        return course_grade_percentile(course_id, self._course_grade_histogram(course_id), percentile)
+
+    def _assignment_grade_histogram(self, course_id: int, assignment_id: int) -> List[int]:
+        return self._cached(course_id, 'assignment_grade_distribution', (assignment_id,), lambda: assignment_grade_distribution(
+            course_id, assignment_id, self.course_repository.get_assignment_grade_histogram(course_id, assignment_id)))
+
+    def _course_grade_histogram(self, course_id: int) -> List[int]:
+        return self._cached(course_id, 'course_grade_distribution', (), lambda: self.course_repository.get_grade_histogram(course_id))
+
+    def get_courses_for_student(self, student_id: int) -> List[Course]:
+        return self.course_repository.get_courses_for_student(student_id)
+
+    def get_student_transcript(self, student_id: int) -> List[TranscriptEntry]:
+        return self.course_repository.get_student_transcript(student_id)
 
     def get_top_five_students(self, course_id: int) -> List[int]:
-        course = self.course_repository.get_course(course_id)
-        return course.get_top_five_students()
\ No newline at end of file
+        return self.get_top_k_students(course_id, 5)
+
+    def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        return list(self._cached(course_id, 'top_k_students', (k,), lambda: self.course_repository.get_top_k_students(course_id, k)))
+
+    def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        return list(self._cached(course_id, 'bottom_k_students', (k,), lambda: self.course_repository.get_bottom_k_students(course_id, k)))
+
+    # Threshold queries slice the ranking of a course, which is kept sorted by average, so they cost log n plus the students returned
+
+    def get_students_below_average(self, course_id: int, threshold: float) -> List[int]:
+        return self._students_by_average(course_id, *below_threshold(threshold))
+
+    def get_students_above_average(self, course_id: int, threshold: float) -> List[int]:
+        return self._students_by_average(course_id, *above_threshold(threshold))
+
+    def get_students_between_averages(self, course_id: int, lowest: float, highest: float) -> List[int]:
+        return self._students_by_average(course_id, lowest, highest)
+
+    def get_students_below_average_in_all_courses(self, threshold: float) -> List[Tuple[int, int]]:
+        return self.course_repository.get_students_by_average_in_all_courses(*below_threshold(threshold))
+
+    def get_students_above_average_in_all_courses(self, threshold: float) -> List[Tuple[int, int]]:
+        return self.course_repository.get_students_by_average_in_all_courses(*above_threshold(threshold))
+
+    def get_students_between_averages_in_all_courses(self, lowest: float, highest: float) -> List[Tuple[int, int]]:
+        return self.course_repository.get_students_by_average_in_all_courses(lowest, highest)
+
+    def _students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        return list(self._cached(course_id, 'students_by_average', (lowest, highest), lambda: self.course_repository.get_students_by_average(course_id, lowest, highest)))
+
+    def _cached(self, course_id: int, query: str, args: Tuple, compute):
+        if self.analytics_cache is None:
+            return compute()
+        return self.analytics_cache.get_or_compute(course_id, query, args, compute)
@@ -0,0 +1,125 @@
+from app.course_repository_impl import CourseRepositoryImpl, Database, Mapper, CourseDocument
+from app.model import AssignmentCreated
+from app.id_allocator import IdAllocator
+from app.write_ahead_log import WriteAheadLog
+from typing import Dict, Sequence
+import threading
+
+SAVE = 'save'
+UPDATE = 'update'
+DELETE = 'delete'
+
+'''
+Database that survives restarts by writing every change ahead to a log on the local filesystem before applying it in memory.
+A new document is logged whole, an update as the model changes that produced it rather than the containers it replaces,
+and a delete as the id. After snapshot_interval records a snapshot of all documents is written and the log starts over,
+which bounds both the log size and the replay time. Opening the directory again loads the snapshot and replays the log tail
+'''
+class DurableDatabase(Database):
+    def __init__(self, directory: str, mapper: Mapper = None, snapshot_interval: int = 100_000, group_commit_size: int = 64, group_commit_interval: float = 0.01) -> None:
+        super().__init__()
+        self.mapper = mapper if mapper is not None else Mapper()
+        self.snapshot_interval = snapshot_interval
+        self.log = WriteAheadLog(directory, group_commit_size, group_commit_interval)
+        self.highest_id = 0 # largest course or assignment id ever stored, so that id allocators can resume after it
+        self._write_lock = threading.Lock() # keeps the log in the order changes are applied, and snapshots in step with the log
+        self._snapshot_lock = threading.Lock()
+        self._recover()
+
+    def save(self, course_document: CourseDocument) -> None:
+        with self._write_lock:
+            self.log.append((SAVE, course_document))
+            self._observe_ids([course_document.id, *course_document.assignments])
+            super().save(course_document)
+        self._snapshot_if_due()
+
+    def update(self, id: int, fields: Dict[str, object], changes: Sequence = ()) -> None:
+        with self._write_lock:
+            if id not in self.courses: # checked before logging, as a logged update of a missing course would fail every recovery
+                raise KeyError(id)
+            self.log.append((UPDATE, id, tuple(changes)))
+            self._observe_ids([change.assignment_id for change in changes if isinstance(change, AssignmentCreated)])
+            super().update(id, fields, changes)
+        self._snapshot_if_due()
+
+    def delete(self, id: int) -> None:
+        with self._write_lock:
+            if id not in self.courses:
+                raise KeyError(id)
+            self.log.append((DELETE, id))
+            super().delete(id)
+        self._snapshot_if_due()
+
+    def snapshot(self) -> None:
+        with self._snapshot_lock:
+            self._write_snapshot()
+
+    def sync(self) -> None:
+        self.log.sync()
+
+    def close(self) -> None:
+        self.log.close()
+
+    def _snapshot_if_due(self) -> None:
+        # the writer that crosses the interval takes the snapshot. Others keep writing rather than queue up behind it
+        if self.log.records_since_snapshot >= self.snapshot_interval and self._snapshot_lock.acquire(blocking=False):
+            try:
+                self._write_snapshot()
+            finally:
+                self._snapshot_lock.release()
+
+    def _write_snapshot(self) -> None:
+        # documents are never modified in place, so the snapshot only holds references while writers carry on
+        with self._write_lock:
+            generation = self.log.rotate()
+            state = (self.highest_id, list(self.courses.values()))
+        self.log.write_snapshot(generation, state)
+
+    def _recover(self) -> None:
+        state, records = self.log.recover()
+        if state is not None:
+            self.highest_id, course_documents = state
+            for course_document in course_documents:
+                super().save(self._upgraded(course_document))
+        # updates are applied to live courses and stored once at the end, so a course is not copied once per logged change
+        replayed_courses = dict()
+        for record in records:
+            if record[0] == SAVE:
+                replayed_courses.pop(record[1].id, None)
+                self._observe_ids([record[1].id, *record[1].assignments])
+                super().save(self._upgraded(record[1]))
+            elif record[0] == UPDATE:
+                _, id, changes = record
+                course = replayed_courses.get(id)
+                if course is None:
+                    course = replayed_courses[id] = self.mapper.to_course_from_course_document(self.courses[id])
+                course.apply_changes(changes)
+                self._observe_ids([change.assignment_id for change in changes if isinstance(change, AssignmentCreated)])
+            elif record[0] == DELETE:
+                replayed_courses.pop(record[1], None)
+                self._observe_ids([record[1]])
+                super().delete(record[1])
+        for course in replayed_courses.values():
+            super().update(course.id, self.mapper.to_document_fields_from_course(course), course.pending_changes)
+
+    def _upgraded(self, course_document):
+        # documents logged before grade histograms existed go through a course, which rebuilds them
+        if course_document.grade_histogram is None:
+            return self.mapper.to_course_document_from_course(self.mapper.to_course_from_course_document(course_document))
+        return course_document
+
+    def _observe_ids(self, ids) -> None:
+        self.highest_id = max([self.highest_id, *(id for id in ids if isinstance(id, int))])
+
+# CourseRepositoryImpl over a DurableDatabase in the given directory. Id allocators continue after the ids already stored there
+class DurableCourseRepository(CourseRepositoryImpl):
+    def __init__(self, directory: str, id_allocator: IdAllocator = None, snapshot_interval: int = 100_000, group_commit_size: int = 64, group_commit_interval: float = 0.01) -> None:
+        super().__init__(id_allocator)
+        self.database = DurableDatabase(directory, self.mapper, snapshot_interval, group_commit_size, group_commit_interval)
+        self.id_allocator.skip_past(self.database.highest_id)
+
+    def snapshot(self) -> None:
+        self.database.snapshot()
+
+    def close(self) -> None:
+        self.database.close()
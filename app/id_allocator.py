@@ -0,0 +1,110 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+from uuid import uuid4
+import threading
+import time
+
+# Allocates ids for new courses and assignments. Small ints hash and compare faster than 128-bit uuid ints and keep keys compact
+class IdAllocator(ABC):
+    @abstractmethod
+    def next_id(self) -> int:
+        pass
+
+    def skip_past(self, used_id: int) -> None:
+        # makes sure no id up to used_id is handed out again, e.g. after reopening storage that already holds it.
+        # Allocators whose ids never repeat across restarts have nothing to do
+        pass
+
+# Monotonic counter. Ids are only unique among the callers sharing one allocator, e.g. one repository
+class CounterIdAllocator(IdAllocator):
+    def __init__(self, start: int = 1) -> None:
+        self._next_id = start
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            new_id = self._next_id
+            self._next_id += 1
+            return new_id
+
+    def skip_past(self, used_id: int) -> None:
+        with self._lock:
+            self._next_id = max(self._next_id, used_id + 1)
+
+# Snowflake-style 63-bit ids: 41 bits of milliseconds since the epoch, 10 bits of worker id and 12 bits of sequence.
+# Ids are unique across workers with different worker ids and roughly ordered by time
+class SnowflakeIdAllocator(IdAllocator):
+    WORKER_ID_BITS = 10
+    SEQUENCE_BITS = 12
+    DEFAULT_EPOCH_MS = 1577836800000 # 2020-01-01T00:00:00Z
+
+    def __init__(self, worker_id: int = 0, epoch_ms: int = DEFAULT_EPOCH_MS) -> None:
+        if not 0 <= worker_id < 1 << self.WORKER_ID_BITS:
+            raise ValueError(f"Worker id must be between 0 and {(1 << self.WORKER_ID_BITS) - 1}")
+        self.worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self._last_timestamp = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            timestamp = max(self._current_timestamp(), self._last_timestamp) # never move backwards if the clock does
+            if timestamp == self._last_timestamp:
+                self._sequence = (self._sequence + 1) & ((1 << self.SEQUENCE_BITS) - 1)
+                if self._sequence == 0: # sequence exhausted for this millisecond
+                    while timestamp <= self._last_timestamp:
+                        timestamp = self._current_timestamp()
+            else:
+                self._sequence = 0
+            self._last_timestamp = timestamp
+            return (timestamp << (self.WORKER_ID_BITS + self.SEQUENCE_BITS)) | (self.worker_id << self.SEQUENCE_BITS) | self._sequence
+
+    def _current_timestamp(self) -> int:
+        return time.time_ns() // 1_000_000 - self.epoch_ms
+
+# Random 128-bit ids, as used before allocators existed
+class UuidIdAllocator(IdAllocator):
+    def next_id(self) -> int:
+        return uuid4().int
+
+'''
+Maps arbitrary external ids (e.g. student ids passed in by callers) to dense internal indexes 0, 1, 2... in order of first use,
+so that model structures can keep per-id data in arrays. Indexes are never reused
+'''
+class IdInterner:
+    def __init__(self) -> None:
+        self._indexes = dict() # { external_id : index }
+        self._external_ids = list() # [ external_id ] by index
+
+    def intern(self, external_id) -> int:
+        index = self._indexes.get(external_id)
+        if index is None:
+            index = len(self._external_ids)
+            self._indexes[external_id] = index
+            self._external_ids.append(external_id)
+        return index
+
+    def index_of(self, external_id) -> Optional[int]:
+        return self._indexes.get(external_id)
+
+    def external_id(self, index: int):
+        return self._external_ids[index]
+
+    def copy(self) -> 'IdInterner':
+        interner = IdInterner()
+        interner._indexes = self._indexes.copy()
+        interner._external_ids = self._external_ids.copy()
+        return interner
+
+    def __contains__(self, external_id) -> bool:
+        return external_id in self._indexes
+
+    def __iter__(self):
+        return iter(self._external_ids)
+
+    def __len__(self) -> int:
+        return len(self._external_ids)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IdInterner) and self._external_ids == other._external_ids
@@ -0,0 +1,291 @@
+from app.model import set_scan_observer
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import cProfile
+import io
+import json
+import pstats
+import random
+import threading
+import time
+
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0) # seconds
+SCAN_BUCKETS = (0, 10, 100, 1_000, 10_000, 100_000, 1_000_000) # grades walked through by one call
+
+# Calls in progress on this thread, innermost last, as [grades scanned so far] cells. A scan counts towards every call
+# on the stack, so a service call that loads a course reports the grades its repository call scanned too
+_calls = threading.local()
+
+def _active_calls() -> List[List[int]]:
+    active_calls = getattr(_calls, 'stack', None)
+    if active_calls is None:
+        active_calls = _calls.stack = []
+    return active_calls
+
+def _count_scanned_grades(count: int) -> None:
+    for call in getattr(_calls, 'stack', ()):
+        call[0] += count
+
+'''
+Histogram with fixed upper bounds. A value falls in the first bucket whose bound is at least the value, and in the
+overflow bucket past the last bound
+'''
+class Histogram:
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_buckets(self) -> List[Tuple[str, int]]:
+        # (upper bound, values at or below it) in the shape of prometheus buckets, ending with '+Inf'
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return buckets
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'sum': self.sum, 'buckets': dict(self.cumulative_buckets())}
+
+class _CallStats:
+    def __init__(self) -> None:
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.scanned = Histogram(SCAN_BUCKETS)
+        self.counters = dict() # { counter name : total }, e.g. containers copied by the calls
+
+'''
+Registry of the calls made through instrumented objects, keyed by component ('service', 'repository', 'database') and
+method. Each method gets a call count, an error count, a latency histogram, a histogram of the grades each call walked
+through and counters for the copies it made. enabled can be switched at any time; while it is False wrapped calls go
+straight to their target and record nothing
+'''
+class Metrics:
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._calls: Dict[Tuple[str, str], _CallStats] = dict()
+        self._lock = threading.Lock()
+
+    def record_call(self, component: str, method: str, seconds: float, grades_scanned: int, failed: bool) -> None:
+        with self._lock:
+            call_stats = self._call_stats(component, method)
+            call_stats.latency.observe(seconds)
+            call_stats.scanned.observe(grades_scanned)
+            if failed:
+                call_stats.errors += 1
+
+    def add(self, component: str, method: str, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            counters = self._call_stats(component, method).counters
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        # { 'component.method' : stats } of every method called so far, as plain dicts and numbers
+        with self._lock:
+            return {
+                f"{component}.{method}": {
+                    'calls': call_stats.latency.count,
+                    'errors': call_stats.errors,
+                    'latency_seconds': call_stats.latency.to_dict(),
+                    'grades_scanned': call_stats.scanned.to_dict(),
+                    'counters': dict(call_stats.counters),
+                }
+                for (component, method), call_stats in sorted(self._calls.items())
+            }
+
+    def to_json(self, **json_options) -> str:
+        return json.dumps(self.snapshot(), **json_options)
+
+    def to_prometheus(self, prefix: str = 'course_') -> str:
+        # text exposition format, one family per statistic, labelled by component and method
+        with self._lock:
+            calls = sorted(self._calls.items())
+            counter_names = sorted({counter for _, call_stats in calls for counter in call_stats.counters})
+            lines = []
+
+            def family(name, metric_type, help_text):
+                lines.append(f"# HELP {prefix}{name} {help_text}")
+                lines.append(f"# TYPE {prefix}{name} {metric_type}")
+
+            def histogram(name, select):
+                for (component, method), call_stats in calls:
+                    labels = f'component="{component}",method="{method}"'
+                    histogram = select(call_stats)
+                    for bound, count in histogram.cumulative_buckets():
+                        lines.append(f'{prefix}{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f"{prefix}{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{prefix}{name}_count{{{labels}}} {histogram.count}")
+
+            family('calls_total', 'counter', 'Calls by component and method.')
+            for (component, method), call_stats in calls:
+                lines.append(f'{prefix}calls_total{{component="{component}",method="{method}"}} {call_stats.latency.count}')
+            family('call_errors_total', 'counter', 'Calls that raised, by component and method.')
+            for (component, method), call_stats in calls:
+                lines.append(f'{prefix}call_errors_total{{component="{component}",method="{method}"}} {call_stats.errors}')
+            family('call_duration_seconds', 'histogram', 'Call latency in seconds.')
+            histogram('call_duration_seconds', lambda call_stats: call_stats.latency)
+            family('grades_scanned', 'histogram', 'Stored grades walked through per call.')
+            histogram('grades_scanned', lambda call_stats: call_stats.scanned)
+            for counter in counter_names:
+                family(f"{counter}_total", 'counter', f"Total {counter.replace('_', ' ')}.")
+                for (component, method), call_stats in calls:
+                    if counter in call_stats.counters:
+                        lines.append(f'{prefix}{counter}_total{{component="{component}",method="{method}"}} {call_stats.counters[counter]}')
+            return '\n'.join(lines) + '\n'
+
+    def _call_stats(self, component: str, method: str) -> _CallStats:
+        call_stats = self._calls.get((component, method))
+        if call_stats is None:
+            call_stats = self._calls[(component, method)] = _CallStats()
+        return call_stats
+
+class SlowCall(NamedTuple):
+    name: str # component.method
+    seconds: float
+    profile: str # pstats report of the call, most cumulative time first
+
+'''
+Runs a sample of calls under cProfile and keeps the reports of those slower than threshold seconds, newest last. Only
+the outermost sampled call of a thread is profiled, and a call is left unprofiled when another profiler is active
+'''
+class SlowCallProfiler:
+    def __init__(self, threshold: float, sample_rate: float = 0.01, max_reports: int = 32, report_lines: int = 25, randomness: Optional[random.Random] = None) -> None:
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.report_lines = report_lines
+        self.randomness = randomness if randomness is not None else random.Random()
+        self._slow_calls = deque(maxlen=max_reports)
+        self._lock = threading.Lock()
+        self._profiling = threading.local()
+
+    def should_profile(self) -> bool:
+        return not getattr(self._profiling, 'active', False) and self.randomness.random() < self.sample_rate
+
+    def call(self, name: str, method, args, kwargs):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: # another profiler is running on this thread
+            return method(*args, **kwargs)
+        self._profiling.active = True
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            profile.disable()
+            self._profiling.active = False
+            if seconds >= self.threshold:
+                self._keep(name, seconds, profile)
+
+    def slow_calls(self) -> List[SlowCall]:
+        with self._lock:
+            return list(self._slow_calls)
+
+    def _keep(self, name: str, seconds: float, profile: cProfile.Profile) -> None:
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(self.report_lines)
+        with self._lock:
+            self._slow_calls.append(SlowCall(name, seconds, report.getvalue()))
+
+'''
+Proxy that times the public methods of its target into a Metrics registry. Other attributes are passed through. Wrappers
+are built on the first access of a method and cached on the proxy, so later calls cost a closure call and, while the
+metrics are disabled, one attribute check. Subclasses record extra counters for the methods named in OBSERVED_METHODS
+'''
+class Instrumented:
+    OBSERVED_METHODS = frozenset()
+
+    def __init__(self, target, metrics: Metrics, component: str, profiler: Optional[SlowCallProfiler] = None) -> None:
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_metrics', metrics)
+        object.__setattr__(self, '_component', component)
+        object.__setattr__(self, '_profiler', profiler)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+        wrapper = self._wrap(name, attribute)
+        object.__setattr__(self, name, wrapper)
+        return wrapper
+
+    def __setattr__(self, name, value) -> None:
+        setattr(self._target, name, value)
+
+    def _observe(self, method: str, args, kwargs) -> None:
+        pass
+
+    def _wrap(self, method_name: str, method):
+        metrics, component, profiler = self._metrics, self._component, self._profiler
+        observe = self._observe if method_name in self.OBSERVED_METHODS else None
+        name = f"{component}.{method_name}"
+
+        @wraps(method)
+        def call(*args, **kwargs):
+            if not metrics.enabled:
+                return method(*args, **kwargs)
+            if observe is not None:
+                observe(method_name, args, kwargs)
+            active_calls = _active_calls()
+            scanned = [0]
+            active_calls.append(scanned)
+            failed = True
+            started = time.perf_counter()
+            try:
+                if profiler is not None and profiler.should_profile():
+                    result = profiler.call(name, method, args, kwargs)
+                else:
+                    result = method(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                seconds = time.perf_counter() - started
+                active_calls.pop()
+                metrics.record_call(component, method_name, seconds, scanned[0], failed)
+        return call
+
+# Counts the containers a course copied on write since it was loaded. They are the containers a save hands to storage
+class InstrumentedRepository(Instrumented):
+    OBSERVED_METHODS = frozenset({'save_course'})
+
+    def _observe(self, method: str, args, kwargs) -> None:
+        course = args[0] if args else kwargs['course']
+        if not course.pending_changes or course.is_new():
+            return
+        container_names = course.changed_containers()
+        self._metrics.add(self._component, method, 'containers_copied', len(container_names))
+        self._metrics.add(self._component, method, 'container_items_copied', sum(len(getattr(course, container_name)) for container_name in container_names))
+
+# Counts the documents an update copies. Each is a shallow copy whose replaced fields are the size of the new version
+class InstrumentedDatabase(Instrumented):
+    OBSERVED_METHODS = frozenset({'update'})
+
+    def _observe(self, method: str, args, kwargs) -> None:
+        fields = args[1] if len(args) > 1 else kwargs['fields']
+        self._metrics.add(self._component, method, 'documents_copied')
+        self._metrics.add(self._component, method, 'document_fields_replaced', len(fields))
+
+def instrument(course_service, metrics: Metrics, profiler: Optional[SlowCallProfiler] = None) -> Instrumented:
+    # wraps a CourseServiceImpl, its repository and, when the repository has one, its database. Returns the wrapped service
+    set_scan_observer(_count_scanned_grades)
+    course_repository = course_service.course_repository
+    database = getattr(course_repository, 'database', None)
+    if database is not None and not isinstance(database, Instrumented):
+        course_repository.database = InstrumentedDatabase(database, metrics, 'database', profiler)
+    if not isinstance(course_repository, Instrumented):
+        course_service.course_repository = InstrumentedRepository(course_repository, metrics, 'repository', profiler)
+    return Instrumented(course_service, metrics, 'service', profiler)
@@ -1,73 +1,489 @@
 from uuid import uuid4
-from typing import List
+from typing import List, Any, NamedTuple, Optional, Tuple
+from bisect import insort, bisect_left, bisect_right
+from collections.abc import Mapping
+from app.read_only_containers import WritableDict, WritableList, plain_rows, read_only, read_only_rows, writable_copy
 import math
 
+# Changes made to a course since it was last loaded or saved, recorded in the order they happened
+
+class CourseCreated(NamedTuple):
+    name: str
+
+class StudentEnrolled(NamedTuple):
+    student_id: Any
+
+class StudentDroppedOut(NamedTuple):
+    student_id: Any
+
+class AssignmentCreated(NamedTuple):
+    assignment_id: Any
+    assignment_name: str
+
+class AssignmentSubmitted(NamedTuple):
+    student_id: Any
+    assignment_id: Any
+    grade: int
+
+# Recorded by the change feed rather than a course, when a course is removed from its repository
+class CourseDeleted(NamedTuple):
+    pass
+
+# Lightweight projection of a course for listings. It holds counts instead of rosters and grades
+class CourseSummary(NamedTuple):
+    id: Any
+    name: str
+    student_count: int
+    assignment_count: int
+    submission_count: int
+
+# One line of a student's transcript: their average in a course, None until they have submitted something there
+class TranscriptEntry(NamedTuple):
+    course_id: Any
+    course_name: str
+    grade_average: Optional[int]
+    submission_count: int
+
+# Optional callback told how many stored grades an operation walks through. app.instrumentation sets it to count the scans of
+# each call. Unset, a walk pays one check for it
+_scan_observer = None
+
+def set_scan_observer(observer) -> None:
+    global _scan_observer
+    _scan_observer = observer
+
+def note_grades_scanned(count: int) -> None:
+    if _scan_observer is not None:
+        _scan_observer(count)
+
+_NO_ROWS = frozenset() # _owned_rows of a course that has not copied a container since it was stored
+
+GRADE_BUCKETS = 101 # grades are whole numbers from 0 to 100, so a histogram counts them in one bucket per grade
+
+EMPTY_HISTOGRAM = (0,) * GRADE_BUCKETS
+
+# Business rules for read queries. They are shared by Course and by read paths that answer from stored data without building a Course
+
+def assignment_grade_average(course_id, assignment_id, grade_total) -> int:
+    # grade_total is None when the assignment does not exist and (0, 0) when it has no submissions
+    if grade_total is None:
+        raise Exception(f"Assignment {assignment_id} does not exist in course {course_id}!")
+    if not grade_total[1]:
+        raise Exception(f"Assignment {assignment_id} has no submissions in course {course_id}!")
+    return math.floor(grade_total[0] / grade_total[1])
+
+def student_grade_average(course_id, student_id, grade_total) -> int:
+    # grade_total is None when the student is not enrolled and (0, 0) when they have no submissions
+    if grade_total is None:
+        raise Exception(f"Student {student_id} does not exist in course {course_id}!")
+    if not grade_total[1]:
+        raise Exception(f"Student {student_id} has not submitted assignments in course {course_id}!")
+    return math.floor(grade_total[0] / grade_total[1])
+
+def transcript_entry(course_id, course_name, grade_total) -> TranscriptEntry:
+    grade_sum, grade_count = grade_total
+    return TranscriptEntry(course_id, course_name, math.floor(grade_sum / grade_count) if grade_count else None, grade_count)
+
+def assignment_grade_distribution(course_id, assignment_id, grade_histogram) -> List[int]:
+    # grade_histogram is None when the assignment does not exist
+    if grade_histogram is None:
+        raise Exception(f"Assignment {assignment_id} does not exist in course {course_id}!")
+    return list(grade_histogram)
+
+def assignment_grade_percentile(course_id, assignment_id, grade_histogram, percentile) -> int:
+    # grade_histogram is None when the assignment does not exist
+    if grade_histogram is None:
+        raise Exception(f"Assignment {assignment_id} does not exist in course {course_id}!")
+    return histogram_percentile(grade_histogram, percentile, f"Assignment {assignment_id} has no submissions in course {course_id}!")
+
+def course_grade_percentile(course_id, grade_histogram, percentile) -> int:
+    return histogram_percentile(grade_histogram, percentile, f"Course {course_id} has no submissions!")
+
+def histogram_percentile(grade_histogram, percentile, empty_message: str) -> int:
+    # nearest rank: the lowest grade with at least percentile % of the grades at or below it. The median is the 50th
+    # percentile, so with an even count it is the lower of the two middle grades
+    if percentile < 0 or percentile > 100:
+        raise ValueError("Percentile must be between 0 and 100")
+    grade_count = sum(grade_histogram)
+    if not grade_count:
+        raise Exception(empty_message)
+    rank = max(math.ceil(percentile * grade_count / 100), 1)
+    for grade, count in enumerate(grade_histogram):
+        rank -= count
+        if rank <= 0:
+            return grade
+
+def top_k_students(student_rankings, k) -> List[int]:
+    # best average first, ties broken by the lower student id
+    return [ranking[-1] for ranking in student_rankings[:max(k, 0)]]
+
+def bottom_k_students(student_rankings, k) -> List[int]:
+    # worst average first, in exactly the reverse order of the top k ranking
+    return [ranking[-1] for ranking in reversed(student_rankings[max(len(student_rankings) - max(k, 0), 0):])]
+
+def students_by_average(student_rankings, lowest=None, highest=None) -> List:
+    # students whose average, floored as it is reported, is from lowest to highest inclusive, best first. None leaves that side open
+    start, stop = average_range(student_rankings, lowest, highest, lambda ranking: ranking[0])
+    return [ranking[-1] for ranking in student_rankings[start:stop]]
+
+# (lowest, highest) of students_by_average for floored averages strictly below or above a threshold
+
+def below_threshold(threshold) -> Tuple[Optional[int], Optional[int]]:
+    return None, math.ceil(threshold) - 1
+
+def above_threshold(threshold) -> Tuple[Optional[int], Optional[int]]:
+    return math.floor(threshold) + 1, None
+
+def average_range(rankings, lowest, highest, negated_average) -> Tuple[int, int]:
+    # (start, stop) of the rankings in the range of students_by_average. Rankings are sorted by descending average, so the
+    # range is one slice of them, found with two binary searches on the negated averages that negated_average reads off an entry.
+    # A floored average is at most highest while the average is below floor(highest) + 1, and at least lowest from ceil(lowest)
+    start = 0 if highest is None else bisect_right(rankings, -(math.floor(highest) + 1), key=negated_average)
+    stop = len(rankings) if lowest is None else bisect_right(rankings, -math.ceil(lowest), key=negated_average)
+    return start, max(start, stop)
+
 '''
 This class is a data structure that stores course information
 and encapsulates the business logic around modifying that data and performing calculations on it.
 Keeping this logic here ensures the integrity of the data
 '''
 class Course:
-    def __init__(self, id, name, students=None, assignments=None, submissions=None) -> None:
+    CONTAINERS = ('students', 'assignments', 'student_submissions', 'assignment_submissions', 'student_grade_totals', 'assignment_grade_totals', 'student_rankings', 'assignment_grade_histograms', 'grade_histogram')
+    ROW_CONTAINERS = ('student_submissions', 'assignment_submissions', 'assignment_grade_histograms') # containers whose values are containers too
+    _ALL_SHARED = frozenset(CONTAINERS)
+    __slots__ = ('id', 'name', *CONTAINERS, '_shared_containers', '_owned_rows', 'pending_changes')
+
+    def __init__(self, id, name, students=None, assignments=None, submissions=None, student_submissions=None, assignment_submissions=None, student_grade_totals=None, assignment_grade_totals=None, student_rankings=None, assignment_grade_histograms=None, grade_histogram=None) -> None:
         if not name:
             raise ValueError("Name must be present")
         self.id = id
         self.name = name
         self.students = students if students is not None else set()
         self.assignments = assignments if assignments is not None else dict() # { assignment_id : assignment_name }
-        self.submissions = submissions if submissions is not None else dict() # { (student_id, assignment_id) : grade }
+        # grades indexed both ways, built from submissions { (student_id, assignment_id) : grade } when not supplied
+        if student_submissions is None or assignment_submissions is None:
+            student_submissions, assignment_submissions = self._build_submission_indexes(submissions if submissions is not None else dict())
+        self.student_submissions = student_submissions # { student_id : { assignment_id : grade } }
+        self.assignment_submissions = assignment_submissions # { assignment_id : { student_id : grade } }
+        self._init_aggregates(student_grade_totals, assignment_grade_totals, student_rankings, assignment_grade_histograms, grade_histogram)
+        self._init_bookkeeping()
+
+    def _init_aggregates(self, student_grade_totals, assignment_grade_totals, student_rankings, assignment_grade_histograms, grade_histogram) -> None:
+        # running aggregates over the stored grades. They are rebuilt when not supplied
+        if student_grade_totals is None or assignment_grade_totals is None or student_rankings is None:
+            student_grade_totals, assignment_grade_totals, student_rankings = self._build_aggregates()
+        if assignment_grade_histograms is None or grade_histogram is None:
+            assignment_grade_histograms, grade_histogram = self._build_histograms()
+        self.student_grade_totals = student_grade_totals # { student_id : (grade_sum, grade_count) }
+        self.assignment_grade_totals = assignment_grade_totals # { assignment_id : (grade_sum, grade_count) }
+        self.student_rankings = student_rankings # sorted [ _ranking_key ] of enrolled students with submissions, best first
+        self.assignment_grade_histograms = assignment_grade_histograms # { assignment_id : [ count of each grade 0 to 100 ] } of assignments with submissions
+        self.grade_histogram = grade_histogram # [ count of each grade 0 to 100 ] over every submission of the course
+
+    def _init_bookkeeping(self) -> None:
+        # copy-on-write bookkeeping. Containers named in _shared_containers are shared with a stored document, read-only, and
+        # are copied whole before their first mutation. Index rows are copied the same way and tracked in _owned_rows. So the first write
+        # after a load or save costs time in proportion to the size of the containers it changes, e.g. O(students) for a submission,
+        # and later writes until the next save cost only the change
+        self._shared_containers = frozenset()
+        self._owned_rows = set()
+        self.pending_changes = [CourseCreated(self.name)] # a course built here is new until it is loaded from or saved to storage
+
+    @classmethod
+    def from_persisted(cls, id, name, students, assignments, student_submissions, assignment_submissions, student_grade_totals, assignment_grade_totals, student_rankings, assignment_grade_histograms, grade_histogram) -> 'Course':
+        # a course over the containers of a stored document, without the checks and rebuilds of __init__. Every container stays shared with the document
+        course = cls.__new__(cls)
+        course.id = id
+        course.name = name
+        course.students = students
+        course.assignments = assignments
+        course.student_submissions = student_submissions
+        course.assignment_submissions = assignment_submissions
+        course.student_grade_totals = student_grade_totals
+        course.assignment_grade_totals = assignment_grade_totals
+        course.student_rankings = student_rankings
+        course.assignment_grade_histograms = assignment_grade_histograms
+        course.grade_histogram = grade_histogram
+        course.mark_persisted()
+        return course
+
+    # Pickles as a tuple of the fields rather than a dict of them, in the order of CONTAINERS. Rows are pickled as plain containers,
+    # and shared containers are made read-only again once loaded
 
-    def create_assignment(self, assignment_name) -> int:
+    def __getstate__(self):
+        containers = tuple(plain_rows(getattr(self, container_name)) if container_name in self.ROW_CONTAINERS else getattr(self, container_name) for container_name in self.CONTAINERS)
+        return (self.id, self.name, containers, self._shared_containers, self._owned_rows, self.pending_changes)
+
+    def __setstate__(self, state) -> None:
+        self.id, self.name, containers, self._shared_containers, self._owned_rows, self.pending_changes = state
+        for container_name, container in zip(self.CONTAINERS, containers):
+            if container_name in self._shared_containers:
+                container = read_only_rows(container) if container_name in self.ROW_CONTAINERS else read_only(container)
+            setattr(self, container_name, container)
+
+    def create_assignment(self, assignment_name, new_assignment_id=None) -> int:
         if not assignment_name:
             raise ValueError("Name must be present")
-        new_assignment_id = uuid4().int
-        self.assignments.update({new_assignment_id: assignment_name})
+        if new_assignment_id is None: # callers with an id allocator pass the id in
+            new_assignment_id = uuid4().int
+        if new_assignment_id in self.assignments:
+            raise ValueError(f"Assignment {new_assignment_id} already exists in course {self.id}")
+        self._writable('assignments')[new_assignment_id] = assignment_name
+        self.pending_changes.append(AssignmentCreated(new_assignment_id, assignment_name))
         return new_assignment_id
     
     def enroll_student(self, student_id) -> bool:
         if student_id in self.students:
             return False
-        self.students.add(student_id)
+        self._writable('students').add(student_id)
+        grade_total = self.student_grade_totals.get(student_id)
+        if grade_total is not None: # a returning student is ranked again on the grades they kept
+            insort(self._writable('student_rankings'), self._ranking_key(student_id, grade_total))
+        self.pending_changes.append(StudentEnrolled(student_id))
         return True
 
     def dropout_student(self, student_id) -> bool:
         if student_id not in self.students:
             return False
-        self.students.discard(student_id)
+        self._writable('students').discard(student_id)
+        grade_total = self.student_grade_totals.get(student_id)
+        if grade_total is not None: # their submissions stay in the course, but only enrolled students are ranked
+            student_rankings = self._writable('student_rankings')
+            del student_rankings[bisect_left(student_rankings, self._ranking_key(student_id, grade_total))]
+        self.pending_changes.append(StudentDroppedOut(student_id))
         return True
     
     def submit_assignment(self, student_id, assignment_id, grade) -> bool:
         if student_id not in self.students or assignment_id not in self.assignments: # student and assignment should both exist in this course
             return False
-        if (student_id, assignment_id) in self.submissions: # there should not be an existing submission for this student and assignment combo
+        if self.get_grade(student_id, assignment_id) is not None: # there should not be an existing submission for this student and assignment combo
             return False
-        if grade < 0 or grade > 100:
+        if grade < 0 or grade > 100 or grade != int(grade): # grades are whole numbers from 0 to 100
             return False
-        self.submissions.update({(student_id, assignment_id) : grade})
+        grade = int(grade) # stored as an int, so 90.0 is the same grade as 90 in every storage layout
+        self._record_grade(student_id, assignment_id, grade)
+        self.pending_changes.append(AssignmentSubmitted(student_id, assignment_id, grade))
         return True
 
+    def apply_changes(self, changes) -> None:
+        # replays changes recorded on another copy of this course, e.g. from a log, through the same rules that produced them
+        for change in changes:
+            if isinstance(change, StudentEnrolled):
+                self.enroll_student(change.student_id)
+            elif isinstance(change, StudentDroppedOut):
+                self.dropout_student(change.student_id)
+            elif isinstance(change, AssignmentCreated):
+                self.create_assignment(change.assignment_name, change.assignment_id)
+            elif isinstance(change, AssignmentSubmitted):
+                self.submit_assignment(change.student_id, change.assignment_id, change.grade)
+
+    @property
+    def submissions(self):
+        # { (student_id, assignment_id) : grade }, a read-only view of student_submissions rather than a third copy of every grade
+        return _SubmissionsView(self)
+
+    def get_grade(self, student_id, assignment_id):
+        # None when the student has not submitted the assignment
+        row = self.student_submissions.get(student_id)
+        return None if row is None else row.get(assignment_id)
+
     def get_assignment_grade_average(self, assignment_id) -> int:
-        if assignment_id not in self.assignments:
-            raise Exception(f"Assignment {assignment_id} does not exist in course {self.id}!")
-        submissions_of_assignment = [el[1] for el in self.submissions.items() if assignment_id in el[0]] # get all submissions that have assignment_id in the key
-        if not submissions_of_assignment:
-            raise Exception(f"Assignment {assignment_id} has no submissions in course {self.id}!")
-        return math.floor(sum(submissions_of_assignment) / len(submissions_of_assignment))
+        return assignment_grade_average(self.id, assignment_id, self.get_assignment_grade_total(assignment_id))
         
     def get_student_grade_average(self, student_id) -> int:
+        return student_grade_average(self.id, student_id, self.get_student_grade_total(student_id))
+
+    def get_assignment_grade_total(self, assignment_id):
+        if assignment_id not in self.assignments:
+            return None
+        return self.assignment_grade_totals.get(assignment_id, (0, 0))
+
+    def get_student_grade_total(self, student_id):
         if student_id not in self.students:
-            raise Exception(f"Student {student_id} does not exist in course {self.id}!")
-        submissions_of_student = [el[1] for el in self.submissions.items() if student_id in el[0]] # get all submissions that have student_id in the key
-        if not submissions_of_student:
-            raise Exception(f"Student {student_id} has not submitted assignments in course {self.id}!")
-        return math.floor(sum(submissions_of_student) / len(submissions_of_student))
+            return None
+        return self.student_grade_totals.get(student_id, (0, 0))
     
+    def get_assignment_grade_histogram(self, assignment_id) -> Optional[List[int]]:
+        if assignment_id not in self.assignments:
+            return None
+        return list(self.assignment_grade_histograms.get(assignment_id, EMPTY_HISTOGRAM))
+
+    def get_grade_histogram(self) -> List[int]:
+        return list(self.grade_histogram)
+
+    def get_assignment_grade_percentile(self, assignment_id, percentile) -> int:
+        return assignment_grade_percentile(self.id, assignment_id, self.get_assignment_grade_histogram(assignment_id), percentile)
+
+    def get_grade_percentile(self, percentile) -> int:
+        return course_grade_percentile(self.id, self.grade_histogram, percentile)
+
     def get_top_five_students(self) -> List[int]:
-        student_averages = {}
-        for student_id in self.students:
-            try:
-                student_averages[student_id] = self.get_student_grade_average(student_id)
-            except:
-                pass
-        return sorted(student_averages, key=student_averages.get, reverse=True)[:5]
-    
+        return self.get_top_k_students(5)
+
+    def get_top_k_students(self, k) -> List[int]:
+        return top_k_students(self.student_rankings, k)
+
+    def get_bottom_k_students(self, k) -> List[int]:
+        return bottom_k_students(self.student_rankings, k)
+
+    def get_students_by_average(self, lowest=None, highest=None) -> List[int]:
+        return students_by_average(self.student_rankings, lowest, highest)
+
+    def aggregates_are_consistent(self) -> bool:
+        # rebuilds the indexes and aggregates from the grades of each student and compares them with the maintained ones
+        return (self._storage_is_consistent() and self._build_aggregates() == (self.student_grade_totals, self.assignment_grade_totals, self.student_rankings)
+                and self._build_histograms() == (self.assignment_grade_histograms, self.grade_histogram))
+
+    def is_new(self) -> bool:
+        return bool(self.pending_changes) and isinstance(self.pending_changes[0], CourseCreated)
+
+    def changed_containers(self) -> List[str]:
+        # containers that no longer match the stored document. A course that was never stored owns all of them
+        return [container_name for container_name in self.CONTAINERS if container_name not in self._shared_containers]
+
+    def freeze_containers(self) -> None:
+        # makes the containers and rows this course owns read-only, so that a document can share them with every course loaded
+        # from it. Copies written since the course was loaded become read-only in place, other containers are copied. The course
+        # then copies a container before changing it again, as after a load
+        for index_name, key in self._owned_rows: # writable copies, so they are made read-only in place
+            read_only(getattr(self, index_name)[key])
+        for container_name in self.changed_containers():
+            container = getattr(self, container_name)
+            if container_name in self.ROW_CONTAINERS and not isinstance(container, WritableDict): # built here rather than copied, so any row may be writable
+                container = read_only_rows(container)
+            setattr(self, container_name, read_only(container))
+        self._shared_containers = self._ALL_SHARED
+        self._owned_rows = _NO_ROWS
+
+    def mark_persisted(self) -> None:
+        # called once the containers of this course are referenced by a stored document, which must never change underneath its readers.
+        # Both sets are shared constants until the first write, so a course that is only read allocates neither
+        self._shared_containers = self._ALL_SHARED
+        self._owned_rows = _NO_ROWS
+        self.pending_changes = []
+
+    def _writable(self, container_name):
+        container = getattr(self, container_name)
+        if container_name in self._shared_containers:
+            container = writable_copy(container)
+            setattr(self, container_name, container)
+            self._shared_containers = self._shared_containers - {container_name}
+            if isinstance(self._owned_rows, frozenset): # rows are only owned inside owned containers, so this is the first that can be
+                self._owned_rows = set()
+        return container
+
+    def _writable_row(self, index_name, key):
+        index = self._writable(index_name)
+        row = index.get(key)
+        if (index_name, key) not in self._owned_rows:
+            row = writable_copy(row) if row is not None else WritableDict()
+            index[key] = row
+            self._owned_rows.add((index_name, key))
+        return row
+
+    # every grade goes through this method so that the indexes and aggregates never drift from submissions
+
+    def _record_grade(self, student_id, assignment_id, grade) -> None:
+        self._update_student_total(student_id, grade, 1) # first, as ordering its ranking key is the one step that can raise
+        self._store_grade(student_id, assignment_id, grade)
+        self._add_to_total(self._writable('assignment_grade_totals'), assignment_id, grade, 1)
+        self._writable_histogram(assignment_id)[int(grade)] += 1
+        self._writable('grade_histogram')[int(grade)] += 1
+
+    # grade storage. Subclasses with a different storage layout override these methods, get_grade and _build_aggregates
+
+    def _store_grade(self, student_id, assignment_id, grade) -> None:
+        self._writable_row('student_submissions', student_id)[assignment_id] = grade
+        self._writable_row('assignment_submissions', assignment_id)[student_id] = grade
+
+    def _storage_is_consistent(self) -> bool:
+        return self._build_submission_indexes(self.submissions) == (self.student_submissions, self.assignment_submissions)
+
+    def _build_aggregates(self):
+        note_grades_scanned(len(self.submissions))
+        student_grade_totals = {student_id: (sum(row.values()), len(row)) for student_id, row in self.student_submissions.items()}
+        assignment_grade_totals = {assignment_id: (sum(row.values()), len(row)) for assignment_id, row in self.assignment_submissions.items()}
+        return student_grade_totals, assignment_grade_totals, self._build_rankings(student_grade_totals)
+
+    def _build_histograms(self):
+        assignment_grade_histograms = dict()
+        for assignment_id, row in self.assignment_submissions.items():
+            note_grades_scanned(len(row))
+            histogram = assignment_grade_histograms[assignment_id] = [0] * GRADE_BUCKETS
+            for grade in row.values():
+                histogram[int(grade)] += 1
+        return assignment_grade_histograms, self._sum_histograms(assignment_grade_histograms.values())
+
+    @staticmethod
+    def _sum_histograms(histograms) -> List[int]:
+        return [sum(counts) for counts in zip(*histograms)] if histograms else [0] * GRADE_BUCKETS
+
+    def _writable_histogram(self, assignment_id):
+        if assignment_id not in self.assignment_grade_histograms:
+            self._writable('assignment_grade_histograms')[assignment_id] = WritableList([0] * GRADE_BUCKETS)
+            self._owned_rows.add(('assignment_grade_histograms', assignment_id))
+        return self._writable_row('assignment_grade_histograms', assignment_id)
+
+    def _update_student_total(self, student_id, grade, count) -> None:
+        # the ranking entry of a student is keyed by their average, so it is replaced whenever their total changes. Both positions
+        # are found before anything changes, so a key that can't be ordered leaves the course as it was
+        old_total = self.student_grade_totals.get(student_id)
+        grade_sum, grade_count = old_total or (0, 0)
+        new_total = (grade_sum + grade, grade_count + count) if grade_count + count else None
+        old_index = bisect_left(self.student_rankings, self._ranking_key(student_id, old_total)) if old_total else None
+        new_key = self._ranking_key(student_id, new_total) if new_total else None
+        if new_key is not None:
+            new_index = bisect_left(self.student_rankings, new_key)
+            if old_index is not None and old_index < new_index: # the old entry is removed first
+                new_index -= 1
+        self._add_to_total(self._writable('student_grade_totals'), student_id, grade, count)
+        student_rankings = self._writable('student_rankings')
+        if old_index is not None:
+            del student_rankings[old_index]
+        if new_key is not None:
+            student_rankings.insert(new_index, new_key)
+
+    @staticmethod
+    def _ranking_key(student_id, grade_total):
+        # (-average, type name, student_id). Ties are broken by the id, and ids of different types, e.g. 7 and 's-7', by the name
+        # of their type, which they can always be ordered by
+        return (-(grade_total[0] / grade_total[1]), type(student_id).__name__, student_id)
+
+    @staticmethod
+    def _add_to_total(totals, key, grade, count) -> None:
+        grade_sum, grade_count = totals.get(key, (0, 0))
+        if grade_count + count == 0:
+            totals.pop(key, None)
+        else:
+            totals[key] = (grade_sum + grade, grade_count + count)
+
+    def _build_rankings(self, student_grade_totals):
+        return sorted(self._ranking_key(student_id, grade_total) for student_id, grade_total in student_grade_totals.items() if student_id in self.students)
+
+    @staticmethod
+    def _build_submission_indexes(submissions):
+        note_grades_scanned(len(submissions))
+        student_submissions = dict()
+        assignment_submissions = dict()
+        for (student_id, assignment_id), grade in submissions.items():
+            student_submissions.setdefault(student_id, {})[assignment_id] = grade
+            assignment_submissions.setdefault(assignment_id, {})[student_id] = grade
+        return student_submissions, assignment_submissions
+
+class _SubmissionsView(Mapping):
+    def __init__(self, course: Course) -> None:
+        self.course = course
+
+    def __getitem__(self, key):
+        grade = self.course.get_grade(*key)
+        if grade is None:
+            raise KeyError(key)
+        return grade
+
+    def __iter__(self):
+        for student_id, row in self.course.student_submissions.items():
+            for assignment_id in row:
+                yield (student_id, assignment_id)
+
+    def __len__(self) -> int:
+        return sum(map(len, self.course.student_submissions.values()))
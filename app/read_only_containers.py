@@ -0,0 +1,100 @@
+from array import array
+from app.id_allocator import IdInterner
+
+'''
+Read-only versions of the containers of a course, for the ones a stored document shares with the courses loaded from it. Each
+is a subclass of the type it stands for, so it reads as fast and compares equal to it, while every method that would modify
+it raises TypeError. read_only makes a writable copy made by writable_copy read-only in place, and copies any other container,
+so handing a container to storage costs nothing when the course copied it on write anyway
+'''
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} belongs to a stored course and can't be modified, change the course instead")
+
+class ReadOnlyDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (ReadOnlyDict, (dict(self),))
+
+class ReadOnlySet(set):
+    __slots__ = ()
+    add = discard = remove = pop = clear = update = difference_update = intersection_update = symmetric_difference_update = _read_only
+    __ior__ = __iand__ = __isub__ = __ixor__ = _read_only
+
+    def __reduce__(self):
+        return (ReadOnlySet, (set(self),))
+
+class ReadOnlyList(list):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return (ReadOnlyList, (list(self),))
+
+class ReadOnlyArray(array):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = reverse = byteswap = _read_only
+    frombytes = fromfile = fromlist = fromunicode = _read_only
+
+    def __reduce__(self):
+        return (ReadOnlyArray, (self.typecode, self.tobytes()))
+
+class ReadOnlyIdInterner(IdInterner):
+    intern = _read_only
+
+# Copies made by writable_copy. They are plain containers, but of a class read_only can swap for the read-only one
+
+class WritableDict(dict):
+    __slots__ = ()
+
+class WritableSet(set):
+    __slots__ = ()
+
+class WritableList(list):
+    __slots__ = ()
+
+class WritableArray(array):
+    __slots__ = ()
+
+_READ_ONLY_TYPES = {WritableDict: ReadOnlyDict, WritableSet: ReadOnlySet, WritableList: ReadOnlyList, WritableArray: ReadOnlyArray, IdInterner: ReadOnlyIdInterner}
+
+_READ_ONLY_COPIES = {dict: ReadOnlyDict, set: ReadOnlySet, list: ReadOnlyList}
+
+def read_only(container):
+    # the container itself once read-only, or a read-only copy of it when it can't be made read-only in place. None stays None
+    read_only_type = _READ_ONLY_TYPES.get(type(container))
+    if read_only_type is not None:
+        container.__class__ = read_only_type
+        return container
+    read_only_copy = _READ_ONLY_COPIES.get(type(container))
+    if read_only_copy is not None:
+        return read_only_copy(container)
+    if type(container) is array:
+        return ReadOnlyArray(container.typecode, container)
+    return container
+
+def read_only_rows(index):
+    # read_only of an index whose rows are containers, with each row made read-only first. The rows of a read-only index already are
+    if isinstance(index, ReadOnlyDict):
+        return index
+    for key, row in index.items():
+        read_only_row = read_only(row)
+        if read_only_row is not row:
+            index[key] = read_only_row
+    return read_only(index)
+
+def plain_rows(index):
+    # a plain copy of an index and its rows, for pickling. Read-only rows pickle through __reduce__, several times slower
+    return {key: array(row.typecode, row) if isinstance(row, array) else row.copy() for key, row in index.items()}
+
+_WRITABLE_TYPES = {ReadOnlyDict: WritableDict, ReadOnlySet: WritableSet, ReadOnlyList: WritableList, dict: WritableDict, set: WritableSet, list: WritableList}
+
+def writable_copy(container):
+    writable_type = _WRITABLE_TYPES.get(type(container))
+    if writable_type is not None:
+        return writable_type(container)
+    if isinstance(container, array):
+        return WritableArray(container.typecode, container)
+    return container.copy() # an IdInterner
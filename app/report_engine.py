@@ -0,0 +1,98 @@
+from app.model import Course
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import math
+import multiprocessing
+import threading
+
+# Report of one course: the average of every assignment and student, None where there are no submissions yet, and the top five
+class CourseReport(NamedTuple):
+    course_id: Any
+    course_name: str
+    assignment_averages: Dict[Any, Optional[int]]
+    student_averages: Dict[Any, Optional[int]]
+    top_students: List[Any]
+
+def course_report(course: Course) -> CourseReport:
+    assignment_averages = {assignment_id: _average(course.get_assignment_grade_total(assignment_id)) for assignment_id in course.assignments}
+    student_averages = {student_id: _average(course.get_student_grade_total(student_id)) for student_id in course.students}
+    return CourseReport(course.id, course.name, assignment_averages, student_averages, course.get_top_five_students())
+
+def serial_reports(courses: Iterable[Course]) -> Iterator[CourseReport]:
+    return map(course_report, courses)
+
+# What a worker needs to report on a course, in builtins that pickle compactly: ids, the grade totals of the ids (None
+# without submissions) and the ids of the top five. Grades themselves are not shipped, the totals already sum them
+def pack_course(course: Course) -> Tuple:
+    assignment_ids = list(course.assignments)
+    student_ids = list(course.students)
+    return (course.id, course.name, assignment_ids, list(map(course.assignment_grade_totals.get, assignment_ids)),
+            student_ids, list(map(course.student_grade_totals.get, student_ids)), course.get_top_five_students())
+
+def report_from_packed_course(packed_course: Tuple) -> CourseReport:
+    course_id, course_name, assignment_ids, assignment_totals, student_ids, student_totals, top_students = packed_course
+    return CourseReport(course_id, course_name, dict(zip(assignment_ids, map(_average, assignment_totals))), dict(zip(student_ids, map(_average, student_totals))), top_students)
+
+def _average(grade_total) -> Optional[int]:
+    if not grade_total or not grade_total[1]:
+        return None
+    return math.floor(grade_total[0] / grade_total[1])
+
+# Courses of the report being started. Workers forked for it inherit the list, so its courses reach them without being
+# serialised. The lock keeps two reports from forking over each other's list
+_shared_courses: List[Course] = []
+_shared_courses_lock = threading.Lock()
+
+def _report_shared_courses(start: int, stop: int) -> List[CourseReport]:
+    return [course_report(course) for course in _shared_courses[start:stop]]
+
+def _report_packed_courses(packed_courses: List[Tuple]) -> List[CourseReport]:
+    return [report_from_packed_course(packed_course) for packed_course in packed_courses]
+
+'''
+Reports on courses in a pool of worker processes and yields the reports in the order of the courses, equal to serial_reports.
+Where processes can be forked, the courses are listed in the calling process and a pool is forked over the list, so workers
+read the courses from memory shared copy-on-write and a task is only a range of positions in it. Elsewhere, courses are
+packed into compact tuples of ids and totals and shipped to the workers in chunks. Either way at most max_pending chunks of
+chunk_size courses are in flight, which bounds the reports held in memory at once
+'''
+class ParallelReportEngine:
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 200, max_pending: Optional[int] = None, share_memory: bool = True) -> None:
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1")
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending if max_pending is not None else 2 * (workers or multiprocessing.cpu_count())
+        self.share_memory = share_memory and 'fork' in multiprocessing.get_all_start_methods()
+
+    def reports(self, courses: Iterable[Course]) -> Iterator[CourseReport]:
+        if self.share_memory:
+            return self._reports_from_shared_courses(list(courses))
+        return self._reports_from_packed_courses(iter(courses))
+
+    def _reports_from_shared_courses(self, courses: List[Course]) -> Iterator[CourseReport]:
+        global _shared_courses
+        chunks = ((start, min(start + self.chunk_size, len(courses))) for start in range(0, len(courses), self.chunk_size))
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            with _shared_courses_lock:
+                _shared_courses = courses
+                try:
+                    pending = deque(executor.submit(_report_shared_courses, *chunk) for chunk in islice(chunks, 1)) # forks every worker
+                finally:
+                    _shared_courses = []
+            yield from self._in_order(executor, _report_shared_courses, chunks, pending)
+
+    def _reports_from_packed_courses(self, courses: Iterator[Course]) -> Iterator[CourseReport]:
+        chunks = iter(lambda: ([pack_course(course) for course in islice(courses, self.chunk_size)],), ([],))
+        with ProcessPoolExecutor(self.workers) as executor:
+            yield from self._in_order(executor, _report_packed_courses, chunks, deque())
+
+    def _in_order(self, executor, report_chunk: Callable, chunks: Iterator[Tuple], pending: deque) -> Iterator[CourseReport]:
+        for chunk in chunks:
+            pending.append(executor.submit(report_chunk, *chunk))
+            if len(pending) >= self.max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,248 @@
+from app.course_repository import CourseRepository
+from app.course_repository_impl import CourseRepositoryImpl
+from app.id_allocator import IdAllocator, CounterIdAllocator
+from app.model import Course, CourseSummary, TranscriptEntry
+from heapq import merge
+from itertools import count, islice
+from typing import Any, Dict, List, Optional, Tuple
+import multiprocessing
+import threading
+
+'''
+Serves one shard in a worker process: a CourseRepositoryImpl holding the courses routed to it. Requests arrive over the
+pipe as (operation, args) and are answered with (True, result) or (False, exception), one at a time.
+
+A write of CourseServiceImpl arrives whole, as update_course, and loads, changes and saves the course in one request.
+Writes through a _ShardCourse run here against a working copy of the course, keyed by the course id and the token of
+the handle that made it. Committing saves the working copy. A handle with another token starts over from the stored
+course, so the changes of a handle that was never saved, e.g. a batch that raised, are dropped
+'''
+def _serve_shard(connection) -> None:
+    course_repository = CourseRepositoryImpl()
+    working_copies: Dict[Any, Tuple[int, Course]] = dict() # { course_id : (token, course) }
+
+    def working_copy(course_id, token) -> Course:
+        token_and_course = working_copies.get(course_id)
+        if token_and_course is None or token_and_course[0] != token:
+            token_and_course = working_copies[course_id] = (token, course_repository.get_course(course_id))
+        return token_and_course[1]
+
+    def mutate(course_id, token, mutator, args):
+        course = working_copy(course_id, token)
+        change_count = len(course.pending_changes)
+        return getattr(course, mutator)(*args), course.pending_changes[change_count:]
+
+    def checkout(course_id, token) -> Course:
+        token_and_course = working_copies.get(course_id)
+        return token_and_course[1] if token_and_course is not None and token_and_course[0] == token else course_repository.get_course(course_id)
+
+    def commit(course_id, token, changes) -> None:
+        # a handle that read its course commits the changes it made locally on top of the stored course
+        token_and_course = working_copies.pop(course_id, None)
+        if changes is not None:
+            course = course_repository.get_course(course_id)
+            course.apply_changes(changes)
+        elif token_and_course is not None and token_and_course[0] == token:
+            course = token_and_course[1]
+        else:
+            raise Exception(f"Course {course_id} was changed by another writer before this one saved!")
+        course_repository.save_course(course)
+
+    def update_course(course_id, mutator, calls):
+        course = course_repository.get_course(course_id)
+        results = [getattr(course, mutator)(*args) for args in calls]
+        changes = course.pending_changes # the save replaces the list
+        course_repository.save_course(course)
+        working_copies.pop(course_id, None) # a handle that changed the course before can no longer commit over this write
+        return results, changes
+
+    def delete_course(course_id) -> bool:
+        working_copies.pop(course_id, None)
+        return course_repository.delete_course(course_id)
+
+    operations = {'mutate': mutate, 'checkout': checkout, 'commit': commit, 'update_course': update_course, 'delete_course': delete_course}
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError: # the router went away
+            return
+        if request is None:
+            return
+        operation, args = request
+        try:
+            handler = operations.get(operation) or getattr(course_repository, operation)
+            response = (True, handler(*args))
+        except Exception as error:
+            response = (False, error)
+        try:
+            connection.send(response)
+        except Exception as error: # e.g. an exception that does not pickle
+            connection.send((False, Exception(repr(error))))
+
+class _Shard:
+    def __init__(self, context) -> None:
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_serve_shard, args=(worker_connection,), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        self.lock = threading.Lock() # a pipe carries one request and its response at a time
+
+    def call(self, operation: str, *args):
+        with self.lock:
+            self.connection.send((operation, args))
+            succeeded, result = self.connection.recv()
+        if not succeeded:
+            raise result
+        return result
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.send(None)
+            self.connection.close()
+        self.process.join()
+
+'''
+Course returned by ShardedCourseRepository.get_course. It does not fetch the course: the four mutators run in the shard
+that owns it and pending_changes collects the changes they made, so a write through a handle, e.g. in a transaction or
+from the async service, sends each mutation and the save, but never the course. Reading any other attribute fetches the course once, with the changes made through the
+handle so far, and from then on the handle works on that local copy and its save sends the changes to replay
+'''
+class _ShardCourse:
+    def __init__(self, shard: _Shard, course_id, token: int) -> None:
+        self.id = course_id
+        self.pending_changes = []
+        self._shard = shard
+        self._token = token
+        self._course: Optional[Course] = None
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._course is None:
+            self._course = self._shard.call('checkout', self.id, self._token)
+            self.pending_changes = self._course.pending_changes
+        return getattr(self._course, name)
+
+    def _mutate(self, mutator: str, *args):
+        if self._course is not None:
+            return getattr(self._course, mutator)(*args)
+        result, changes = self._shard.call('mutate', self.id, self._token, mutator, args)
+        self.pending_changes.extend(changes)
+        return result
+
+    def create_assignment(self, assignment_name, new_assignment_id=None):
+        return self._mutate('create_assignment', assignment_name, new_assignment_id)
+
+    def enroll_student(self, student_id) -> bool:
+        return self._mutate('enroll_student', student_id)
+
+    def dropout_student(self, student_id) -> bool:
+        return self._mutate('dropout_student', student_id)
+
+    def submit_assignment(self, student_id, assignment_id, grade) -> bool:
+        return self._mutate('submit_assignment', student_id, assignment_id, grade)
+
+    def is_new(self) -> bool:
+        return False
+
+    def mark_persisted(self) -> None:
+        if self._course is None:
+            self.pending_changes = []
+        else:
+            self._course.mark_persisted()
+            self.pending_changes = self._course.pending_changes
+
+'''
+CourseRepository that partitions courses by hash of course id across worker processes, each holding its shard in a
+CourseRepositoryImpl of its own, and routes every call to the shards over pipes. Ids are allocated here, so routing never
+asks a worker. Calls to different shards from different threads run in parallel; one thread waits on each call.
+
+update_course sends a whole write, batch or not, to the owning shard in one request; CourseServiceImpl makes all its writes
+with it. get_course returns a handle that runs writes in the owning shard, see _ShardCourse. Other courses are shipped whole:
+new courses on save, and the courses of get_all_courses, the pages and the student queries, which are merged by id.
+Saving a course that was shipped here sends its pending changes, replayed on the stored course like a log.
+Call close to stop the workers
+'''
+class ShardedCourseRepository(CourseRepository):
+    def __init__(self, shards: int = None, id_allocator: IdAllocator = None, mp_context=None) -> None:
+        context = mp_context if mp_context is not None else multiprocessing.get_context()
+        self.shards = [_Shard(context) for _ in range(shards or multiprocessing.cpu_count())]
+        self.id_allocator = id_allocator if id_allocator is not None else CounterIdAllocator()
+        self._tokens = count(1)
+        super().__init__()
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+    def next_id(self) -> int:
+        return self.id_allocator.next_id()
+
+    def get_course(self, course_id: int) -> Course:
+        return _ShardCourse(self._shard_for(course_id), course_id, next(self._tokens))
+
+    def save_course(self, course: Course) -> None:
+        if not course.pending_changes:
+            return
+        if isinstance(course, _ShardCourse):
+            self._shard_for(course.id).call('commit', course.id, course._token, course.pending_changes if course._course is not None else None)
+        elif course.is_new():
+            self._shard_for(course.id).call('save_course', course)
+        else:
+            self._shard_for(course.id).call('commit', course.id, None, course.pending_changes)
+        course.mark_persisted()
+
+    def update_course(self, course_id: int, mutator: str, calls: List[Tuple]) -> Tuple[List, List]:
+        # calls a mutator of the course once per args tuple of calls and saves it, unless a call raised, in the owning shard.
+        # Returns the results of the calls and the changes saved
+        return self._shard_for(course_id).call('update_course', course_id, mutator, calls)
+
+    def delete_course(self, course_id: int) -> bool:
+        return self._shard_for(course_id).call('delete_course', course_id)
+
+    def get_all_courses(self) -> List[Course]:
+        return list(merge(*(shard.call('get_all_courses') for shard in self.shards), key=lambda course: course.id))
+
+    def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        return self._merged_page('get_course_page', after_course_id, limit)
+
+    def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        return self._merged_page('get_course_summary_page', after_course_id, limit)
+
+    def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        return self._shard_for(course_id).call('get_assignment_grade_total', course_id, assignment_id)
+
+    def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        return self._shard_for(course_id).call('get_student_grade_total', course_id, student_id)
+
+    def get_courses_for_student(self, student_id) -> List[Course]:
+        return list(merge(*(shard.call('get_courses_for_student', student_id) for shard in self.shards), key=lambda course: course.id))
+
+    def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        return list(merge(*(shard.call('get_student_transcript', student_id) for shard in self.shards), key=lambda entry: entry.course_id))
+
+    def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        return self._shard_for(course_id).call('get_assignment_grade_histogram', course_id, assignment_id)
+
+    def get_grade_histogram(self, course_id: int) -> List[int]:
+        return self._shard_for(course_id).call('get_grade_histogram', course_id)
+
+    def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        return self._shard_for(course_id).call('get_top_k_students', course_id, k)
+
+    def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        return self._shard_for(course_id).call('get_bottom_k_students', course_id, k)
+
+    def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        return self._shard_for(course_id).call('get_students_by_average', course_id, lowest, highest)
+
+    def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        return list(merge(*(shard.call('get_students_by_average_in_all_courses', lowest, highest) for shard in self.shards), key=lambda students: students[0]))
+
+    def _shard_for(self, course_id) -> _Shard:
+        return self.shards[hash(course_id) % len(self.shards)]
+
+    def _merged_page(self, operation: str, after_course_id: Optional[int], limit: int) -> List:
+        # every shard's page starts after the same cursor, so the first limit items of their merge are the page
+        pages = [shard.call(operation, after_course_id, limit) for shard in self.shards]
+        return list(islice(merge(*pages, key=lambda item: item.id), limit))
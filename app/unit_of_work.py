@@ -0,0 +1,121 @@
+from app.course_repository import CourseRepository
+from app.model import Course, CourseSummary, TranscriptEntry
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+'''
+CourseRepository for the length of one transaction, over the repository it commits to. The courses it was opened for are
+loaded once and kept in an identity map, so every operation of the transaction works on the same Course, and saving one only
+leaves its changes pending on it. Courses created in the transaction join the map the same way. Projections on courses in the
+map are answered from them, so the transaction reads its own writes; other courses, and the listings, student and cross-course
+queries, read what is committed. Nothing reaches the underlying repository until the caller saves the courses and applies the
+deletions, so dropping a unit of work rolls it back
+'''
+class UnitOfWork(CourseRepository):
+    def __init__(self, course_repository: CourseRepository, course_ids: Iterable) -> None:
+        self.course_repository = course_repository
+        self.course_ids = set(course_ids)
+        self.courses: Dict[int, Course] = dict() # { course_id : course } identity map of the courses loaded or created so far
+        self.deleted_course_ids: Set[int] = set()
+        super().__init__()
+
+    def next_id(self) -> int:
+        return self.course_repository.next_id()
+
+    def get_course(self, course_id: int) -> Course:
+        course = self.courses.get(course_id)
+        if course is not None:
+            return course
+        self._check_exists(course_id)
+        course = self.course_repository.get_course(course_id)
+        if course_id in self.course_ids:
+            self.courses[course_id] = course
+        return course
+
+    def save_course(self, course: Course) -> None:
+        if self.courses.get(course.id) is course:
+            return
+        if course.is_new():
+            self.courses[course.id] = course
+            self.course_ids.add(course.id)
+            return
+        raise Exception(f"Course {course.id} is not part of this transaction!")
+
+    def delete_course(self, course_id: int) -> bool:
+        if course_id not in self.course_ids:
+            raise Exception(f"Course {course_id} is not part of this transaction!")
+        try:
+            self.get_course(course_id)
+        except Exception: # it never existed or is already deleted
+            return False
+        del self.courses[course_id]
+        self.deleted_course_ids.add(course_id)
+        return True
+
+    def get_all_courses(self) -> List[Course]:
+        return self.course_repository.get_all_courses()
+
+    def get_course_page(self, after_course_id: Optional[int], limit: int) -> List[Course]:
+        return self.course_repository.get_course_page(after_course_id, limit)
+
+    def get_course_summary_page(self, after_course_id: Optional[int], limit: int) -> List[CourseSummary]:
+        return self.course_repository.get_course_summary_page(after_course_id, limit)
+
+    def get_courses_for_student(self, student_id) -> List[Course]:
+        return self.course_repository.get_courses_for_student(student_id)
+
+    def get_student_transcript(self, student_id) -> List[TranscriptEntry]:
+        return self.course_repository.get_student_transcript(student_id)
+
+    def get_assignment_grade_total(self, course_id: int, assignment_id: int) -> Optional[Tuple[int, int]]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_assignment_grade_total(course_id, assignment_id)
+        return course.get_assignment_grade_total(assignment_id)
+
+    def get_student_grade_total(self, course_id: int, student_id: int) -> Optional[Tuple[int, int]]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_student_grade_total(course_id, student_id)
+        return course.get_student_grade_total(student_id)
+
+    def get_assignment_grade_histogram(self, course_id: int, assignment_id: int) -> Optional[List[int]]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_assignment_grade_histogram(course_id, assignment_id)
+        return course.get_assignment_grade_histogram(assignment_id)
+
+    def get_grade_histogram(self, course_id: int) -> List[int]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_grade_histogram(course_id)
+        return course.get_grade_histogram()
+
+    def get_top_k_students(self, course_id: int, k: int) -> List[int]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_top_k_students(course_id, k)
+        return course.get_top_k_students(k)
+
+    def get_bottom_k_students(self, course_id: int, k: int) -> List[int]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_bottom_k_students(course_id, k)
+        return course.get_bottom_k_students(k)
+
+    def get_students_by_average(self, course_id: int, lowest: Optional[float], highest: Optional[float]) -> List[int]:
+        course = self._loaded_course(course_id)
+        if course is None:
+            return self.course_repository.get_students_by_average(course_id, lowest, highest)
+        return course.get_students_by_average(lowest, highest)
+
+    def get_students_by_average_in_all_courses(self, lowest: Optional[float], highest: Optional[float]) -> List[Tuple[int, int]]:
+        return self.course_repository.get_students_by_average_in_all_courses(lowest, highest)
+
+    def _loaded_course(self, course_id: int) -> Optional[Course]:
+        # the course as this transaction left it, or None when the committed course can answer
+        self._check_exists(course_id)
+        return self.courses.get(course_id)
+
+    def _check_exists(self, course_id: int) -> None:
+        if course_id in self.deleted_course_ids:
+            raise Exception(f"Course {course_id} does not exist!")
@@ -0,0 +1,161 @@
+from typing import Any, Iterator, List, Optional, Tuple
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+'''
+Append-only log of records in a directory, with snapshots for fast restarts.
+
+Records go to numbered log files (wal.<generation>) as length and crc32 framed pickles. Every append is written to the OS
+right away, so a crashed process loses nothing, while fsync is batched (group commit): the appending thread syncs once
+group_commit_size records are pending, and a background thread syncs the records pending for group_commit_interval seconds.
+append returns before its record is synced, so an OS crash or power cut loses at most the records appended in the last
+group_commit_interval seconds, plus the time an fsync takes. sync() forces it. A torn record at the end of the last file,
+e.g. from a power cut mid write, ends the replay.
+
+A snapshot is taken in two steps: rotate() switches appends to a new generation, then write_snapshot() atomically replaces the
+snapshot file with the state as of that switch and deletes the older log files. Recovery loads the snapshot and replays every
+log file from the generation it names, so a crash at any point of that sequence replays exactly the records the snapshot does not contain
+'''
+class WriteAheadLog:
+    RECORD_HEADER = struct.Struct('<II') # payload length, crc32 of the payload
+    SNAPSHOT_FILE_NAME = 'snapshot'
+
+    def __init__(self, directory: str, group_commit_size: int = 64, group_commit_interval: float = 0.01) -> None:
+        self.directory = directory
+        self.group_commit_size = group_commit_size
+        self.group_commit_interval = group_commit_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._records_pending = threading.Condition(self._lock) # wakes the flusher when the first record of a batch is appended
+        self._flusher = None
+        self._file = None
+        self._generation = None
+        self._pending_records = 0
+        self._first_pending_time = None # when the oldest record not yet synced was appended
+        self.records_since_snapshot = 0
+
+    def recover(self) -> Tuple[Optional[Any], Iterator[Any]]:
+        # returns the snapshot state (None without a snapshot) and an iterator over the records logged after it.
+        # Appending is possible once the iterator is exhausted
+        snapshot_generation, state = 0, None
+        snapshot_path = os.path.join(self.directory, self.SNAPSHOT_FILE_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as snapshot_file:
+                snapshot_generation, state = pickle.load(snapshot_file)
+        return state, self._replay(snapshot_generation)
+
+    def append(self, record: Any) -> None:
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._file.write(self.RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            self._pending_records += 1
+            self.records_since_snapshot += 1
+            if self._pending_records >= self.group_commit_size:
+                self._sync_locked()
+            elif self._pending_records == 1:
+                self._first_pending_time = time.monotonic()
+                self._records_pending.notify()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync_locked()
+
+    def rotate(self) -> int:
+        # switches appends to a new log file and returns its generation. A snapshot of the state as of this switch is
+        # passed to write_snapshot with that generation
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+            self._open_generation(self._generation + 1)
+            self.records_since_snapshot = 0
+            return self._generation
+
+    def write_snapshot(self, generation: int, state: Any) -> None:
+        snapshot_path = os.path.join(self.directory, self.SNAPSHOT_FILE_NAME)
+        with open(snapshot_path + '.tmp', 'wb') as snapshot_file:
+            pickle.dump((generation, state), snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(snapshot_path + '.tmp', snapshot_path)
+        self._sync_directory()
+        for old_generation in self._generations():
+            if old_generation < generation:
+                os.remove(self._log_path(old_generation))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._sync_locked()
+                self._file.close()
+                self._file = None
+            self._records_pending.notify()
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.join()
+
+    def _flush(self) -> None:
+        # the flusher thread: syncs the pending records once the oldest has waited group_commit_interval, until the log is closed
+        with self._lock:
+            while self._file is not None:
+                if not self._pending_records:
+                    self._records_pending.wait()
+                    continue
+                delay = self._first_pending_time + self.group_commit_interval - time.monotonic()
+                if delay > 0:
+                    self._records_pending.wait(delay)
+                else:
+                    self._sync_locked()
+
+    def _replay(self, snapshot_generation: int) -> Iterator[Any]:
+        generations = [generation for generation in self._generations() if generation >= snapshot_generation]
+        for generation in generations:
+            with open(self._log_path(generation), 'r+b') as log_file:
+                valid_length = 0
+                for record, end_offset in self._read_records(log_file):
+                    valid_length = end_offset
+                    yield record
+                log_file.truncate(valid_length) # drop a torn record so that new appends follow the last valid one
+        self._open_generation(max(generations + [snapshot_generation]))
+
+    def _read_records(self, log_file) -> Iterator[Tuple[Any, int]]:
+        while True:
+            header = log_file.read(self.RECORD_HEADER.size)
+            if len(header) < self.RECORD_HEADER.size:
+                return
+            length, crc = self.RECORD_HEADER.unpack(header)
+            payload = log_file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield pickle.loads(payload), log_file.tell()
+
+    def _open_generation(self, generation: int) -> None:
+        self._generation = generation
+        self._file = open(self._log_path(generation), 'ab')
+        self._sync_directory()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush, name=f'wal-flusher-{self.directory}', daemon=True)
+            self._flusher.start()
+
+    def _sync_locked(self) -> None:
+        if self._pending_records:
+            os.fsync(self._file.fileno())
+            self._pending_records = 0
+
+    def _sync_directory(self) -> None:
+        # makes created, renamed and deleted files durable
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def _generations(self) -> List[int]:
+        return sorted(int(file_name[len('wal.'):]) for file_name in os.listdir(self.directory) if file_name.startswith('wal.') and file_name[len('wal.'):].isdigit())
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'wal.{generation}')
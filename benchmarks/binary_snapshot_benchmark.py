@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.binary_snapshot import BinarySnapshotCourseRepository, write_binary_snapshot
+from app.course_repository_impl import CourseRepositoryImpl
+from app.model import Course
+
+'''
+Open time, Python heap and query latency of an archive served from a binary snapshot, against the same courses held
+in a CourseRepositoryImpl. The heap is measured with tracemalloc, which does not count pages of the memory map
+
+    python benchmarks/binary_snapshot_benchmark.py --courses 2000
+'''
+def build_courses(course_count, students_per_course, assignments_per_course):
+    for course_id in range(1, course_count + 1):
+        course = Course(course_id, f"Course {course_id}")
+        assignment_ids = [course.create_assignment(f"Assignment {number}", course_id * 1000 + number) for number in range(assignments_per_course)]
+        for student_id in range(students_per_course):
+            course.enroll_student(student_id)
+            for assignment_id in assignment_ids:
+                course.submit_assignment(student_id, assignment_id, (student_id * 7 + assignment_id) % 101)
+        yield course
+
+def measure_queries(course_repository, course_count, queries):
+    randomness = random.Random(1)
+    course_ids = [randomness.randint(1, course_count) for _ in range(queries)]
+    started = time.perf_counter()
+    for course_id in course_ids:
+        course_repository.get_top_k_students(course_id, 5)
+        course_repository.get_student_grade_total(course_id, 0)
+        course_repository.get_assignment_grade_total(course_id, course_id * 1000)
+    return (time.perf_counter() - started) / queries / 3
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--students-per-course', type=int, default=100)
+    parser.add_argument('--assignments-per-course', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=10000)
+    arguments = parser.parse_args()
+    workload = (arguments.courses, arguments.students_per_course, arguments.assignments_per_course)
+    directory = tempfile.mkdtemp(prefix='binary_snapshot_benchmark_')
+    path = os.path.join(directory, 'courses.bin')
+
+    try:
+        started = time.perf_counter()
+        write_binary_snapshot(path, build_courses(*workload))
+        print(f"build and write: {time.perf_counter() - started:8.2f} s  file {os.path.getsize(path) / 2 ** 20:,.1f} MiB")
+
+        tracemalloc.start()
+        course_repository = CourseRepositoryImpl()
+        for course in build_courses(*workload):
+            course_repository.save_course(course)
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"in-memory:       heap {heap / 2 ** 20:8.1f} MiB  query {measure_queries(course_repository, arguments.courses, arguments.queries) * 1e6:6.2f} us")
+        del course_repository
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        course_repository = BinarySnapshotCourseRepository(path)
+        opened = time.perf_counter() - started
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"binary snapshot: heap {heap / 2 ** 20:8.1f} MiB  query {measure_queries(course_repository, arguments.courses, arguments.queries) * 1e6:6.2f} us  open {opened * 1e3:.2f} ms")
+        course_repository.close()
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.change_feed import ChangeFeed, ChangeFeedRepository, StudentGpaView
+from app.course_repository_impl import CourseRepositoryImpl
+from app.course_service_impl import CourseServiceImpl
+
+'''
+Cost of keeping an institution-wide top-N of students by average grade with the change feed, against recomputing it
+from get_courses after each write as polling consumers do. Submissions are timed through a service without a feed, and
+through one whose feed maintains a StudentGpaView; the top-N is then read from the view and recomputed from get_courses
+
+    python benchmarks/change_feed_benchmark.py --courses 200 --students 200
+'''
+def populate(course_service, arguments):
+    randomness = random.Random(1)
+    course_ids, assignment_ids = [], []
+    for number in range(arguments.courses):
+        course_id = course_service.create_course(f"Course {number}")
+        course_service.enroll_students(course_id, randomness.sample(range(arguments.courses * arguments.students // 4), arguments.students))
+        course_ids.append(course_id)
+        assignment_ids.append(course_service.create_assignment(course_id, "Assignment 1"))
+    started = time.perf_counter()
+    for course_id, assignment_id in zip(course_ids, assignment_ids):
+        students = course_service.get_course_by_id(course_id).students
+        course_service.submit_assignments(course_id, [(student_id, assignment_id, randomness.randint(0, 100)) for student_id in students])
+    return time.perf_counter() - started
+
+def recomputed_top_students(course_service, n):
+    grade_totals = dict()
+    for course in course_service.get_courses():
+        for student_id, (grade_sum, grade_count) in course.student_grade_totals.items():
+            if student_id not in course.students: # dropouts keep their grades in the course, but not in the view
+                continue
+            previous_sum, previous_count = grade_totals.get(student_id, (0, 0))
+            grade_totals[student_id] = (previous_sum + grade_sum, previous_count + grade_count)
+    rankings = sorted((-(grade_sum / grade_count), student_id) for student_id, (grade_sum, grade_count) in grade_totals.items() if grade_count)
+    return [student_id for _, student_id in rankings[:n]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--students', type=int, default=200, help='students enrolled per course')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--reads', type=int, default=20)
+    arguments = parser.parse_args()
+    submissions = arguments.courses * arguments.students
+
+    seconds = populate(CourseServiceImpl(CourseRepositoryImpl()), arguments)
+    print(f"submissions without feed:   {seconds * 1e6 / submissions:8.2f} us/submission")
+    change_feed, view = ChangeFeed(), StudentGpaView()
+    change_feed.attach(view)
+    course_service = CourseServiceImpl(ChangeFeedRepository(CourseRepositoryImpl(), change_feed))
+    seconds = populate(course_service, arguments)
+    print(f"submissions with gpa view:  {seconds * 1e6 / submissions:8.2f} us/submission")
+
+    started = time.perf_counter()
+    for _ in range(arguments.reads):
+        top_students = view.get_top_students(arguments.top)
+    print(f"top {arguments.top} from view:       {(time.perf_counter() - started) * 1e6 / arguments.reads:10.1f} us")
+    started = time.perf_counter()
+    for _ in range(arguments.reads):
+        recomputed = recomputed_top_students(course_service, arguments.top)
+    print(f"top {arguments.top} recomputed:      {(time.perf_counter() - started) * 1e6 / arguments.reads:10.1f} us")
+    assert top_students == recomputed
+
+if __name__ == '__main__':
+    main()
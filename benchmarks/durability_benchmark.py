@@ -0,0 +1,81 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.course_repository_impl import CourseRepositoryImpl
+from app.course_service_impl import CourseServiceImpl
+from app.durable_course_repository import DurableCourseRepository
+
+'''
+Write throughput and restart time of DurableCourseRepository, with the in-memory repository as the baseline for writes.
+Loads the given number of submissions through CourseServiceImpl, batch_size submissions per service call, then reopens
+the directory twice: once replaying the whole log and once from a snapshot.
+
+    python benchmarks/durability_benchmark.py --submissions 1000000
+'''
+def load(course_service, submissions, students_per_course, assignments_per_course, batch_size):
+    started = time.perf_counter()
+    submitted = 0
+    while submitted < submissions:
+        course_id = course_service.create_course("Course")
+        assignment_ids = course_service.create_assignments(course_id, [f"Assignment {number}" for number in range(assignments_per_course)])
+        course_service.enroll_students(course_id, range(students_per_course))
+        course_submissions = [(student_id, assignment_id, (student_id * 7 + assignment_number) % 101) for assignment_number, assignment_id in enumerate(assignment_ids) for student_id in range(students_per_course)]
+        course_submissions = course_submissions[:submissions - submitted]
+        for start in range(0, len(course_submissions), batch_size):
+            course_service.submit_assignments(course_id, course_submissions[start:start + batch_size])
+        submitted += len(course_submissions)
+    return time.perf_counter() - started
+
+def reopen(directory):
+    started = time.perf_counter()
+    course_repository = DurableCourseRepository(directory, snapshot_interval=sys.maxsize)
+    elapsed = time.perf_counter() - started
+    submission_count = sum(course_summary.submission_count for course_summary in CourseServiceImpl(course_repository).iter_course_summaries(page_size=1000))
+    return course_repository, elapsed, submission_count
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, file_name)) for file_name in os.listdir(directory))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submissions', type=int, default=1_000_000)
+    parser.add_argument('--students-per-course', type=int, default=1000)
+    parser.add_argument('--assignments-per-course', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=10, help='submissions per submit_assignments call, 1 for single writes')
+    parser.add_argument('--group-commit-size', type=int, default=64)
+    parser.add_argument('--directory', help='where to write the log, a temporary directory by default')
+    arguments = parser.parse_args()
+    directory = arguments.directory or tempfile.mkdtemp(prefix='durability_benchmark_')
+    workload = (arguments.submissions, arguments.students_per_course, arguments.assignments_per_course, arguments.batch_size)
+
+    try:
+        elapsed = load(CourseServiceImpl(CourseRepositoryImpl()), *workload)
+        print(f"in-memory writes:      {elapsed:8.2f} s  {arguments.submissions / elapsed:12,.0f} submissions/s")
+
+        course_repository = DurableCourseRepository(directory, snapshot_interval=sys.maxsize, group_commit_size=arguments.group_commit_size)
+        elapsed = load(CourseServiceImpl(course_repository), *workload)
+        course_repository.close()
+        print(f"durable writes:        {elapsed:8.2f} s  {arguments.submissions / elapsed:12,.0f} submissions/s  log {directory_size(directory) / 2 ** 20:,.1f} MiB")
+
+        course_repository, elapsed, submission_count = reopen(directory)
+        print(f"restart from log:      {elapsed:8.2f} s  {submission_count:,} submissions")
+        started = time.perf_counter()
+        course_repository.snapshot()
+        course_repository.close()
+        print(f"snapshot:              {time.perf_counter() - started:8.2f} s  snapshot {directory_size(directory) / 2 ** 20:,.1f} MiB")
+
+        course_repository, elapsed, submission_count = reopen(directory)
+        course_repository.close()
+        print(f"restart from snapshot: {elapsed:8.2f} s  {submission_count:,} submissions")
+    finally:
+        if arguments.directory is None:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
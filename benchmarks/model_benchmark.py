@@ -0,0 +1,68 @@
+import argparse
+import gc
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.course_repository_impl import CourseRepositoryImpl
+from app.model import Course
+
+'''
+Memory and time of the per-object work the repository does on courses and documents, over every course of a populated
+CourseRepositoryImpl: loading a course from its document, storing a new version of a document on update, and pickling the
+documents and courses as snapshots and shards do. Containers are shared between courses and documents, so the memory
+measured is that of the objects themselves and their bookkeeping, not of rosters and grades
+
+    python benchmarks/model_benchmark.py --courses 10000
+'''
+def build_repository(course_count, students_per_course, assignments_per_course):
+    course_repository = CourseRepositoryImpl()
+    for course_id in range(1, course_count + 1):
+        course = Course(course_id, f"Course {course_id}")
+        assignment_ids = [course.create_assignment(f"Assignment {number}", course_id * 1000 + number) for number in range(assignments_per_course)]
+        for student_id in range(students_per_course):
+            course.enroll_student(student_id)
+            for assignment_id in assignment_ids[:student_id % (assignments_per_course + 1)]:
+                course.submit_assignment(student_id, assignment_id, (student_id * 7 + assignment_id) % 101)
+        course_repository.save_course(course)
+    return course_repository
+
+def measure(name, course_count, operation):
+    # timed untraced and without the collector, whose passes over every stored container would swamp the objects measured,
+    # then run again to trace the memory it allocates and keeps
+    gc.disable()
+    started = time.perf_counter()
+    operation()
+    seconds = time.perf_counter() - started
+    gc.enable()
+    tracemalloc.start()
+    result = operation()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:18} {seconds * 1e6 / course_count:8.2f} us/course  {allocated / course_count:8.0f} bytes/course")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=10_000)
+    parser.add_argument('--students-per-course', type=int, default=20)
+    parser.add_argument('--assignments-per-course', type=int, default=5)
+    arguments = parser.parse_args()
+    course_repository = build_repository(arguments.courses, arguments.students_per_course, arguments.assignments_per_course)
+    database, course_ids = course_repository.database, list(course_repository.database.course_ids)
+
+    courses = measure('load courses', arguments.courses, lambda: [course_repository.get_course(course_id) for course_id in course_ids])
+    measure('update documents', arguments.courses, lambda: [database.update(course_id, {'name': f"Renamed {course_id}"}) for course_id in course_ids])
+    documents = database.get_all()
+    pickled_documents = measure('pickle documents', arguments.courses, lambda: pickle.dumps(documents, protocol=pickle.HIGHEST_PROTOCOL))
+    measure('unpickle documents', arguments.courses, lambda: pickle.loads(pickled_documents))
+    pickled_courses = measure('pickle courses', arguments.courses, lambda: pickle.dumps(courses, protocol=pickle.HIGHEST_PROTOCOL))
+    measure('unpickle courses', arguments.courses, lambda: pickle.loads(pickled_courses))
+    print(f"{'pickled size':18} {len(pickled_documents) / arguments.courses:8.0f} bytes/document {len(pickled_courses) / arguments.courses:8.0f} bytes/course")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.course_repository_impl import CourseRepositoryImpl
+from app.course_service_impl import CourseServiceImpl
+from app.model import Course
+from app.report_engine import ParallelReportEngine, serial_reports
+
+'''
+Time to report on every course of a service serially and with ParallelReportEngine at several worker counts, checking
+that every run gives the serial output. The engines read the courses through iter_courses, as a nightly report would.
+--packed ships packed courses to the workers instead of forking them over the listed courses. The cpu time of the
+calling process bounds the speedup more cores can give, which shows the headroom on machines with few of them
+
+    python benchmarks/report_benchmark.py --courses 5000 --workers 1 2 4 8
+'''
+def build_service(course_count, students_per_course, assignments_per_course):
+    course_repository = CourseRepositoryImpl()
+    for course_id in range(1, course_count + 1):
+        course = Course(course_id, f"Course {course_id}")
+        assignment_ids = [course.create_assignment(f"Assignment {number}", course_id * 1000 + number) for number in range(assignments_per_course)]
+        for student_id in range(students_per_course):
+            course.enroll_student(student_id)
+            for assignment_id in assignment_ids[:student_id % (assignments_per_course + 1)]: # some students have not submitted anything
+                course.submit_assignment(student_id, assignment_id, (student_id * 7 + assignment_id) % 101)
+        course_repository.save_course(course)
+    return CourseServiceImpl(course_repository)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=5000)
+    parser.add_argument('--students-per-course', type=int, default=200)
+    parser.add_argument('--assignments-per-course', type=int, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--chunk-size', type=int, default=200)
+    parser.add_argument('--packed', action='store_true')
+    arguments = parser.parse_args()
+    course_service = build_service(arguments.courses, arguments.students_per_course, arguments.assignments_per_course)
+    print(f"{os.cpu_count()} cpus")
+
+    started = time.perf_counter()
+    expected = list(serial_reports(course_service.iter_courses()))
+    serial_seconds = time.perf_counter() - started
+    print(f"serial:    {serial_seconds:7.2f} s  {arguments.courses / serial_seconds:10,.0f} courses/s")
+
+    for workers in arguments.workers:
+        engine = ParallelReportEngine(workers, arguments.chunk_size, share_memory=not arguments.packed)
+        started, started_cpu = time.perf_counter(), time.process_time() # includes starting the worker processes, which every report pays
+        reports = list(engine.reports(course_service.iter_courses()))
+        seconds, cpu_seconds = time.perf_counter() - started, time.process_time() - started_cpu
+        if reports != expected:
+            raise AssertionError(f"{workers} workers gave a different report than the serial run")
+        print(f"{workers:2} workers: {seconds:7.2f} s  {arguments.courses / seconds:10,.0f} courses/s  {serial_seconds / seconds:5.2f}x serial  caller cpu {cpu_seconds:5.2f} s, at most {serial_seconds / cpu_seconds:4.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analytics_cache import AnalyticsCache
+from app.columnar_model import ColumnarCourse
+from app.course_repository_impl import CourseRepositoryImpl
+from app.course_service_impl import CourseServiceImpl
+from app.instrumentation import Metrics, instrument
+from app.model import Course
+from benchmarks.workload import Operation, WorkloadGenerator, WorkloadSpec
+
+'''
+Replays a generated workload against CourseServiceImpl and reports, per operation type, throughput, p50/p99 latency and the
+peak memory allocated while an operation runs. Setup follows main.py: each course is created, then students are enrolled,
+assignments created and part of the grid submitted in batches. The timed operations follow, drawn from a read/write mix with
+hot courses chosen by a zipf distribution. Memory is measured in a second, traced replay, as tracing slows every allocation down.
+
+    python benchmarks/run_workload.py --courses 100 --students 200 --operations 100000 --output results.json
+    python benchmarks/run_workload.py --output new.json --compare results.json
+'''
+class WorkloadRunner:
+    def __init__(self, course_service, generator: WorkloadGenerator) -> None:
+        self.course_service = course_service
+        self.generator = generator
+        self.course_ids = []
+        self.assignment_ids = [] # [ [ assignment_id ] by assignment index ] by course index
+        self.latencies = dict() # { operation name : [ nanoseconds ] }
+        self.memory_peaks = dict() # { operation name : [ bytes ] }
+        self.errors = dict() # { operation name : count }
+
+    def setup(self) -> None:
+        spec = self.generator.spec
+        initial_submissions = self.generator.initial_submissions()
+        for course_index in range(spec.courses):
+            course_id = self.timed('setup.create_course', self.course_service.create_course, f"Course {course_index}")
+            self.course_ids.append(course_id)
+            self.timed('setup.enroll_students', self.course_service.enroll_students, course_id, list(range(spec.students_per_course)))
+            assignment_names = [f"Assignment {assignment_index}" for assignment_index in range(spec.assignments_per_course)]
+            self.assignment_ids.append(self.timed('setup.create_assignments', self.course_service.create_assignments, course_id, assignment_names))
+            submissions = [(student_index, self.assignment_ids[course_index][assignment_index], grade) for student_index, assignment_index, grade in initial_submissions]
+            self.timed('setup.submit_assignments', self.course_service.submit_assignments, course_id, submissions)
+
+    def replay(self, operations, trace_memory: bool = False) -> float:
+        started = time.perf_counter()
+        for operation in operations:
+            method, args = self.resolve(operation)
+            if trace_memory:
+                self.traced(operation.name, method, *args)
+            else:
+                self.timed(operation.name, method, *args)
+        return time.perf_counter() - started
+
+    def resolve(self, operation: Operation):
+        course_id = self.course_ids[operation.course_index]
+        assignment_ids = self.assignment_ids[operation.course_index]
+        if operation.name == 'create_assignment':
+            return (lambda: assignment_ids.append(self.course_service.create_assignment(course_id, f"Assignment {len(assignment_ids)}"))), ()
+        if operation.name == 'submit_assignment':
+            student_id, assignment_index, grade = operation.args
+            return self.course_service.submit_assignment, (course_id, student_id, assignment_ids[assignment_index], grade)
+        if operation.name == 'get_assignment_grade_avg':
+            return self.course_service.get_assignment_grade_avg, (course_id, assignment_ids[operation.args[0]])
+        if operation.name == 'get_course_summaries':
+            return self.course_service.get_course_summaries, (course_id, 10)
+        return getattr(self.course_service, operation.name), (course_id, *operation.args)
+
+    def timed(self, name: str, method, *args):
+        started = time.perf_counter_ns()
+        try:
+            return method(*args)
+        except Exception: # e.g. the average of a student without submissions. Failed calls still count as operations
+            self.errors[name] = self.errors.get(name, 0) + 1
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter_ns() - started)
+
+    def traced(self, name: str, method, *args) -> None:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            method(*args)
+        except Exception:
+            pass
+        self.memory_peaks.setdefault(name, []).append(tracemalloc.get_traced_memory()[1] - before)
+
+def percentile(sorted_values, fraction: float):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def summarise(runner: WorkloadRunner):
+    operations = dict()
+    for name, latencies in sorted(runner.latencies.items()):
+        latencies = sorted(latencies)
+        total_seconds = sum(latencies) / 1e9
+        peaks = runner.memory_peaks.get(name)
+        operations[name] = {
+            'count': len(latencies),
+            'errors': runner.errors.get(name, 0),
+            'ops_per_sec': len(latencies) / total_seconds if total_seconds else None,
+            'mean_us': total_seconds * 1e6 / len(latencies),
+            'p50_us': percentile(latencies, 0.50) / 1e3,
+            'p99_us': percentile(latencies, 0.99) / 1e3,
+            'max_us': latencies[-1] / 1e3,
+            'peak_memory_bytes_mean': sum(peaks) / len(peaks) if peaks else None,
+            'peak_memory_bytes_max': max(peaks) if peaks else None,
+        }
+    return operations
+
+def print_report(results) -> None:
+    print(f"{'operation':28} {'count':>8} {'errors':>7} {'ops/s':>11} {'p50 us':>9} {'p99 us':>9} {'peak mem':>10}")
+    for name, stats in results['operations'].items():
+        peak = f"{stats['peak_memory_bytes_max'] / 1024:,.0f} KiB" if stats['peak_memory_bytes_max'] is not None else '-'
+        print(f"{name:28} {stats['count']:>8} {stats['errors']:>7} {stats['ops_per_sec']:>11,.0f} {stats['p50_us']:>9.1f} {stats['p99_us']:>9.1f} {peak:>10}")
+    total = results['replay']
+    print(f"replay: {total['operations']} operations in {total['seconds']:.2f} s, {total['ops_per_sec']:,.0f} ops/s. setup {results['setup_seconds']:.2f} s, peak rss {results['peak_rss_bytes'] / 2 ** 20:,.0f} MiB")
+
+def print_comparison(results, baseline, tolerance: float) -> None:
+    # ratios above 1 are slower than the baseline. Those past the tolerance are flagged
+    print(f"\n{'compared to baseline':28} {'ops/s':>9} {'p50':>9} {'p99':>9}")
+    for name, stats in results['operations'].items():
+        base = baseline['operations'].get(name)
+        if base is None or not base['ops_per_sec'] or not stats['ops_per_sec']:
+            continue
+        ratios = (base['ops_per_sec'] / stats['ops_per_sec'], stats['p50_us'] / base['p50_us'], stats['p99_us'] / base['p99_us'])
+        flag = '  REGRESSION' if any(ratio > 1 + tolerance for ratio in ratios[:2]) else ''
+        print(f"{name:28} " + ' '.join(f"{ratio:>8.2f}x" for ratio in ratios) + flag)
+
+def build_service(arguments, metrics=None):
+    course_type = ColumnarCourse if arguments.engine == 'columnar' else Course
+    analytics_cache = AnalyticsCache() if arguments.cache else None
+    course_service = CourseServiceImpl(CourseRepositoryImpl(), course_type=course_type, analytics_cache=analytics_cache)
+    return instrument(course_service, metrics) if metrics is not None else course_service
+
+def main():
+    defaults = WorkloadSpec()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=defaults.courses)
+    parser.add_argument('--students', type=int, default=defaults.students_per_course, help='students enrolled per course during setup')
+    parser.add_argument('--assignments', type=int, default=defaults.assignments_per_course, help='assignments per course during setup')
+    parser.add_argument('--initial-submissions', type=float, default=defaults.initial_submission_fraction, help='share of each grid submitted during setup')
+    parser.add_argument('--operations', type=int, default=defaults.operations)
+    parser.add_argument('--read-fraction', type=float, default=defaults.read_fraction)
+    parser.add_argument('--skew', type=float, default=defaults.course_skew, help='zipf exponent of course popularity, 0 for uniform')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--engine', choices=['dict', 'columnar'], default='dict', help='storage engine of the courses')
+    parser.add_argument('--cache', action='store_true', help='give the service an analytics cache')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced replay that measures memory per operation')
+    parser.add_argument('--metrics', help='instrument the timed run and write its per-method metrics as json to this file')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--compare', help='json results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown past which a comparison is flagged')
+    arguments = parser.parse_args()
+    spec = WorkloadSpec(arguments.courses, arguments.students, arguments.assignments, arguments.initial_submissions,
+                        arguments.operations, arguments.read_fraction, arguments.skew, arguments.seed)
+
+    metrics = Metrics() if arguments.metrics else None
+    runner = WorkloadRunner(build_service(arguments, metrics), WorkloadGenerator(spec))
+    started = time.perf_counter()
+    runner.setup()
+    setup_seconds = time.perf_counter() - started
+    operations = list(runner.generator.operations())
+    replay_seconds = runner.replay(operations)
+
+    if not arguments.no_memory: # replays the same workload on a fresh service, so it sees the same states as the timed run
+        traced_runner = WorkloadRunner(build_service(arguments), WorkloadGenerator(spec))
+        traced_runner.setup()
+        tracemalloc.start()
+        traced_runner.replay(operations, trace_memory=True)
+        tracemalloc.stop()
+        runner.memory_peaks = traced_runner.memory_peaks
+
+    results = {
+        'spec': spec._asdict(),
+        'engine': arguments.engine,
+        'cache': arguments.cache,
+        'environment': {'python': platform.python_version(), 'implementation': platform.python_implementation(), 'machine': platform.machine(), 'system': platform.system()},
+        'setup_seconds': setup_seconds,
+        'replay': {'operations': len(operations), 'seconds': replay_seconds, 'ops_per_sec': len(operations) / replay_seconds},
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+        'operations': summarise(runner),
+    }
+    print_report(results)
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            print_comparison(results, json.load(baseline_file), arguments.tolerance)
+    if arguments.metrics:
+        with open(arguments.metrics, 'w') as metrics_file:
+            metrics_file.write(metrics.to_json(indent=2))
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.course_repository_impl import CourseRepositoryImpl
+from app.course_service_impl import CourseServiceImpl
+from app.sharded_course_repository import ShardedCourseRepository
+
+'''
+Write throughput of CourseServiceImpl over a single-process CourseRepositoryImpl and over ShardedCourseRepository with
+several shard counts. Client threads submit assignments to courses picked uniformly, so writes spread over every shard.
+Only calls to different shards overlap, and only while the threads wait on their pipes, so more shards than cpus cannot help.
+The cpu time of the client process per submission is printed too: it is what routing costs, and bounds the throughput
+more cores can give
+
+    python benchmarks/sharded_benchmark.py --courses 200 --threads 8 --shards 2 4 8
+'''
+def run(course_repository, arguments):
+    course_service = CourseServiceImpl(course_repository)
+    course_ids, assignment_ids = [], []
+    for number in range(arguments.courses):
+        course_id = course_service.create_course(f"Course {number}")
+        course_service.enroll_students(course_id, list(range(arguments.students)))
+        course_ids.append(course_id)
+        assignment_ids.append(course_service.create_assignments(course_id, [f"Assignment {index}" for index in range(arguments.submissions_per_thread * arguments.threads // arguments.students + 1)]))
+
+    def submit(thread_index):
+        # each thread fills its own slice of student ids, so no submission is a duplicate
+        randomness = random.Random(thread_index)
+        for number in range(arguments.submissions_per_thread):
+            course_index = randomness.randrange(arguments.courses)
+            position = thread_index * arguments.submissions_per_thread + number
+            course_service.submit_assignment(course_ids[course_index], position % arguments.students, assignment_ids[course_index][position // arguments.students], randomness.randint(0, 100))
+
+    threads = [threading.Thread(target=submit, args=(thread_index,)) for thread_index in range(arguments.threads)]
+    started, started_cpu = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    submissions = arguments.threads * arguments.submissions_per_thread
+    return submissions / (time.perf_counter() - started), (time.process_time() - started_cpu) / submissions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--students', type=int, default=200, help='students enrolled per course')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--submissions-per-thread', type=int, default=5000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    arguments = parser.parse_args()
+    print(f"{os.cpu_count()} cpus, {arguments.threads} client threads")
+
+    throughput, cpu_seconds = run(CourseRepositoryImpl(), arguments)
+    print(f"single process: {throughput:10,.0f} submissions/s  client cpu {cpu_seconds * 1e6:6.1f} us/submission")
+    for shards in arguments.shards:
+        course_repository = ShardedCourseRepository(shards)
+        try:
+            throughput, cpu_seconds = run(course_repository, arguments)
+            print(f"{shards:2} shards:      {throughput:10,.0f} submissions/s  client cpu {cpu_seconds * 1e6:6.1f} us/submission")
+        finally:
+            course_repository.close()
+
+if __name__ == '__main__':
+    main()
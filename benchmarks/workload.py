@@ -0,0 +1,95 @@
+from itertools import accumulate
+from typing import Any, Iterator, List, NamedTuple, Tuple
+import random
+
+# Relative frequency of each operation among the reads and among the writes of a workload
+READ_MIX = {
+    'get_assignment_grade_avg': 30,
+    'get_student_grade_avg': 30,
+    'get_top_five_students': 30,
+    'get_course_summaries': 10,
+}
+WRITE_MIX = {
+    'submit_assignment': 85,
+    'enroll_student': 5,
+    'dropout_student': 5,
+    'create_assignment': 5,
+}
+
+class WorkloadSpec(NamedTuple):
+    courses: int = 100
+    students_per_course: int = 200
+    assignments_per_course: int = 10
+    initial_submission_fraction: float = 0.5 # share of the student x assignment grid submitted during setup
+    operations: int = 100_000
+    read_fraction: float = 0.8
+    course_skew: float = 1.0 # zipf exponent of course popularity. 0 picks courses uniformly, higher values focus on a few hot courses
+    seed: int = 1
+
+# An operation refers to courses, students and assignments by their index in the workload. The runner maps indexes to
+# the ids the service hands out, so a workload is generated once and replayed against any service
+class Operation(NamedTuple):
+    name: str
+    course_index: int
+    args: Tuple[Any, ...] = ()
+
+'''
+Generates the operations of a workload. Writes are mostly submissions that fill each course's grid of students and assignments
+in order, so they succeed rather than hit duplicates. Reads pick an existing student or assignment of the chosen course
+'''
+class WorkloadGenerator:
+    def __init__(self, spec: WorkloadSpec) -> None:
+        self.spec = spec
+        self.randomness = random.Random(spec.seed)
+        self.course_weights = list(accumulate(1 / (rank + 1) ** spec.course_skew for rank in range(spec.courses)))
+        self.student_counts = [spec.students_per_course] * spec.courses
+        self.assignment_counts = [spec.assignments_per_course] * spec.courses
+        self.submitted_counts = [self.initial_submission_count()] * spec.courses # submissions fill the grid assignment by assignment
+
+    def initial_submission_count(self) -> int:
+        return int(self.spec.students_per_course * self.spec.assignments_per_course * self.spec.initial_submission_fraction)
+
+    def initial_submissions(self) -> List[Tuple[int, int, int]]:
+        # (student index, assignment index, grade) submitted to every course during setup
+        return [(student_index, assignment_index, self.grade()) for assignment_index, student_index in self.grid_positions(0, self.initial_submission_count())]
+
+    def operations(self) -> Iterator[Operation]:
+        for _ in range(self.spec.operations):
+            course_index = self.randomness.choices(range(self.spec.courses), cum_weights=self.course_weights)[0]
+            if self.randomness.random() < self.spec.read_fraction:
+                yield self.read(self.pick(READ_MIX), course_index)
+            else:
+                yield self.write(self.pick(WRITE_MIX), course_index)
+
+    def read(self, name: str, course_index: int) -> Operation:
+        if name == 'get_assignment_grade_avg': # among the assignments with submissions, as averages of the others are errors
+            assignments_with_submissions = -(-self.submitted_counts[course_index] // self.spec.students_per_course)
+            return Operation(name, course_index, (self.randomness.randrange(max(assignments_with_submissions, 1)),))
+        if name == 'get_student_grade_avg':
+            return Operation(name, course_index, (self.randomness.randrange(self.student_counts[course_index]),))
+        return Operation(name, course_index)
+
+    def write(self, name: str, course_index: int) -> Operation:
+        if name == 'enroll_student':
+            self.student_counts[course_index] += 1
+            return Operation(name, course_index, (self.student_counts[course_index] - 1,))
+        if name == 'dropout_student':
+            return Operation(name, course_index, (self.randomness.randrange(self.student_counts[course_index]),))
+        if name == 'create_assignment':
+            self.assignment_counts[course_index] += 1
+            return Operation(name, course_index)
+        assignment_index, student_index = divmod(self.submitted_counts[course_index], self.spec.students_per_course)
+        if assignment_index >= self.assignment_counts[course_index]: # the grid is full, so the course needs another assignment first
+            self.assignment_counts[course_index] += 1
+            return Operation('create_assignment', course_index)
+        self.submitted_counts[course_index] += 1
+        return Operation(name, course_index, (student_index, assignment_index, self.grade()))
+
+    def grid_positions(self, start: int, stop: int) -> Iterator[Tuple[int, int]]:
+        return (divmod(position, self.spec.students_per_course) for position in range(start, stop))
+
+    def grade(self) -> int:
+        return self.randomness.randint(0, 100)
+
+    def pick(self, mix) -> str:
+        return self.randomness.choices(list(mix), weights=list(mix.values()))[0]
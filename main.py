@@ -12,25 +12,24 @@ if __name__ == "__main__":
     number_of_students = 6
     number_of_assignments = 4
 
-    # Enroll students
-    for student_id in range(number_of_students):
-        enroll_succeeded = course_service.enroll_student(course_id, student_id)
+    # Enroll students in one batch
+    student_ids = list(range(number_of_students))
+    enroll_results = course_service.enroll_students(course_id, student_ids)
+    for student_id, enroll_succeeded in zip(student_ids, enroll_results):
         print(f"Enrolled student {student_id}: {enroll_succeeded}")
 
-    # Create assignments
-    assignment_ids = {}
-    for assignment_id in range(number_of_assignments):
-        assignment_name = f"Assignment {assignment_id}"
-        new_assignment_id = course_service.create_assignment(course_id, assignment_name)
-        assignment_ids.update({new_assignment_id: assignment_name})
+    # Create assignments in one batch
+    assignment_names = [f"Assignment {assignment_id}" for assignment_id in range(number_of_assignments)]
+    new_assignment_ids = course_service.create_assignments(course_id, assignment_names)
+    assignment_ids = dict(zip(new_assignment_ids, assignment_names))
+    for new_assignment_id, assignment_name in assignment_ids.items():
         print(f"Created assignment: {assignment_name} with ID: {new_assignment_id}")
 
-    # Submit assignments with random grades between 0 and 100
-    for student_id in range(number_of_students):
-        for assignment_id in assignment_ids:
-            grade = random.randint(0, 100)
-            submit_succeeded = course_service.submit_assignment(course_id, student_id, assignment_id, grade)
-            print(f"Submitted assignment {assignment_ids.get(assignment_id)} for student {student_id} with grade {grade}: {submit_succeeded}")
+    # Submit assignments with random grades between 0 and 100 in one batch
+    submissions = [(student_id, assignment_id, random.randint(0, 100)) for student_id in student_ids for assignment_id in assignment_ids]
+    submit_results = course_service.submit_assignments(course_id, submissions)
+    for (student_id, assignment_id, grade), submit_succeeded in zip(submissions, submit_results):
+        print(f"Submitted assignment {assignment_ids.get(assignment_id)} for student {student_id} with grade {grade}: {submit_succeeded}")
 
     # Display average grade of each assignment
     for assignment_id in assignment_ids:
@@ -52,7 +51,7 @@ if __name__ == "__main__":
     print(f"Created course: {course_name_2} with ID: {course_id_2}")
 
     # Display all courses
-    all_courses = course_service.get_courses()
+    all_courses = course_service.iter_course_summaries()
     print(f"All courses: {list(map(lambda course: course.id, all_courses))}")
 
     # Delete both courses
@@ -62,5 +61,5 @@ if __name__ == "__main__":
     print(f"Deleted course id {course_id_2}: {delete_succeeded}")
 
     # Display all courses
-    all_courses = course_service.get_courses()
+    all_courses = course_service.iter_course_summaries()
     print(f"All courses: {list(map(lambda course: course.id, all_courses))}")
\ No newline at end of file
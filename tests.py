@@ -1,8 +1,30 @@
 import unittest
-from app.model import Course
-from unittest.mock import MagicMock
+import sys
+import threading
+import asyncio
+import os
+import json
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from app.columnar_model import ColumnarCourse
+from app.id_allocator import CounterIdAllocator, SnowflakeIdAllocator, IdInterner
+from app.model import Course, CourseSummary, TranscriptEntry, CourseCreated, StudentEnrolled, StudentDroppedOut, AssignmentCreated, AssignmentSubmitted, CourseDeleted
+from unittest.mock import MagicMock, patch
 from app.course_repository import CourseRepository
 from app.course_service_impl import CourseServiceImpl
+from app.course_repository_impl import CourseRepositoryImpl, CourseDocument
+from app.durable_course_repository import DurableCourseRepository
+from app.analytics_cache import AnalyticsCache
+from app.instrumentation import Instrumented, Metrics, SlowCallProfiler, instrument
+from app.report_engine import CourseReport, ParallelReportEngine, pack_course, report_from_packed_course, serial_reports
+from app.sharded_course_repository import ShardedCourseRepository
+from app.binary_snapshot import BinarySnapshotCourseRepository, write_binary_snapshot
+from app.async_course_repository_impl import AsyncCourseRepositoryImpl
+from app.async_course_service_impl import AsyncCourseServiceImpl
+from app.change_feed import ChangeEvent, ChangeFeed, ChangeFeedRepository, StudentGpaView
 
 class TestCourse(unittest.TestCase):
     def setUp(self) -> None:
@@ -14,6 +36,18 @@ class TestCourse(unittest.TestCase):
         self.assertIn(assignment_id, self.course.assignments)
         self.assertEqual(self.course.assignments[assignment_id], "Assignment 1")
 
+    def test_create_assignment_with_given_id(self):
+        assignment_id = self.course.create_assignment("Assignment 1", 7)
+
+        self.assertEqual(7, assignment_id)
+        self.assertEqual("Assignment 1", self.course.assignments[7])
+
+    def test_create_assignment_with_existing_id(self):
+        self.course.create_assignment("Assignment 1", 7)
+
+        with self.assertRaises(ValueError):
+            self.course.create_assignment("Assignment 2", 7)
+
     def test_create_assignment_with_empty_name(self):
         with self.assertRaises(ValueError):
             self.course.create_assignment("")
@@ -44,6 +78,39 @@ class TestCourse(unittest.TestCase):
         self.assertNotIn(student_id, self.course.students)
         self.assertTrue(succeed)
 
+    def test_dropout_student_keeps_submissions(self):
+        student_id = 100
+        assignment_id = 1000
+        self.add_student(student_id)
+        self.add_student(200)
+        self.add_assignment(assignment_id, "assignment name")
+        self.add_assignment_submission(student_id, assignment_id, 40)
+        self.add_assignment_submission(200, assignment_id, 80)
+
+        self.course.dropout_student(student_id)
+
+        self.assertIn((student_id, assignment_id), self.course.submissions)
+        self.assertEqual({200: 80, student_id: 40}, self.course.assignment_submissions[assignment_id])
+        self.assertEqual(60, self.course.get_assignment_grade_average(assignment_id))
+        self.assertEqual([200], self.course.get_top_k_students(5))
+        with self.assertRaises(Exception):
+            self.course.get_student_grade_average(student_id)
+
+    def test_re_enrolled_student_keeps_their_grades(self):
+        self.add_student(100)
+        self.add_student(200)
+        self.add_assignment(1000, "assignment name")
+        self.add_assignment_submission(100, 1000, 90)
+        self.add_assignment_submission(200, 1000, 80)
+        self.course.dropout_student(100)
+
+        self.course.enroll_student(100)
+
+        self.assertFalse(self.course.submit_assignment(100, 1000, 50))
+        self.assertEqual(90, self.course.get_student_grade_average(100))
+        self.assertEqual([100, 200], self.course.get_top_k_students(5))
+        self.assertTrue(self.course.aggregates_are_consistent())
+
     def test_dropout_student_when_student_is_not_enrolled(self):
         student_id = 100
 
@@ -59,8 +126,58 @@ class TestCourse(unittest.TestCase):
         succeed = self.course.submit_assignment(student_id, assignment_id, grade)
 
         self.assertIn((student_id, assignment_id), self.course.submissions)
+        self.assertEqual({assignment_id: grade}, self.course.student_submissions[student_id])
+        self.assertEqual({student_id: grade}, self.course.assignment_submissions[assignment_id])
         self.assertTrue(succeed)
 
+    def test_apply_changes_replays_changes_onto_another_copy(self):
+        self.course.enroll_student(100)
+        self.course.enroll_student(200)
+        assignment_id = self.course.create_assignment("Assignment 1", 1000)
+        self.course.submit_assignment(100, assignment_id, 40)
+        self.course.submit_assignment(200, assignment_id, 80)
+        self.course.dropout_student(100)
+        replica = type(self.course)(1, "Test Course")
+
+        replica.apply_changes(self.course.pending_changes)
+
+        self.assertEqual(self.course.students, replica.students)
+        self.assertEqual(dict(self.course.submissions), dict(replica.submissions))
+        self.assertEqual(self.course.student_rankings, replica.student_rankings)
+        self.assertEqual(self.course.pending_changes, replica.pending_changes)
+
+    def test_pickled_course_keeps_its_state(self):
+        self.course.enroll_student(100)
+        assignment_id = self.course.create_assignment("Assignment 1", 1000)
+        self.course.submit_assignment(100, assignment_id, 80)
+        self.course.mark_persisted()
+
+        copied = pickle.loads(pickle.dumps(self.course, protocol=pickle.HIGHEST_PROTOCOL))
+        copied.enroll_student(200)
+
+        self.assertFalse(hasattr(copied, '__dict__'))
+        self.assertEqual(dict(self.course.submissions), dict(copied.submissions))
+        self.assertEqual([StudentEnrolled(200)], copied.pending_changes)
+        self.assertEqual(['students'], copied.changed_containers())
+        self.assertTrue(copied.aggregates_are_consistent())
+
+    def test_submission_indexes_built_from_submissions(self):
+        course = Course(1, "Test Course", {100, 200}, {1000: "Name"}, {(100, 1000): 70, (200, 1000): 90})
+
+        self.assertEqual({1000: 70}, course.student_submissions[100])
+        self.assertEqual({100: 70, 200: 90}, course.assignment_submissions[1000])
+
+    def test_submissions_are_a_view_of_the_student_rows(self):
+        course = Course(1, "Test Course", {100, 200}, {1000: "Name"}, {(100, 1000): 70})
+        course.submit_assignment(200, 1000, 90)
+
+        self.assertEqual({(100, 1000): 70, (200, 1000): 90}, dict(course.submissions))
+        self.assertEqual(2, len(course.submissions))
+        self.assertNotIn((100, 2000), course.submissions)
+        self.assertNotIn('submissions', course.CONTAINERS)
+        with self.assertRaises(TypeError):
+            course.submissions[(100, 2000)] = 50
+
     def test_submit_assignment_when_student_not_in_course(self):
         student_id = 100
         assignment_id = 1000
@@ -95,6 +212,17 @@ class TestCourse(unittest.TestCase):
         self.assertNotIn((student_id, assignment_id), self.course.submissions)
         self.assertFalse(succeed)
 
+    def test_submit_assignment_when_grade_is_not_a_whole_number(self):
+        student_id = 100
+        assignment_id = 1000
+        self.add_student(student_id)
+        self.add_assignment(assignment_id, "assignment name")
+
+        succeed = self.course.submit_assignment(student_id, assignment_id, 80.5)
+
+        self.assertNotIn((student_id, assignment_id), self.course.submissions)
+        self.assertFalse(succeed)
+
     def test_submit_assignment_when_grade_above_100(self):
         student_id = 100
         assignment_id = 1000
@@ -146,6 +274,32 @@ class TestCourse(unittest.TestCase):
 
         self.assertEqual(75, self.course.get_student_grade_average(student_id))
 
+    def test_grade_aggregates_keep_the_grades_of_dropouts(self):
+        assignment_ids = [1000, 2000]
+        for student_id in [100, 200, 300]:
+            self.add_student(student_id)
+        for assignment_id in assignment_ids:
+            self.add_assignment(assignment_id, "Name")
+        for student_id in [100, 200, 300]:
+            for assignment_id in assignment_ids:
+                self.add_assignment_submission(student_id, assignment_id, student_id // 4 + assignment_id // 100)
+
+        self.course.dropout_student(200)
+
+        self.assertEqual((35 + 60 + 85, 3), self.course.assignment_grade_totals[1000])
+        self.assertEqual((35 + 45, 2), self.course.student_grade_totals[100])
+        self.assertIsNone(self.course.get_student_grade_total(200))
+        self.assertTrue(self.course.aggregates_are_consistent())
+
+    def test_aggregates_are_consistent_detects_drift(self):
+        self.add_student(100)
+        self.add_assignment(1000, "Name")
+        self.add_assignment_submission(100, 1000, 50)
+
+        self.course.student_grade_totals[100] = (60, 1)
+
+        self.assertFalse(self.course.aggregates_are_consistent())
+
     def test_get_student_grade_average_when_student_does_not_exist(self):
         with self.assertRaises(Exception):
             self.course.get_student_grade_average(100)
@@ -172,6 +326,147 @@ class TestCourse(unittest.TestCase):
 
         self.assertEqual([900, 800, 700, 600, 500], top_five_students)
 
+    def test_get_top_k_students_breaks_ties_by_student_id(self):
+        self.add_assignment(1000, "Name")
+        for student_id, grade in [(300, 80), (100, 80), (200, 95), (400, 60), (500, 80)]:
+            self.add_student(student_id)
+            self.add_assignment_submission(student_id, 1000, grade)
+        self.add_student(600) # no submissions, so not ranked
+
+        self.assertEqual([200, 100, 300], self.course.get_top_k_students(3))
+        self.assertEqual([200, 100, 300, 500, 400], self.course.get_top_k_students(10))
+        self.assertEqual([], self.course.get_top_k_students(0))
+
+    def test_get_bottom_k_students(self):
+        self.add_assignment(1000, "Name")
+        for student_id, grade in [(100, 70), (200, 95), (300, 60), (400, 85)]:
+            self.add_student(student_id)
+            self.add_assignment_submission(student_id, 1000, grade)
+
+        self.assertEqual([300, 100], self.course.get_bottom_k_students(2))
+        self.assertEqual([300, 100, 400, 200], self.course.get_bottom_k_students(5))
+        self.assertEqual([], self.course.get_bottom_k_students(0))
+
+    def test_get_students_by_average_compares_floored_averages(self):
+        for assignment_id in [1000, 2000]:
+            self.add_assignment(assignment_id, "Name")
+        for student_id, grades in [(100, [59, 60]), (200, [60]), (300, [75]), (400, [80, 81]), (500, [])]:
+            self.add_student(student_id)
+            for assignment_id, grade in zip([1000, 2000], grades):
+                self.add_assignment_submission(student_id, assignment_id, grade)
+
+        self.assertEqual([100], self.course.get_students_by_average(None, 59))
+        self.assertEqual([400, 300, 200], self.course.get_students_by_average(60, 80))
+        self.assertEqual([400, 300, 200, 100], self.course.get_students_by_average())
+        self.assertEqual([], self.course.get_students_by_average(80.5, 90))
+        self.assertEqual([], self.course.get_students_by_average(70, 60))
+
+    def test_student_rankings_follow_submissions_and_dropouts(self):
+        for assignment_id in [1000, 2000]:
+            self.add_assignment(assignment_id, "Name")
+        for student_id in [100, 200]:
+            self.add_student(student_id)
+        self.add_assignment_submission(100, 1000, 90)
+        self.add_assignment_submission(200, 1000, 80)
+        self.add_assignment_submission(100, 2000, 50)
+
+        self.assertEqual([200, 100], self.course.get_top_k_students(5))
+
+        self.course.dropout_student(200)
+
+        self.assertEqual([100], self.course.get_top_k_students(5))
+        self.assertTrue(self.course.aggregates_are_consistent())
+
+    def test_whole_float_grades_are_stored_as_ints(self):
+        self.add_assignment(1000, "Name")
+        self.add_student(100)
+
+        self.assertTrue(self.course.submit_assignment(100, 1000, 90.0))
+
+        self.assertIs(int, type(self.course.get_grade(100, 1000)))
+        self.assertEqual([AssignmentSubmitted(100, 1000, 90)], [change for change in self.course.pending_changes if isinstance(change, AssignmentSubmitted)])
+
+    def test_students_with_ids_of_different_types_rank_together(self):
+        self.add_assignment(1000, "Name")
+        for student_id in [1, 's-2', (3, 'c')]:
+            self.add_student(student_id)
+            self.add_assignment_submission(student_id, 1000, 80)
+
+        self.assertEqual([1, 's-2', (3, 'c')], self.course.get_top_k_students(5))
+        self.course.dropout_student('s-2')
+        self.assertEqual([(3, 'c'), 1], self.course.get_bottom_k_students(5))
+        self.assertTrue(self.course.aggregates_are_consistent())
+
+    def test_a_submission_that_cannot_be_ranked_changes_nothing(self):
+        self.add_assignment(1000, "Name")
+        for student_id in [1j, 2j]: # complex numbers hash but don't order
+            self.add_student(student_id)
+        self.add_assignment_submission(1j, 1000, 80)
+
+        with self.assertRaises(TypeError):
+            self.course.submit_assignment(2j, 1000, 80)
+
+        self.assertIsNone(self.course.get_grade(2j, 1000))
+        self.assertEqual([1j], self.course.get_top_k_students(5))
+        self.assertTrue(self.course.aggregates_are_consistent())
+
+    def test_pending_changes_are_recorded_in_order(self):
+        assignment_id = self.course.create_assignment("Assignment 1")
+        self.course.enroll_student(100)
+        self.course.enroll_student(100)
+        self.course.submit_assignment(100, assignment_id, 70)
+        self.course.submit_assignment(100, assignment_id, 80)
+        self.course.dropout_student(100)
+
+        self.assertEqual([CourseCreated("Test Course"), AssignmentCreated(assignment_id, "Assignment 1"), StudentEnrolled(100),
+                          AssignmentSubmitted(100, assignment_id, 70), StudentDroppedOut(100)], self.course.pending_changes)
+
+    def test_mark_persisted_clears_pending_changes(self):
+        self.course.enroll_student(100)
+
+        self.course.mark_persisted()
+
+        self.assertEqual([], self.course.pending_changes)
+        self.assertEqual([], self.course.changed_containers())
+        self.assertFalse(self.course.is_new())
+
+    def test_grade_histograms_follow_submissions(self):
+        for student_id in [100, 200, 300]:
+            self.add_student(student_id)
+        self.add_assignment(1000, "Assignment 1")
+        self.add_assignment(2000, "Assignment 2")
+        self.add_assignment_submission(100, 1000, 90)
+        self.add_assignment_submission(200, 1000, 90.0)
+        self.add_assignment_submission(300, 1000, 40)
+        self.add_assignment_submission(100, 2000, 40)
+
+        self.assertEqual((2, 1), (self.course.get_assignment_grade_histogram(1000)[90], self.course.get_assignment_grade_histogram(1000)[40]))
+        self.assertEqual((2, 2), (self.course.get_grade_histogram()[90], self.course.get_grade_histogram()[40]))
+        self.assertEqual(4, sum(self.course.get_grade_histogram()))
+        self.course.dropout_student(100) # a dropout keeps their grades
+        self.assertEqual(2, self.course.get_assignment_grade_histogram(1000)[90])
+        self.assertEqual(1, self.course.get_assignment_grade_histogram(2000)[40])
+        self.assertIsNone(self.course.get_assignment_grade_histogram(3000))
+        self.assertTrue(self.course.aggregates_are_consistent())
+
+    def test_grade_percentiles(self):
+        for student_id in [100, 200, 300, 400]:
+            self.add_student(student_id)
+        self.add_assignment(1000, "Assignment 1")
+        for student_id, grade in [(100, 70), (200, 10), (300, 100), (400, 40)]:
+            self.add_assignment_submission(student_id, 1000, grade)
+
+        self.assertEqual(40, self.course.get_assignment_grade_percentile(1000, 50)) # the lower middle grade of an even count
+        self.assertEqual([10, 10, 70, 100], [self.course.get_assignment_grade_percentile(1000, percentile) for percentile in [0, 25, 51, 100]])
+        self.assertEqual(70, self.course.get_grade_percentile(75))
+        with self.assertRaises(ValueError):
+            self.course.get_grade_percentile(101)
+        with self.assertRaises(Exception):
+            self.course.get_assignment_grade_percentile(2000, 50)
+        self.add_assignment(2000, "Assignment 2")
+        with self.assertRaises(Exception):
+            self.course.get_assignment_grade_percentile(2000, 50)
+
     # helper methods to populate data for tests
 
     def add_student(self, student_id):
@@ -181,7 +476,79 @@ class TestCourse(unittest.TestCase):
         self.course.assignments.update({assignment_id: name})
 
     def add_assignment_submission(self, student_id, assignment_id, grade):
-        self.course.submissions.update({(student_id, assignment_id): grade})
+        self.course.submit_assignment(student_id, assignment_id, grade)
+
+class TestIdAllocator(unittest.TestCase):
+    def test_counter_id_allocator_counts_up(self):
+        id_allocator = CounterIdAllocator(start=5)
+
+        self.assertEqual([5, 6, 7], [id_allocator.next_id() for _ in range(3)])
+
+    def test_counter_id_allocator_skips_past_used_ids(self):
+        id_allocator = CounterIdAllocator()
+
+        id_allocator.skip_past(41)
+        id_allocator.skip_past(7)
+
+        self.assertEqual(42, id_allocator.next_id())
+
+    def test_snowflake_ids_are_unique_increasing_and_fit_63_bits(self):
+        id_allocator = SnowflakeIdAllocator(worker_id=3)
+
+        ids = [id_allocator.next_id() for _ in range(10000)]
+
+        self.assertEqual(sorted(set(ids)), ids)
+        self.assertTrue(all(0 < new_id < 1 << 63 for new_id in ids))
+        self.assertTrue(all((new_id >> SnowflakeIdAllocator.SEQUENCE_BITS) & 1023 == 3 for new_id in ids))
+
+    def test_snowflake_rejects_out_of_range_worker_id(self):
+        with self.assertRaises(ValueError):
+            SnowflakeIdAllocator(worker_id=1024)
+
+    def test_id_interner_assigns_dense_indexes_in_order_of_first_use(self):
+        id_interner = IdInterner()
+        uuid_like = 2 ** 127 + 12345
+
+        indexes = [id_interner.intern(external_id) for external_id in [uuid_like, "s-1", uuid_like, 42]]
+
+        self.assertEqual([0, 1, 0, 2], indexes)
+        self.assertEqual("s-1", id_interner.external_id(1))
+        self.assertIsNone(id_interner.index_of(43))
+        self.assertEqual([uuid_like, "s-1", 42], list(id_interner))
+
+    def test_id_interner_copy_is_independent(self):
+        id_interner = IdInterner()
+        id_interner.intern(100)
+
+        copied = id_interner.copy()
+        copied.intern(200)
+
+        self.assertEqual(1, len(id_interner))
+        self.assertEqual(2, len(copied))
+
+# Runs every Course test against the columnar storage engine, which must give the same results
+class TestColumnarCourse(TestCourse):
+    def setUp(self) -> None:
+        self.course = ColumnarCourse(id=1, name="Test Course")
+
+    def test_grades_are_stored_in_uint8_columns(self):
+        self.add_student(100)
+        self.add_student(200)
+        self.add_assignment(1000, "Name")
+        self.add_assignment_submission(200, 1000, 64)
+
+        self.assertEqual('B', self.course.grade_columns[1000].typecode)
+        self.assertEqual(64, self.course.get_grade(200, 1000))
+        self.assertIsNone(self.course.get_grade(100, 1000))
+        self.assertEqual({(200, 1000): 64}, dict(self.course.submissions))
+
+    def test_built_from_submissions(self):
+        course = ColumnarCourse(1, "Test Course", {100, 200}, {1000: "Name", 2000: "Name"}, {(100, 1000): 70, (200, 1000): 90, (200, 2000): 81})
+
+        self.assertEqual(80, course.get_assignment_grade_average(1000))
+        self.assertEqual(85, course.get_student_grade_average(200))
+        self.assertEqual([200, 100], course.get_top_five_students())
+        self.assertTrue(course.aggregates_are_consistent())
 
 class TestCourseServiceImpl(unittest.TestCase):
     def setUp(self) -> None:
@@ -207,6 +574,13 @@ class TestCourseServiceImpl(unittest.TestCase):
         self.assertIsNotNone(new_course_id)
         self.course_repository_mock.save_course.assert_called_once()
 
+    def test_create_course_with_columnar_storage(self):
+        course_service = CourseServiceImpl(self.course_repository_mock, course_type=ColumnarCourse)
+
+        course_service.create_course("New Course")
+
+        self.assertIsInstance(self.course_repository_mock.save_course.call_args[0][0], ColumnarCourse)
+
     def test_create_assignment(self):
         self.course_mock.create_assignment.return_value = 1
 
@@ -215,6 +589,13 @@ class TestCourseServiceImpl(unittest.TestCase):
         self.assertEqual(1, new_assignment_id)
         self.course_repository_mock.save_course.assert_called_once()
 
+    def test_new_ids_come_from_the_repository(self):
+        self.course_repository_mock.next_id.side_effect = [10, 11]
+
+        self.assertEqual(10, self.course_service.create_course("New Course"))
+        self.course_service.create_assignment(10, "New assignment")
+        self.course_mock.create_assignment.assert_called_once_with("New assignment", 11)
+
     def test_enroll_student(self):
         self.course_service.enroll_student(1, 100)
 
@@ -230,20 +611,100 @@ class TestCourseServiceImpl(unittest.TestCase):
 
         self.course_repository_mock.save_course.assert_called_once()
 
+    def test_create_assignments(self):
+        self.course_mock.create_assignment.side_effect = [1, 2]
+
+        new_assignment_ids = self.course_service.create_assignments(1, ["First", "Second"])
+
+        self.assertEqual([1, 2], new_assignment_ids)
+        self.course_repository_mock.get_course.assert_called_once_with(1)
+        self.course_repository_mock.save_course.assert_called_once_with(self.course_mock)
+
+    def test_create_assignments_does_not_save_when_an_assignment_fails(self):
+        self.course_mock.create_assignment.side_effect = [1, ValueError("Name must be present")]
+
+        with self.assertRaises(ValueError):
+            self.course_service.create_assignments(1, ["First", ""])
+        self.course_repository_mock.save_course.assert_not_called()
+
+    def test_enroll_students(self):
+        self.course_mock.enroll_student.side_effect = [True, False, True]
+
+        enroll_results = self.course_service.enroll_students(1, [100, 100, 200])
+
+        self.assertEqual([True, False, True], enroll_results)
+        self.course_repository_mock.get_course.assert_called_once_with(1)
+        self.course_repository_mock.save_course.assert_called_once_with(self.course_mock)
+
+    def test_submit_assignments(self):
+        self.course_mock.submit_assignment.side_effect = [True, False]
+
+        submit_results = self.course_service.submit_assignments(1, [(100, 1000, 80), (200, 1000, 101)])
+
+        self.assertEqual([True, False], submit_results)
+        self.course_mock.submit_assignment.assert_any_call(200, 1000, 101)
+        self.course_repository_mock.get_course.assert_called_once_with(1)
+        self.course_repository_mock.save_course.assert_called_once_with(self.course_mock)
+
     def test_get_assignment_grade_avg(self):
-        self.course_mock.get_assignment_grade_average.return_value = 90
+        self.course_repository_mock.get_assignment_grade_total.return_value = (181, 2)
 
         self.assertEqual(90, self.course_service.get_assignment_grade_avg(1, 1000))
+        self.course_repository_mock.get_course.assert_not_called()
+
+    def test_get_assignment_grade_avg_when_assignment_has_no_submissions(self):
+        self.course_repository_mock.get_assignment_grade_total.return_value = (0, 0)
+
+        with self.assertRaises(Exception):
+            self.course_service.get_assignment_grade_avg(1, 1000)
 
     def test_get_student_grade_avg(self):
-        self.course_mock.get_student_grade_average.return_value = 90
+        self.course_repository_mock.get_student_grade_total.return_value = (270, 3)
 
         self.assertEqual(90, self.course_service.get_student_grade_avg(1, 1000))
+        self.course_repository_mock.get_course.assert_not_called()
+
+    def test_get_student_grade_avg_when_student_does_not_exist(self):
+        self.course_repository_mock.get_student_grade_total.return_value = None
+
+        with self.assertRaises(Exception):
+            self.course_service.get_student_grade_avg(1, 1000)
 
     def test_get_top_five_students(self):
-        self.course_mock.get_top_five_students.return_value = [3, 4, 5, 6, 7]
+        self.course_repository_mock.get_top_k_students.return_value = [3, 4, 5, 6, 7]
 
         self.assertEqual([3, 4, 5, 6, 7], self.course_service.get_top_five_students(1))
+        self.course_repository_mock.get_top_k_students.assert_called_once_with(1, 5)
+
+    def test_get_top_k_students(self):
+        self.course_repository_mock.get_top_k_students.return_value = [3, 4]
+
+        self.assertEqual([3, 4], self.course_service.get_top_k_students(1, 2))
+
+    def test_get_bottom_k_students(self):
+        self.course_repository_mock.get_bottom_k_students.return_value = [7, 6]
+
+        self.assertEqual([7, 6], self.course_service.get_bottom_k_students(1, 2))
+
+    def test_threshold_queries_bound_floored_averages(self):
+        self.course_repository_mock.get_students_by_average.return_value = [3]
+        self.course_repository_mock.get_students_by_average_in_all_courses.return_value = [(1, 3)]
+
+        self.assertEqual([3], self.course_service.get_students_below_average(1, 60))
+        self.course_repository_mock.get_students_by_average.assert_called_with(1, None, 59)
+        self.course_service.get_students_above_average(1, 70.5)
+        self.course_repository_mock.get_students_by_average.assert_called_with(1, 71, None)
+        self.course_service.get_students_between_averages(1, 70, 80)
+        self.course_repository_mock.get_students_by_average.assert_called_with(1, 70, 80)
+        self.assertEqual([(1, 3)], self.course_service.get_students_below_average_in_all_courses(60.5))
+        self.course_repository_mock.get_students_by_average_in_all_courses.assert_called_with(None, 60)
+
+    def test_get_student_transcript(self):
+        transcript = [TranscriptEntry(1, "Test Course", 80, 2)]
+        self.course_repository_mock.get_student_transcript.return_value = transcript
+
+        self.assertEqual(transcript, self.course_service.get_student_transcript(100))
+        self.course_repository_mock.get_student_transcript.assert_called_once_with(100)
 
     def test_delete_course(self):
         self.course_repository_mock.delete_course.return_value = True
@@ -255,5 +716,1356 @@ class TestCourseServiceImpl(unittest.TestCase):
 
         self.assertEqual(False, self.course_service.delete_course(1))
         
+class TestCourseRepositoryImpl(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_repository = CourseRepositoryImpl()
+        self.course = Course(id=1, name="Test Course")
+        self.course.enroll_student(100)
+        self.assignment_id = self.course.create_assignment("Assignment 1")
+        self.course.submit_assignment(100, self.assignment_id, 90)
+
+    def test_save_and_get_course_keeps_submission_indexes(self):
+        self.course_repository.save_course(self.course)
+
+        course = self.course_repository.get_course(1)
+
+        self.assertEqual({self.assignment_id: 90}, course.student_submissions[100])
+        self.assertEqual({100: 90}, course.assignment_submissions[self.assignment_id])
+        self.assertEqual((90, 1), course.student_grade_totals[100])
+        self.assertTrue(course.aggregates_are_consistent())
+
+    def test_get_course_does_not_share_state_with_database(self):
+        self.course_repository.save_course(self.course)
+
+        course = self.course_repository.get_course(1)
+        course.dropout_student(100)
+
+        self.assertEqual({100: 90}, self.course_repository.get_course(1).assignment_submissions[self.assignment_id])
+
+    def test_update_shares_the_fields_it_does_not_replace(self):
+        self.course_repository.save_course(self.course)
+        stored_document = self.course_repository.database.get(1)
+
+        course = self.course_repository.get_course(1)
+        course.enroll_student(200)
+        self.course_repository.save_course(course)
+        updated_document = self.course_repository.database.get(1)
+
+        self.assertIsNot(stored_document, updated_document)
+        self.assertIs(stored_document.student_submissions, updated_document.student_submissions)
+        self.assertEqual({100}, stored_document.students)
+        self.assertEqual({100, 200}, updated_document.students)
+
+    def test_documents_pickled_before_grade_histograms_load_with_rebuilt_histograms(self):
+        self.course_repository.save_course(self.course)
+        fields = dict(zip(CourseDocument.FIELDS, self.course_repository.database.get(1).__getstate__()))
+        del fields['assignment_grade_histograms'], fields['grade_histogram']
+        course_document = CourseDocument.__new__(CourseDocument)
+
+        course_document.__setstate__(fields) # as unpickling a document pickled with a dict of its fields does
+        course = self.course_repository.mapper.to_course_from_course_document(course_document)
+
+        self.assertIsNone(course_document.grade_histogram)
+        self.assertEqual(1, course.get_grade_histogram()[90])
+        self.assertTrue(course.aggregates_are_consistent())
+
+    def test_documents_pickled_with_flat_submissions_load_without_them(self):
+        self.course_repository.save_course(self.course)
+        state = self.course_repository.database.get(1).__getstate__()
+        course_document = CourseDocument.__new__(CourseDocument)
+
+        course_document.__setstate__(state[:4] + ({(100, self.assignment_id): 90},) + state[4:])
+        course = self.course_repository.mapper.to_course_from_course_document(course_document)
+
+        self.assertEqual({(100, self.assignment_id): 90}, dict(course.submissions))
+        self.assertTrue(course.aggregates_are_consistent())
+
+    def test_documents_pickled_with_untyped_ranking_keys_are_rekeyed(self):
+        self.course_repository.save_course(self.course)
+        state = list(self.course_repository.database.get(1).__getstate__())
+        rankings_field = CourseDocument.FIELDS.index('student_rankings')
+        state[rankings_field] = [(ranking[0], ranking[-1]) for ranking in state[rankings_field]]
+        course_document = CourseDocument.__new__(CourseDocument)
+
+        course_document.__setstate__(tuple(state))
+        course = self.course_repository.mapper.to_course_from_course_document(course_document)
+
+        self.assertEqual([100], course.get_top_k_students(5))
+        self.assertTrue(course.aggregates_are_consistent())
+
+    def test_course_changes_after_save_do_not_reach_database(self):
+        self.course_repository.save_course(self.course)
+
+        self.course.enroll_student(200)
+        self.course.submit_assignment(200, self.assignment_id, 50)
+
+        course = self.course_repository.get_course(1)
+        self.assertEqual({100}, course.students)
+        self.assertEqual({100: 90}, course.assignment_submissions[self.assignment_id])
+        self.assertEqual([100], course.get_top_k_students(5))
+
+    def test_containers_of_loaded_courses_are_read_only(self):
+        self.course_repository.save_course(self.course)
+        course = self.course_repository.get_course(1)
+        mutations = [lambda: course.students.add(99), lambda: course.assignments.clear(), lambda: course.student_submissions[100].clear(),
+                     lambda: course.assignment_submissions.pop(self.assignment_id), lambda: course.student_grade_totals.update({99: (1, 1)}),
+                     lambda: course.student_rankings.clear(), lambda: course.assignment_grade_histograms[self.assignment_id].append(0),
+                     lambda: course.grade_histogram.__setitem__(90, 0), lambda: course.submissions.__setitem__((100, self.assignment_id), 0)]
+
+        for mutation in mutations:
+            with self.assertRaises((TypeError, AttributeError)):
+                mutation()
+        stored = self.course_repository.get_course(1)
+        self.assertEqual(({100}, {(100, self.assignment_id): 90}, [100]), (stored.students, dict(stored.submissions), stored.get_top_k_students(5)))
+        self.assertTrue(course.enroll_student(99))
+        self.assertTrue(course.aggregates_are_consistent())
+
+    def test_saved_course_no_longer_shares_writable_containers_with_its_caller(self):
+        students, rankings = self.course.students, self.course.student_rankings
+        self.course_repository.save_course(self.course)
+
+        students.add(99)
+        rankings.clear()
+        with self.assertRaises(TypeError):
+            self.course.student_submissions[100][self.assignment_id] = 0
+
+        self.assertEqual({100}, self.course_repository.get_course(1).students)
+        self.assertEqual([100], self.course_repository.get_top_k_students(1, 5))
+
+    def test_containers_of_loaded_columnar_courses_are_read_only(self):
+        course = ColumnarCourse(id=2, name="Columnar Course", students={100}, assignments={1000: "Assignment 1"}, submissions={(100, 1000): 90})
+        self.course_repository.save_course(course)
+        loaded = self.course_repository.get_course(2)
+
+        with self.assertRaises(TypeError):
+            loaded.grade_columns[1000][0] = 0
+        with self.assertRaises(TypeError):
+            loaded.student_slots.intern(200)
+        loaded.enroll_student(200)
+        loaded.submit_assignment(200, 1000, 60)
+        self.course_repository.save_course(loaded)
+        reloaded = pickle.loads(pickle.dumps(self.course_repository.database.get(2)))
+
+        self.assertEqual({(100, 1000): 90, (200, 1000): 60}, dict(self.course_repository.get_course(2).submissions))
+        with self.assertRaises(TypeError):
+            reloaded.grade_columns[1000].append(0)
+        self.assertEqual(75, self.course_repository.mapper.to_course_from_course_document(reloaded).get_assignment_grade_average(1000))
+
+    def test_loaded_courses_copy_only_the_containers_they_change(self):
+        self.course.enroll_student(200)
+        self.course.submit_assignment(200, self.assignment_id, 50)
+        self.course_repository.save_course(self.course)
+        stored = self.course_repository.get_course(1)
+
+        course = self.course_repository.get_course(1)
+        course.dropout_student(200)
+
+        self.assertIs(stored.assignments, course.assignments)
+        self.assertIs(stored.student_submissions, course.student_submissions)
+        self.assertIsNot(stored.students, course.students)
+        self.assertIsNot(stored.student_rankings, course.student_rankings)
+        self.assertIn(200, stored.students)
+        self.assertTrue(course.aggregates_are_consistent())
+        self.assertTrue(stored.aggregates_are_consistent())
+
+    def test_save_course_skips_write_when_nothing_changed(self):
+        self.course_repository.save_course(self.course)
+        course = self.course_repository.get_course(1)
+        self.course_repository.database = MagicMock(wraps=self.course_repository.database)
+
+        course.enroll_student(100)
+        self.course_repository.save_course(course)
+
+        self.course_repository.database.save.assert_not_called()
+        self.course_repository.database.update.assert_not_called()
+
+    def test_save_course_only_replaces_changed_containers(self):
+        self.course_repository.save_course(self.course)
+        course = self.course_repository.get_course(1)
+        self.course_repository.database = MagicMock(wraps=self.course_repository.database)
+
+        course.enroll_student(200)
+        self.course_repository.save_course(course)
+
+        self.course_repository.database.update.assert_called_once_with(1, {'students': {100, 200}}, [StudentEnrolled(200)])
+        self.assertEqual({100, 200}, self.course_repository.get_course(1).students)
+        self.assertEqual([], course.pending_changes)
+
+    def test_save_course_recreates_deleted_course(self):
+        self.course_repository.save_course(self.course)
+        course = self.course_repository.get_course(1)
+        self.course_repository.delete_course(1)
+
+        course.enroll_student(200)
+        self.course_repository.save_course(course)
+
+        self.assertEqual({100, 200}, self.course_repository.get_course(1).students)
+
+    def test_grade_projections(self):
+        self.course.enroll_student(200)
+        self.course.submit_assignment(200, self.assignment_id, 71)
+        self.course.enroll_student(300)
+        self.course_repository.save_course(self.course)
+
+        self.assertEqual((161, 2), self.course_repository.get_assignment_grade_total(1, self.assignment_id))
+        self.assertIsNone(self.course_repository.get_assignment_grade_total(1, 2000))
+        self.assertEqual((71, 1), self.course_repository.get_student_grade_total(1, 200))
+        self.assertEqual((0, 0), self.course_repository.get_student_grade_total(1, 300))
+        self.assertIsNone(self.course_repository.get_student_grade_total(1, 400))
+        self.assertEqual([100, 200], self.course_repository.get_top_k_students(1, 5))
+        self.assertEqual([200], self.course_repository.get_bottom_k_students(1, 1))
+        self.assertEqual([200, 100], self.course_repository.get_bottom_k_students(1, 3))
+
+    def test_grade_projections_when_course_does_not_exist(self):
+        with self.assertRaises(Exception):
+            self.course_repository.get_student_grade_total(1, 100)
+
+    def test_save_and_get_columnar_course(self):
+        course = ColumnarCourse(id=2, name="Columnar Course")
+        course.enroll_student(100)
+        assignment_id = course.create_assignment("Assignment 1")
+        course.submit_assignment(100, assignment_id, 90)
+        self.course_repository.save_course(course)
+
+        stored = self.course_repository.get_course(2)
+        loaded = self.course_repository.get_course(2)
+        loaded.enroll_student(200)
+        loaded.submit_assignment(200, assignment_id, 60)
+        self.course_repository.save_course(loaded)
+
+        self.assertIsInstance(stored, ColumnarCourse)
+        self.assertEqual({(100, assignment_id): 90}, dict(stored.submissions))
+        self.assertEqual(75, self.course_repository.get_course(2).get_assignment_grade_average(assignment_id))
+        self.assertEqual((150, 2), self.course_repository.get_assignment_grade_total(2, assignment_id))
+        self.assertTrue(self.course_repository.get_course(2).aggregates_are_consistent())
+
+    def test_course_pages_follow_the_cursor(self):
+        self.course_repository.save_course(self.course)
+        for course_id in [5, 3, 9, 7]:
+            self.course_repository.save_course(Course(id=course_id, name=f"Course {course_id}"))
+
+        first_page = self.course_repository.get_course_page(None, 3)
+        self.course_repository.delete_course(3)
+        second_page = self.course_repository.get_course_page(first_page[-1].id, 3)
+
+        self.assertEqual([1, 3, 5], [course.id for course in first_page])
+        self.assertEqual([7, 9], [course.id for course in second_page])
+        self.assertEqual([], self.course_repository.get_course_page(9, 3))
+
+    def test_course_summary_page(self):
+        self.course.enroll_student(200)
+        self.course_repository.save_course(self.course)
+
+        summaries = self.course_repository.get_course_summary_page(None, 10)
+
+        self.assertEqual([CourseSummary(1, "Test Course", 2, 1, 1)], summaries)
+
+    def test_student_index_follows_enrolments_dropouts_and_deletes(self):
+        self.course_repository.save_course(self.course)
+        other_course = Course(id=2, name="Other Course")
+        other_course.enroll_student(100)
+        other_course.enroll_student(200)
+        self.course_repository.save_course(other_course)
+        course = self.course_repository.get_course(1)
+        course.enroll_student(200)
+        course.dropout_student(100)
+        self.course_repository.save_course(course)
+
+        self.assertEqual([1, 2], [course.id for course in self.course_repository.get_courses_for_student(200)])
+        self.assertEqual([2], [course.id for course in self.course_repository.get_courses_for_student(100)])
+        self.course_repository.delete_course(2)
+        self.assertEqual([], self.course_repository.get_courses_for_student(100))
+        self.assertEqual([1], [course.id for course in self.course_repository.get_courses_for_student(200)])
+
+    def test_student_index_follows_a_replaced_roster(self):
+        self.course_repository.save_course(self.course)
+        course = Course(id=1, name="Test Course", students={200})
+
+        self.course_repository.save_course(course)
+
+        self.assertEqual([], self.course_repository.get_courses_for_student(100))
+        self.assertEqual([1], [course.id for course in self.course_repository.get_courses_for_student(200)])
+
+    def test_get_student_transcript(self):
+        self.course_repository.save_course(self.course)
+        other_course = Course(id=2, name="Other Course")
+        other_course.enroll_student(100)
+        self.course_repository.save_course(other_course)
+
+        transcript = self.course_repository.get_student_transcript(100)
+
+        self.assertEqual([TranscriptEntry(1, "Test Course", 90, 1), TranscriptEntry(2, "Other Course", None, 0)], transcript)
+        self.assertEqual([], self.course_repository.get_student_transcript(999))
+
+    def test_grade_histograms(self):
+        self.course_repository.save_course(self.course)
+
+        self.assertEqual(1, self.course_repository.get_assignment_grade_histogram(1, self.assignment_id)[90])
+        self.assertIsNone(self.course_repository.get_assignment_grade_histogram(1, 999))
+        self.assertEqual(self.course.get_grade_histogram(), self.course_repository.get_grade_histogram(1))
+        self.course_repository.get_grade_histogram(1)[90] = 0 # callers get copies
+        self.assertEqual(1, self.course_repository.get_grade_histogram(1)[90])
+
+    def test_next_id_counts_up_per_repository(self):
+        self.assertEqual([1, 2], [self.course_repository.next_id(), self.course_repository.next_id()])
+        self.assertEqual(1, CourseRepositoryImpl().next_id())
+
+    def test_delete_course_when_course_does_not_exist(self):
+        self.assertFalse(self.course_repository.delete_course(1))
+
+class TestDurableCourseRepository(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.course_repository = self.open_repository()
+        self.course_service = CourseServiceImpl(self.course_repository)
+        self.course_id = self.course_service.create_course("Test Course")
+        self.assignment_id = self.course_service.create_assignment(self.course_id, "Assignment 1")
+        self.course_service.enroll_students(self.course_id, [100, 200, 300])
+        self.course_service.submit_assignments(self.course_id, [(100, self.assignment_id, 60), (200, self.assignment_id, 90)])
+        self.course_service.submit_assignment(self.course_id, 300, self.assignment_id, 75)
+
+    def tearDown(self) -> None:
+        self.course_repository.close()
+        shutil.rmtree(self.directory)
+
+    def open_repository(self, **options):
+        return DurableCourseRepository(self.directory, **options)
+
+    def reopen(self, **options):
+        self.course_repository.close()
+        self.course_repository = self.open_repository(**options)
+        return CourseServiceImpl(self.course_repository)
+
+    def test_reopening_replays_the_log(self):
+        self.course_service.dropout_student(self.course_id, 100)
+        deleted_course_id = self.course_service.create_course("Deleted Course")
+        self.course_service.delete_course(deleted_course_id)
+
+        course_service = self.reopen()
+
+        course = course_service.get_course_by_id(self.course_id)
+        self.assertEqual({200, 300}, course.students)
+        self.assertEqual([200, 300], course_service.get_top_five_students(self.course_id))
+        self.assertTrue(course.aggregates_are_consistent())
+        self.assertEqual([self.course_id], [course_summary.id for course_summary in course_service.iter_course_summaries()])
+
+    def test_reopening_loads_the_snapshot_and_the_log_after_it(self):
+        self.course_repository.snapshot()
+        self.course_service.submit_assignments(self.course_id, [])
+        self.course_service.dropout_student(self.course_id, 300)
+
+        course_service = self.reopen()
+
+        self.assertEqual(75, course_service.get_assignment_grade_avg(self.course_id, self.assignment_id))
+        self.assertEqual(['snapshot', 'wal.1'], sorted(os.listdir(self.directory)))
+
+    def test_snapshots_are_taken_every_snapshot_interval_records(self):
+        course_service = self.reopen(snapshot_interval=2)
+
+        course_service.enroll_student(self.course_id, 400)
+        course_service.enroll_student(self.course_id, 500)
+        course_service.enroll_student(self.course_id, 600)
+
+        self.assertEqual(['snapshot', 'wal.1'], sorted(os.listdir(self.directory)))
+        self.assertIn(600, self.reopen().get_course_by_id(self.course_id).students)
+
+    def test_reopening_ignores_a_torn_record_at_the_end_of_the_log(self):
+        self.course_repository.close()
+        with open(os.path.join(self.directory, 'wal.0'), 'ab') as log_file:
+            log_file.write(b'\x40\x00\x00\x00\x00\x00\x00\x00partial')
+
+        course_service = self.reopen()
+        course_service.enroll_student(self.course_id, 400)
+
+        self.assertEqual({100, 200, 300, 400}, self.reopen().get_course_by_id(self.course_id).students)
+
+    def test_reopening_rebuilds_the_student_index(self):
+        self.course_repository.snapshot()
+        self.course_service.dropout_student(self.course_id, 300)
+
+        course_service = self.reopen()
+
+        self.assertEqual([self.course_id], [course.id for course in course_service.get_courses_for_student(100)])
+        self.assertEqual([], course_service.get_courses_for_student(300))
+
+    def test_updating_a_deleted_course_logs_nothing(self):
+        course = self.course_repository.get_course(self.course_id)
+        course.enroll_student(400)
+        self.course_repository.delete_course(self.course_id)
+
+        with self.assertRaises(KeyError):
+            self.course_repository.database.update(self.course_id, self.course_repository.mapper.to_document_fields_from_course(course), course.pending_changes)
+
+        self.assertEqual([], self.reopen().get_courses())
+
+    def test_records_are_synced_within_the_group_commit_interval_without_further_appends(self):
+        course_service = self.reopen(group_commit_interval=0.01)
+        synced = threading.Event()
+        fsync = os.fsync
+        def recording_fsync(fd):
+            fsync(fd)
+            synced.set()
+
+        with patch('os.fsync', recording_fsync):
+            course_service.enroll_student(self.course_id, 400)
+            self.assertTrue(synced.wait(5))
+
+    def test_new_ids_continue_after_stored_ids(self):
+        course_service = self.reopen()
+
+        self.assertEqual(self.assignment_id + 1, course_service.create_course("Second Course"))
+
+    def test_columnar_courses_are_durable(self):
+        course_service = CourseServiceImpl(self.course_repository, course_type=ColumnarCourse)
+        course_id = course_service.create_course("Columnar Course")
+        assignment_id = course_service.create_assignment(course_id, "Assignment 1")
+        course_service.enroll_student(course_id, 100)
+        course_service.submit_assignment(course_id, 100, assignment_id, 55)
+
+        course = self.reopen().get_course_by_id(course_id)
+
+        self.assertIsInstance(course, ColumnarCourse)
+        self.assertEqual(55, course.get_grade(100, assignment_id))
+
+class TestBinarySnapshotCourseRepository(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_service = CourseServiceImpl(CourseRepositoryImpl())
+        self.course_id = self.course_service.create_course("Test Course")
+        self.assignment_ids = self.course_service.create_assignments(self.course_id, ["Assignment 1", "Assignment 2"])
+        self.course_service.enroll_students(self.course_id, [300, 100, 400, 200])
+        self.course_service.submit_assignments(self.course_id, [(100, self.assignment_ids[0], 90), (200, self.assignment_ids[0], 60),
+                                                                (200, self.assignment_ids[1], 80), (300, self.assignment_ids[1], 90)])
+        self.empty_course_id = self.course_service.create_course("Empty Course")
+        self.path = os.path.join(tempfile.mkdtemp(), 'courses.bin')
+        write_binary_snapshot(self.path, self.course_service.iter_courses())
+        self.course_repository = BinarySnapshotCourseRepository(self.path)
+        self.archived_course_service = CourseServiceImpl(self.course_repository)
+
+    def tearDown(self) -> None:
+        self.course_repository.close()
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_get_course_matches_the_original(self):
+        original = self.course_service.get_course_by_id(self.course_id)
+
+        course = self.course_repository.get_course(self.course_id)
+
+        self.assertEqual(original.students, course.students)
+        self.assertEqual(original.assignments, course.assignments)
+        self.assertEqual(dict(original.submissions), course.submissions)
+        self.assertEqual(original.student_rankings, course.student_rankings)
+
+    def test_grade_queries(self):
+        self.assertEqual(75, self.archived_course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0]))
+        self.assertEqual(70, self.archived_course_service.get_student_grade_avg(self.course_id, 200))
+        self.assertEqual([100, 300], self.archived_course_service.get_top_k_students(self.course_id, 2))
+        self.assertEqual([200, 300, 100], self.archived_course_service.get_bottom_k_students(self.course_id, 5))
+        self.assertEqual([100, 300, 200], self.archived_course_service.get_students_between_averages(self.course_id, 70, 90))
+        self.assertEqual(self.course_service.get_students_above_average_in_all_courses(60), self.archived_course_service.get_students_above_average_in_all_courses(60))
+        with self.assertRaises(Exception):
+            self.archived_course_service.get_student_grade_avg(self.course_id, 400)
+        with self.assertRaises(Exception):
+            self.archived_course_service.get_student_grade_avg(self.course_id, 500)
+
+    def test_grade_distributions(self):
+        for assignment_id in self.assignment_ids:
+            self.assertEqual(self.course_service.get_assignment_grade_distribution(self.course_id, assignment_id),
+                             self.archived_course_service.get_assignment_grade_distribution(self.course_id, assignment_id))
+        self.assertEqual(self.course_service.get_course_grade_distribution(self.course_id), self.archived_course_service.get_course_grade_distribution(self.course_id))
+        self.assertEqual(80, self.archived_course_service.get_course_median(self.course_id))
+        with self.assertRaises(Exception):
+            self.archived_course_service.get_course_median(self.empty_course_id)
+
+    def test_student_queries(self):
+        self.assertEqual(self.course_service.get_student_transcript(200), self.archived_course_service.get_student_transcript(200))
+        self.assertEqual([self.course_id], [course.id for course in self.archived_course_service.get_courses_for_student(400)])
+        self.assertEqual([], self.archived_course_service.get_courses_for_student(500))
+
+    def test_courses_with_whole_float_grades_are_archived(self):
+        self.course_service.submit_assignment(self.course_id, 400, self.assignment_ids[0], 90.0)
+        restored = Course(2, "Restored Course", {100}, {1000: "Assignment 1"}, {(100, 1000): 70.0})
+        write_binary_snapshot(self.path + '.2', [*self.course_service.iter_courses(), restored])
+        course_repository = BinarySnapshotCourseRepository(self.path + '.2')
+        try:
+            self.assertEqual(90, course_repository.get_course(self.course_id).get_grade(400, self.assignment_ids[0]))
+            self.assertEqual((70, 1), course_repository.get_student_grade_total(2, 100))
+        finally:
+            course_repository.close()
+
+    def test_former_students_keep_their_grades(self):
+        self.course_service.enroll_student(self.course_id, 500)
+        self.course_service.submit_assignment(self.course_id, 500, self.assignment_ids[0], 30)
+        self.course_service.dropout_student(self.course_id, 500)
+        write_binary_snapshot(self.path + '.2', self.course_service.iter_courses())
+        course_repository = BinarySnapshotCourseRepository(self.path + '.2')
+        try:
+            original, course = self.course_service.get_course_by_id(self.course_id), course_repository.get_course(self.course_id)
+            self.assertEqual((original.students, dict(original.submissions)), (course.students, course.submissions))
+            self.assertEqual(self.course_service.get_assignment_grade_distribution(self.course_id, self.assignment_ids[0]),
+                             course_repository.get_assignment_grade_histogram(self.course_id, self.assignment_ids[0]))
+            self.assertEqual((180, 3), course_repository.get_assignment_grade_total(self.course_id, self.assignment_ids[0]))
+            self.assertIsNone(course_repository.get_student_grade_total(self.course_id, 500))
+            self.assertEqual([], course_repository.get_courses_for_student(500))
+        finally:
+            course_repository.close()
+
+    def test_course_summaries_page_by_id(self):
+        self.assertEqual(list(self.course_service.iter_course_summaries()), list(self.archived_course_service.iter_course_summaries(page_size=1)))
+        self.assertEqual([], self.course_repository.get_course_summary_page(self.empty_course_id, 10))
+
+    def test_missing_course(self):
+        with self.assertRaises(Exception):
+            self.course_repository.get_course(999)
+
+    def test_writes_are_rejected(self):
+        with self.assertRaises(Exception):
+            self.archived_course_service.enroll_student(self.course_id, 500)
+        self.assertFalse(self.archived_course_service.delete_course(self.course_id))
+
+    def test_ids_must_fit_in_64_bits(self):
+        with self.assertRaises(ValueError):
+            write_binary_snapshot(self.path, [Course(1, "Test Course", students={"student-1"})])
+        self.assertEqual(['courses.bin'], os.listdir(os.path.dirname(self.path)))
+
+class TestAnalyticsCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.analytics_cache = AnalyticsCache(max_entries=3, ttl=10, clock=lambda: self.now)
+
+    def test_hits_skip_the_computation(self):
+        compute = MagicMock(return_value=80)
+
+        values = [self.analytics_cache.get_or_compute(1, 'query', (5,), compute) for _ in range(3)]
+
+        self.assertEqual([80, 80, 80], values)
+        compute.assert_called_once()
+        self.assertEqual((2, 1), self.analytics_cache.stats()[:2])
+
+    def test_errors_are_not_cached(self):
+        compute = MagicMock(side_effect=[Exception("no submissions"), 80])
+
+        with self.assertRaises(Exception):
+            self.analytics_cache.get_or_compute(1, 'query', (5,), compute)
+
+        self.assertEqual(80, self.analytics_cache.get_or_compute(1, 'query', (5,), compute))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for args in [(1,), (2,), (3,)]:
+            self.analytics_cache.get_or_compute(1, 'query', args, lambda: 0)
+        self.analytics_cache.get_or_compute(1, 'query', (1,), lambda: 0)
+
+        self.analytics_cache.get_or_compute(1, 'query', (4,), lambda: 0)
+
+        self.assertEqual(1, self.analytics_cache.get_or_compute(1, 'query', (2,), lambda: 1))
+        self.assertEqual(0, self.analytics_cache.get_or_compute(1, 'query', (1,), lambda: 1))
+        self.assertEqual(2, self.analytics_cache.stats().evictions)
+
+    def test_memory_bound(self):
+        analytics_cache = AnalyticsCache(max_bytes=2000)
+
+        for course_id in range(10):
+            analytics_cache.get_or_compute(course_id, 'query', (), lambda: list(range(20)))
+
+        stats = analytics_cache.stats()
+        self.assertLessEqual(stats.bytes, 2000)
+        self.assertEqual(10, stats.entries + stats.evictions)
+        self.assertGreater(stats.evictions, 0)
+
+    def test_entries_expire_after_the_ttl(self):
+        self.analytics_cache.get_or_compute(1, 'query', (), lambda: 0)
+        self.now = 10
+
+        self.assertEqual(1, self.analytics_cache.get_or_compute(1, 'query', (), lambda: 1))
+        self.assertEqual(1, self.analytics_cache.stats().expirations)
+
+    def test_invalidate_drops_only_the_given_entries(self):
+        self.analytics_cache = AnalyticsCache()
+        for course_id, query, args in [(1, 'first', (1,)), (1, 'first', (2,)), (1, 'second', ()), (2, 'first', (1,))]:
+            self.analytics_cache.get_or_compute(course_id, query, args, lambda: 0)
+
+        self.analytics_cache.invalidate(1, 'first', (1,))
+        self.assertEqual(3, self.analytics_cache.stats().entries)
+        self.analytics_cache.invalidate(1, 'first')
+        self.assertEqual(2, self.analytics_cache.stats().entries)
+        self.analytics_cache.invalidate(1)
+        self.assertEqual(1, self.analytics_cache.stats().entries)
+        self.assertEqual(3, self.analytics_cache.stats().invalidations)
+
+    def test_a_result_computed_during_an_invalidation_is_not_stored(self):
+        def compute_while_a_write_lands():
+            self.analytics_cache.invalidate(1)
+            return 0
+
+        self.analytics_cache.get_or_compute(1, 'query', (), compute_while_a_write_lands)
+
+        self.assertEqual(1, self.analytics_cache.get_or_compute(1, 'query', (), lambda: 1))
+
+class TestCourseServiceImplAnalyticsCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_repository = MagicMock(wraps=CourseRepositoryImpl())
+        self.course_service = CourseServiceImpl(self.course_repository, analytics_cache=AnalyticsCache())
+        self.course_id = self.course_service.create_course("Test Course")
+        self.assignment_ids = self.course_service.create_assignments(self.course_id, ["Assignment 1", "Assignment 2"])
+        self.course_service.enroll_students(self.course_id, [100, 200])
+        self.course_service.submit_assignments(self.course_id, [(100, self.assignment_ids[0], 60), (200, self.assignment_ids[0], 80), (200, self.assignment_ids[1], 90)])
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        for _ in range(3):
+            self.assertEqual(70, self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0]))
+            self.assertEqual([200, 100], self.course_service.get_top_five_students(self.course_id))
+
+        self.course_repository.get_assignment_grade_total.assert_called_once()
+        self.course_repository.get_top_k_students.assert_called_once()
+
+    def test_a_submission_invalidates_only_what_it_changes(self):
+        self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0])
+        self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[1])
+        self.course_service.get_student_grade_avg(self.course_id, 200)
+        self.course_service.get_top_five_students(self.course_id)
+
+        self.course_service.submit_assignment(self.course_id, 100, self.assignment_ids[1], 100)
+
+        stats = self.course_service.analytics_cache.stats()
+        self.assertEqual((2, 2), (stats.invalidations, stats.entries))
+        self.assertEqual(95, self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[1]))
+        self.assertEqual([200, 100], self.course_service.get_top_five_students(self.course_id))
+        self.assertEqual(2, self.course_repository.get_top_k_students.call_count)
+        self.assertEqual(70, self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0]))
+        self.assertEqual(3, self.course_repository.get_assignment_grade_total.call_count)
+
+    def test_dropout_and_delete_invalidate(self):
+        self.assertEqual(70, self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0]))
+        self.assertEqual([200, 100], self.course_service.get_top_five_students(self.course_id))
+
+        self.course_service.dropout_student(self.course_id, 200)
+        self.assertEqual(70, self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0])) # the grades stay
+        self.assertEqual([100], self.course_service.get_top_five_students(self.course_id))
+        self.course_service.enroll_student(self.course_id, 200)
+        self.assertEqual([200, 100], self.course_service.get_top_five_students(self.course_id))
+
+        self.course_service.delete_course(self.course_id)
+        with self.assertRaises(Exception):
+            self.course_service.get_assignment_grade_avg(self.course_id, self.assignment_ids[0])
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = Metrics()
+        self.course_service = instrument(CourseServiceImpl(CourseRepositoryImpl()), self.metrics)
+        self.course_id = self.course_service.create_course("Test Course")
+        self.assignment_id = self.course_service.create_assignment(self.course_id, "Assignment 1")
+        self.course_service.enroll_students(self.course_id, [100, 200])
+        self.metrics.reset()
+
+    def test_calls_errors_and_latencies_are_recorded_per_component_and_method(self):
+        self.course_service.submit_assignment(self.course_id, 100, self.assignment_id, 80)
+        self.assertEqual(80, self.course_service.get_student_grade_avg(self.course_id, 100))
+        with self.assertRaises(Exception):
+            self.course_service.get_student_grade_avg(self.course_id, 200)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual((2, 1), (snapshot['service.get_student_grade_avg']['calls'], snapshot['service.get_student_grade_avg']['errors']))
+        self.assertEqual(2, snapshot['repository.get_student_grade_total']['calls'])
+        self.assertEqual(1, snapshot['database.update']['calls'])
+        latency = snapshot['service.submit_assignment']['latency_seconds']
+        self.assertEqual((1, 1), (latency['count'], latency['buckets']['+Inf']))
+
+    def test_copies_are_counted(self):
+        self.course_service.submit_assignment(self.course_id, 100, self.assignment_id, 80)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual({'documents_copied': 1, 'document_fields_replaced': 7}, snapshot['database.update']['counters'])
+        self.assertEqual(7, snapshot['repository.save_course']['counters']['containers_copied'])
+
+    def test_grades_scanned_count_towards_every_call_in_progress(self):
+        self.course_service.submit_assignment(self.course_id, 100, self.assignment_id, 80)
+        checker = Instrumented(SimpleNamespace(check=lambda: self.course_service.get_course_by_id(self.course_id).aggregates_are_consistent()), self.metrics, 'checker')
+        checker.check()
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(3, snapshot['checker.check']['grades_scanned']['sum']) # the submission, once by each rebuild it checks
+        self.assertEqual(0, snapshot['service.get_course_by_id']['grades_scanned']['sum'])
+        self.assertEqual(0, snapshot['service.submit_assignment']['grades_scanned']['sum'])
+
+    def test_disabled_metrics_record_nothing(self):
+        self.metrics.enabled = False
+        self.course_service.submit_assignment(self.course_id, 100, self.assignment_id, 80)
+
+        self.assertEqual(80, self.course_service.get_student_grade_avg(self.course_id, 100))
+        self.assertEqual({}, self.metrics.snapshot())
+
+    def test_exports(self):
+        self.course_service.get_top_five_students(self.course_id)
+
+        self.assertEqual(self.metrics.snapshot(), json.loads(self.metrics.to_json()))
+        prometheus = self.metrics.to_prometheus()
+        self.assertIn('# TYPE course_call_duration_seconds histogram', prometheus)
+        self.assertIn('course_calls_total{component="service",method="get_top_five_students"} 1', prometheus)
+        self.assertIn('course_call_duration_seconds_count{component="repository",method="get_top_k_students"} 1', prometheus)
+
+    def test_the_profiler_keeps_sampled_calls_over_the_threshold(self):
+        profiler = SlowCallProfiler(threshold=0, sample_rate=1)
+        course_service = instrument(CourseServiceImpl(CourseRepositoryImpl()), self.metrics, profiler)
+        course_service.create_course("Profiled Course")
+
+        slow_calls = profiler.slow_calls()
+        self.assertEqual(['service.create_course'], [slow_call.name for slow_call in slow_calls]) # nested calls are not profiled again
+        self.assertIn('create_course', slow_calls[0].profile)
+        profiler.sample_rate = 0
+        course_service.create_course("Unprofiled Course")
+        self.assertEqual(1, len(profiler.slow_calls()))
+
+class TestReportEngine(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_service = CourseServiceImpl(CourseRepositoryImpl())
+        for number in range(5):
+            course_id = self.course_service.create_course(f"Course {number}")
+            assignment_ids = self.course_service.create_assignments(course_id, ["Assignment 1", "Assignment 2", "Assignment 3"])
+            self.course_service.enroll_students(course_id, [100, 200, 300])
+            self.course_service.submit_assignments(course_id, [(100, assignment_ids[0], 50 + number), (200, assignment_ids[0], 81), (200, assignment_ids[1], 90)])
+        self.course_service.course_type = ColumnarCourse
+        columnar_course_id = self.course_service.create_course("Columnar Course")
+        assignment_id = self.course_service.create_assignment(columnar_course_id, "Assignment 1")
+        self.course_service.enroll_students(columnar_course_id, [100, 200])
+        self.course_service.submit_assignment(columnar_course_id, 200, assignment_id, 70)
+
+    def test_serial_report(self):
+        report = next(serial_reports(self.course_service.iter_courses()))
+        assignment_ids = list(report.assignment_averages)
+
+        self.assertEqual(CourseReport(1, "Course 0", {assignment_ids[0]: 65, assignment_ids[1]: 90, assignment_ids[2]: None}, {100: 50, 200: 85, 300: None}, [200, 100]), report)
+
+    def test_packed_courses_give_the_serial_report(self):
+        for course in self.course_service.iter_courses():
+            self.assertEqual(next(serial_reports([course])), report_from_packed_course(pack_course(course)))
+
+    def test_parallel_reports_equal_serial_reports(self):
+        expected = list(serial_reports(self.course_service.iter_courses()))
+
+        for share_memory in (True, False):
+            engine = ParallelReportEngine(workers=2, chunk_size=2, max_pending=1, share_memory=share_memory)
+            self.assertEqual(expected, list(engine.reports(self.course_service.iter_courses())))
+        self.assertEqual([], list(ParallelReportEngine(workers=1).reports([])))
+
+class TestCourseServiceImplGradeDistributions(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_service = CourseServiceImpl(CourseRepositoryImpl(), analytics_cache=AnalyticsCache())
+        self.course_id = self.course_service.create_course("Test Course")
+        self.assignment_ids = self.course_service.create_assignments(self.course_id, ["Assignment 1", "Assignment 2"])
+        self.course_service.enroll_students(self.course_id, [100, 200, 300])
+        self.course_service.submit_assignments(self.course_id, [(100, self.assignment_ids[0], 60), (200, self.assignment_ids[0], 80), (300, self.assignment_ids[0], 100),
+                                                                (100, self.assignment_ids[1], 50)])
+
+    def test_assignment_queries(self):
+        distribution = self.course_service.get_assignment_grade_distribution(self.course_id, self.assignment_ids[0])
+
+        self.assertEqual(101, len(distribution))
+        self.assertEqual({60: 1, 80: 1, 100: 1}, {grade: count for grade, count in enumerate(distribution) if count})
+        self.assertEqual(80, self.course_service.get_assignment_median(self.course_id, self.assignment_ids[0]))
+        self.assertEqual(100, self.course_service.get_assignment_grade_percentile(self.course_id, self.assignment_ids[0], 90))
+        with self.assertRaises(Exception):
+            self.course_service.get_assignment_grade_distribution(self.course_id, 999)
+
+    def test_course_queries(self):
+        self.assertEqual(4, sum(self.course_service.get_course_grade_distribution(self.course_id)))
+        self.assertEqual(60, self.course_service.get_course_median(self.course_id))
+        self.assertEqual(50, self.course_service.get_course_grade_percentile(self.course_id, 0))
+
+    def test_writes_invalidate_cached_distributions(self):
+        self.assertEqual(80, self.course_service.get_assignment_median(self.course_id, self.assignment_ids[0]))
+        self.assertEqual(60, self.course_service.get_course_median(self.course_id))
+
+        self.course_service.submit_assignment(self.course_id, 200, self.assignment_ids[1], 55)
+        self.assertEqual(60, self.course_service.get_course_median(self.course_id))
+        self.course_service.dropout_student(self.course_id, 300) # a dropout keeps their grades
+        self.assertEqual(80, self.course_service.get_assignment_median(self.course_id, self.assignment_ids[0]))
+        self.course_service.enroll_student(self.course_id, 400)
+        self.course_service.submit_assignment(self.course_id, 400, self.assignment_ids[0], 40)
+        self.assertEqual(60, self.course_service.get_assignment_median(self.course_id, self.assignment_ids[0]))
+        self.assertEqual(55, self.course_service.get_course_median(self.course_id))
+
+class TestCourseServiceImplTransactions(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_repository = CourseRepositoryImpl()
+        self.course_service = CourseServiceImpl(self.course_repository, analytics_cache=AnalyticsCache())
+        self.course_id = self.course_service.create_course("Test Course")
+        self.other_course_id = self.course_service.create_course("Other Course")
+        self.course_service.enroll_students(self.course_id, [100, 200])
+
+    def test_operations_are_saved_together_at_exit(self):
+        self.course_repository.save_course = MagicMock(wraps=self.course_repository.save_course)
+
+        with self.course_service.transaction(self.course_id, self.other_course_id) as transaction:
+            assignment_id = transaction.create_assignment(self.course_id, "Assignment 1")
+            transaction.submit_assignments(self.course_id, [(100, assignment_id, 60), (200, assignment_id, 80)])
+            transaction.enroll_student(self.other_course_id, 100)
+            self.assertEqual(70, transaction.get_assignment_grade_avg(self.course_id, assignment_id)) # reads its own writes
+            self.assertEqual({}, self.course_service.get_course_by_id(self.course_id).assignments)
+
+        self.assertEqual(2, self.course_repository.save_course.call_count)
+        self.assertEqual(70, self.course_service.get_assignment_grade_avg(self.course_id, assignment_id))
+        self.assertEqual([self.course_id, self.other_course_id], [course.id for course in self.course_service.get_courses_for_student(100)])
+
+    def test_an_exception_rolls_everything_back(self):
+        with self.assertRaises(ValueError):
+            with self.course_service.transaction(self.course_id) as transaction:
+                transaction.create_assignment(self.course_id, "Assignment 1")
+                transaction.create_course("New Course")
+                transaction.dropout_student(self.course_id, 100)
+                raise ValueError("Workflow failed")
+
+        self.assertEqual({}, self.course_service.get_course_by_id(self.course_id).assignments)
+        self.assertEqual({100, 200}, self.course_service.get_course_by_id(self.course_id).students)
+        self.assertEqual(2, len(self.course_service.get_courses()))
+
+    def test_a_failed_save_at_commit_puts_back_the_courses_saved_before_it(self):
+        save_course = self.course_repository.save_course
+        def save_course_failing_for_the_other_course(course):
+            if course.id == self.other_course_id:
+                raise IOError("Disk full")
+            save_course(course)
+        self.course_repository.save_course = save_course_failing_for_the_other_course
+
+        with self.assertRaises(IOError):
+            with self.course_service.transaction(self.course_id, self.other_course_id) as transaction:
+                assignment_id = transaction.create_assignment(self.course_id, "Assignment 1")
+                transaction.submit_assignment(self.course_id, 200, assignment_id, 90)
+                transaction.dropout_student(self.course_id, 100)
+                transaction.create_course("New Course")
+                transaction.enroll_student(self.other_course_id, 100)
+
+        self.assertEqual({}, self.course_service.get_course_by_id(self.course_id).assignments)
+        self.assertEqual({100, 200}, self.course_service.get_course_by_id(self.course_id).students)
+        self.assertEqual([self.course_id], [course.id for course in self.course_service.get_courses_for_student(100)])
+        self.assertEqual([self.course_id, self.other_course_id], [course.id for course in self.course_service.get_courses()])
+
+    def test_a_failed_commit_names_the_courses_it_could_not_roll_back(self):
+        course_repository = MagicMock(wraps=self.course_repository, spec=CourseRepository)
+        course_repository.save_course.side_effect = [None, IOError("Disk full")]
+        course_service = CourseServiceImpl(course_repository)
+
+        with self.assertRaisesRegex(Exception, str(self.course_id)) as raised:
+            with course_service.transaction(self.course_id, self.other_course_id) as transaction:
+                transaction.enroll_student(self.course_id, 300)
+                transaction.enroll_student(self.other_course_id, 300)
+
+        self.assertIsInstance(raised.exception.__cause__, IOError)
+
+    def test_writes_to_courses_outside_the_transaction_are_refused(self):
+        with self.assertRaises(Exception):
+            with self.course_service.transaction(self.course_id) as transaction:
+                transaction.enroll_student(self.course_id, 300)
+                transaction.enroll_student(self.other_course_id, 300)
+
+        self.assertEqual([], self.course_service.get_courses_for_student(300))
+
+    def test_created_and_deleted_courses_commit_and_invalidate_the_cache(self):
+        assignment_id = self.course_service.create_assignment(self.course_id, "Assignment 1")
+        self.course_service.submit_assignment(self.course_id, 100, assignment_id, 60)
+        self.assertEqual(60, self.course_service.get_assignment_grade_avg(self.course_id, assignment_id))
+
+        with self.course_service.transaction(self.course_id, self.other_course_id) as transaction:
+            transaction.submit_assignment(self.course_id, 200, assignment_id, 80)
+            self.assertTrue(transaction.delete_course(self.other_course_id))
+            self.assertFalse(transaction.delete_course(self.other_course_id))
+            new_course_id = transaction.create_course("New Course")
+            transaction.enroll_student(new_course_id, 300)
+
+        self.assertEqual(70, self.course_service.get_assignment_grade_avg(self.course_id, assignment_id))
+        self.assertEqual([self.course_id, new_course_id], [course.id for course in self.course_service.get_courses()])
+        self.assertEqual({300}, self.course_service.get_course_by_id(new_course_id).students)
+
+    def test_other_writers_wait_for_the_transaction(self):
+        with self.course_service.transaction(self.course_id) as transaction:
+            transaction.enroll_student(self.course_id, 300)
+            writer = threading.Thread(target=self.course_service.dropout_student, args=(self.course_id, 300))
+            writer.start()
+            writer.join(timeout=0.05)
+            self.assertTrue(writer.is_alive())
+        writer.join()
+
+        self.assertEqual({100, 200}, self.course_service.get_course_by_id(self.course_id).students)
+
+    def test_the_thread_of_a_transaction_writes_through_it_only(self):
+        with self.course_service.transaction(self.course_id) as transaction:
+            transaction.enroll_student(self.course_id, 300)
+            with self.assertRaises(Exception):
+                self.course_service.enroll_student(self.course_id, 400)
+            with self.assertRaises(Exception): # another thread's transaction may hold its stripe and wait for ours
+                self.course_service.enroll_student(self.other_course_id, 300)
+            with self.assertRaises(Exception):
+                with self.course_service.transaction(self.other_course_id):
+                    pass
+
+        self.assertEqual([self.course_id], [course.id for course in self.course_service.get_courses_for_student(300)])
+        self.assertTrue(self.course_service.enroll_student(self.other_course_id, 300))
+
+class TestShardedCourseRepository(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_repository = ShardedCourseRepository(shards=3)
+        self.course_service = CourseServiceImpl(self.course_repository)
+        self.course_ids = [self.course_service.create_course(f"Course {number}") for number in range(5)]
+        for course_id in self.course_ids:
+            self.course_service.enroll_students(course_id, [100, 200])
+        self.assignment_id = self.course_service.create_assignment(self.course_ids[0], "Assignment 1")
+
+    def tearDown(self) -> None:
+        self.course_repository.close()
+
+    def test_writes_and_reads_through_the_shards(self):
+        self.course_service.submit_assignments(self.course_ids[0], [(100, self.assignment_id, 60), (200, self.assignment_id, 90)])
+
+        self.assertEqual(75, self.course_service.get_assignment_grade_avg(self.course_ids[0], self.assignment_id))
+        self.assertEqual([200, 100], self.course_service.get_top_five_students(self.course_ids[0]))
+        self.assertEqual([200], self.course_service.get_students_above_average(self.course_ids[0], 60))
+        self.assertEqual([(self.course_ids[0], 100)], self.course_service.get_students_below_average_in_all_courses(70))
+        self.assertEqual(self.course_ids, [course.id for course in self.course_service.get_courses()])
+        self.assertEqual(self.course_ids[1:4], [course_summary.id for course_summary in self.course_service.get_course_summaries(self.course_ids[0], 3)])
+        self.assertEqual(TranscriptEntry(self.course_ids[0], "Course 0", 90, 1), self.course_service.get_student_transcript(200)[0])
+
+    def test_a_batch_that_raises_is_not_saved(self):
+        with self.assertRaises(Exception):
+            self.course_service.submit_assignments(self.course_ids[0], [(100, self.assignment_id, 60), (200, self.assignment_id, "A")])
+
+        self.assertEqual((0, 0), self.course_repository.get_assignment_grade_total(self.course_ids[0], self.assignment_id))
+        self.course_service.submit_assignment(self.course_ids[0], 200, self.assignment_id, 90)
+        self.assertEqual(90, self.course_service.get_assignment_grade_avg(self.course_ids[0], self.assignment_id))
+
+    def test_a_service_write_is_one_request_to_its_shard(self):
+        shard = self.course_repository._shard_for(self.course_ids[0])
+        shard.call = MagicMock(wraps=shard.call)
+
+        self.course_service.submit_assignments(self.course_ids[0], [(100, self.assignment_id, 60), (200, self.assignment_id, 90)])
+
+        shard.call.assert_called_once_with('update_course', self.course_ids[0], 'submit_assignment', [(100, self.assignment_id, 60), (200, self.assignment_id, 90)])
+        self.assertEqual(75, self.course_service.get_assignment_grade_avg(self.course_ids[0], self.assignment_id))
+
+    def test_service_writes_are_published_to_a_change_feed(self):
+        change_feed = ChangeFeed()
+        course_service = CourseServiceImpl(ChangeFeedRepository(self.course_repository, change_feed))
+
+        course_service.enroll_students(self.course_ids[1], [200, 300])
+
+        self.assertEqual([(self.course_ids[1], StudentEnrolled(300))], [(event.course_id, event.change) for event in change_feed.read(0)])
+
+    def test_reading_a_loaded_course_fetches_it(self):
+        course = self.course_repository.get_course(self.course_ids[0])
+        course.submit_assignment(100, self.assignment_id, 70)
+
+        self.assertEqual({100, 200}, set(course.students))
+        course.dropout_student(200)
+        self.course_repository.save_course(course)
+        self.assertEqual([100], list(self.course_service.get_course_by_id(self.course_ids[0]).students))
+        self.assertEqual(70, self.course_service.get_student_grade_avg(self.course_ids[0], 100))
+
+    def test_saving_a_listed_course_replays_its_changes(self):
+        course = self.course_service.get_courses()[1]
+        course.enroll_student(300)
+        self.course_repository.save_course(course)
+
+        self.assertEqual(3, len(self.course_service.get_course_by_id(self.course_ids[1]).students))
+
+    def test_delete_course(self):
+        self.assertTrue(self.course_service.delete_course(self.course_ids[2]))
+
+        self.assertFalse(self.course_repository.delete_course(self.course_ids[2]))
+        self.assertEqual(4, len(self.course_service.get_courses()))
+
+class TestCourseServiceImplThresholdQueries(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_service = CourseServiceImpl(CourseRepositoryImpl(), analytics_cache=AnalyticsCache())
+        self.course_ids = [self.course_service.create_course(f"Course {number}") for number in range(2)]
+        for course_id, grades in zip(self.course_ids, [{100: 55, 200: 72, 300: 90}, {100: 65, 400: 40}]):
+            assignment_id = self.course_service.create_assignment(course_id, "Assignment 1")
+            self.course_service.enroll_students(course_id, list(grades))
+            self.course_service.submit_assignments(course_id, [(student_id, assignment_id, grade) for student_id, grade in grades.items()])
+
+    def test_course_queries(self):
+        self.assertEqual([100], self.course_service.get_students_below_average(self.course_ids[0], 60))
+        self.assertEqual([300, 200], self.course_service.get_students_above_average(self.course_ids[0], 60))
+        self.assertEqual([200], self.course_service.get_students_between_averages(self.course_ids[0], 70, 80))
+        with self.assertRaises(Exception):
+            self.course_service.get_students_below_average(999, 60)
+
+    def test_cross_course_queries(self):
+        self.assertEqual([(self.course_ids[0], 100), (self.course_ids[1], 400)], self.course_service.get_students_below_average_in_all_courses(60))
+        self.assertEqual([(self.course_ids[0], 300), (self.course_ids[0], 200), (self.course_ids[1], 100)], self.course_service.get_students_above_average_in_all_courses(60))
+        self.assertEqual([(self.course_ids[0], 100), (self.course_ids[1], 100)], self.course_service.get_students_between_averages_in_all_courses(50, 70))
+
+    def test_writes_invalidate_cached_results(self):
+        self.assertEqual([100], self.course_service.get_students_below_average(self.course_ids[0], 60))
+
+        assignment_id = self.course_service.create_assignment(self.course_ids[0], "Assignment 2")
+        self.course_service.submit_assignment(self.course_ids[0], 100, assignment_id, 95)
+        self.assertEqual([], self.course_service.get_students_below_average(self.course_ids[0], 60))
+        self.course_service.submit_assignment(self.course_ids[0], 200, assignment_id, 10)
+        self.assertEqual([200], self.course_service.get_students_below_average(self.course_ids[0], 60))
+        self.course_service.dropout_student(self.course_ids[0], 200)
+        self.assertEqual([], self.course_service.get_students_below_average(self.course_ids[0], 60))
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self) -> None:
+        self.change_feed = ChangeFeed()
+        self.course_service = CourseServiceImpl(ChangeFeedRepository(CourseRepositoryImpl(), self.change_feed))
+
+    def test_writes_are_published_in_order(self):
+        course_id = self.course_service.create_course("Test Course")
+        assignment_id = self.course_service.create_assignment(course_id, "Assignment 1")
+        self.course_service.enroll_students(course_id, [100, 200])
+        self.course_service.submit_assignment(course_id, 100, assignment_id, 80)
+        self.course_service.submit_assignment(course_id, 100, assignment_id, 90) # rejected, so not published
+        self.course_service.dropout_student(course_id, 200)
+        self.course_service.delete_course(course_id)
+        self.course_service.delete_course(course_id)
+
+        self.assertEqual([
+            ChangeEvent(1, course_id, CourseCreated("Test Course")),
+            ChangeEvent(2, course_id, AssignmentCreated(assignment_id, "Assignment 1")),
+            ChangeEvent(3, course_id, StudentEnrolled(100)),
+            ChangeEvent(4, course_id, StudentEnrolled(200)),
+            ChangeEvent(5, course_id, AssignmentSubmitted(100, assignment_id, 80)),
+            ChangeEvent(6, course_id, StudentDroppedOut(200)),
+            ChangeEvent(7, course_id, CourseDeleted()),
+        ], self.change_feed.read(0))
+
+    def test_transactions_publish_at_commit(self):
+        course_id = self.course_service.create_course("Test Course")
+        subscription = self.change_feed.subscribe()
+
+        with self.course_service.transaction(course_id) as transaction:
+            transaction.enroll_students(course_id, [100, 200])
+            self.assertEqual([], subscription.poll())
+        with self.assertRaises(ValueError):
+            with self.course_service.transaction(course_id) as transaction:
+                transaction.enroll_student(course_id, 300)
+                raise ValueError("Workflow failed")
+
+        self.assertEqual([StudentEnrolled(100), StudentEnrolled(200)], [event.change for event in subscription.poll()])
+
+    def test_subscriptions_resume_from_their_sequence(self):
+        course_id = self.course_service.create_course("Test Course")
+        subscription = self.change_feed.subscribe(0)
+        self.assertEqual([1], [event.sequence for event in subscription.poll()])
+        self.course_service.enroll_students(course_id, [100, 200, 300])
+
+        self.assertEqual([2, 3], [event.sequence for event in subscription.poll(limit=2)])
+        resumed = self.change_feed.subscribe(subscription.sequence)
+        self.assertEqual([StudentEnrolled(300)], [event.change for event in resumed.poll()])
+        self.assertEqual([], resumed.poll(timeout=0.01))
+
+    def test_waiting_subscriptions_wake_on_publish(self):
+        course_id = self.course_service.create_course("Test Course")
+        subscription = self.change_feed.subscribe()
+        timer = threading.Timer(0.05, self.course_service.enroll_student, (course_id, 100))
+        timer.start()
+        try:
+            self.assertEqual([StudentEnrolled(100)], [event.change for event in subscription.poll(timeout=5)])
+        finally:
+            timer.join()
+
+    def test_sequences_past_the_retention_cannot_be_resumed(self):
+        change_feed = ChangeFeed(retention=2)
+        for student_id in range(5):
+            change_feed.publish(1, [StudentEnrolled(student_id)])
+
+        self.assertEqual([4, 5], [event.sequence for event in change_feed.read(3)])
+        with self.assertRaises(Exception):
+            change_feed.read(0)
+
+    def test_retention_keeps_at_least_one_event(self):
+        with self.assertRaises(ValueError):
+            ChangeFeed(retention=0)
+        change_feed = ChangeFeed(retention=1)
+        for student_id in range(5):
+            change_feed.publish(1, [StudentEnrolled(student_id)])
+
+        self.assertEqual([5], [event.sequence for event in change_feed.read(4)])
+
+    def test_sequences_the_feed_has_not_reached_cannot_be_resumed(self):
+        self.course_service.create_course("Test Course")
+
+        self.assertEqual([], self.change_feed.read(1))
+        with self.assertRaises(Exception):
+            self.change_feed.read(2)
+        with self.assertRaises(Exception):
+            self.change_feed.subscribe(2)
+
+    def test_new_views_attach_from_the_oldest_retained_event(self):
+        change_feed = ChangeFeed(retention=2)
+        for student_id in range(5):
+            change_feed.publish(1, [AssignmentSubmitted(student_id, 1000, 50 + student_id)])
+        view = StudentGpaView()
+
+        change_feed.attach(view)
+
+        self.assertEqual([4, 3], view.get_top_students(5))
+        self.assertEqual(5, view.sequence)
+        change_feed.detach(view)
+        for student_id in range(5, 10):
+            change_feed.publish(1, [AssignmentSubmitted(student_id, 1000, 50 + student_id)])
+        with self.assertRaises(Exception):
+            change_feed.attach(view)
+
+    def test_readers_waiting_while_their_events_are_trimmed_get_an_error(self):
+        change_feed = ChangeFeed(retention=1)
+        change_feed.publish(1, [StudentEnrolled(100)])
+        timer = threading.Timer(0.05, change_feed.publish, (1, [StudentEnrolled(student_id) for student_id in range(200, 205)]))
+        timer.start()
+        try:
+            with self.assertRaises(Exception):
+                change_feed.read(1, timeout=5)
+        finally:
+            timer.join()
+
+    def test_student_gpa_view_follows_the_courses(self):
+        view = StudentGpaView()
+        self.change_feed.attach(view)
+        course_ids = [self.course_service.create_course(f"Course {number}") for number in range(2)]
+        for course_id, grades in zip(course_ids, [{100: 50, 200: 70, 300: 90}, {100: 91, 200: 80}]):
+            assignment_id = self.course_service.create_assignment(course_id, "Assignment 1")
+            self.course_service.enroll_students(course_id, list(grades))
+            self.course_service.submit_assignments(course_id, [(student_id, assignment_id, grade) for student_id, grade in grades.items()])
+
+        self.assertEqual(70, view.get_gpa(100)) # (50 + 91) / 2 floored
+        self.assertEqual([300, 200, 100], view.get_top_students(3))
+        self.assertEqual(self.change_feed.last_sequence, view.sequence)
+        self.course_service.dropout_student(course_ids[0], 100)
+        self.assertEqual(91, view.get_gpa(100))
+        self.assertEqual([100, 300], view.get_top_students(2))
+        self.course_service.delete_course(course_ids[1])
+        self.assertIsNone(view.get_gpa(100))
+        self.assertEqual([300, 200], view.get_top_students(5))
+        self.assertEqual({course_ids[0]: {200: (70, 1), 300: (90, 1)}}, view.course_grade_totals)
+
+    def test_student_gpa_view_counts_the_grades_of_returning_students_again(self):
+        view = StudentGpaView()
+        self.change_feed.attach(view)
+        course_id = self.course_service.create_course("Test Course")
+        assignment_id = self.course_service.create_assignment(course_id, "Assignment 1")
+        self.course_service.enroll_students(course_id, [100, 200])
+        self.course_service.submit_assignments(course_id, [(100, assignment_id, 40), (200, assignment_id, 60)])
+        self.course_service.dropout_student(course_id, 200)
+        self.assertEqual([100], view.get_top_students(2))
+
+        self.course_service.enroll_student(course_id, 200)
+
+        self.assertEqual(60, view.get_gpa(200))
+        self.assertEqual(self.course_service.get_top_k_students(course_id, 2), view.get_top_students(2))
+        self.assertEqual({}, view.dropped_grade_totals)
+
+    def test_student_gpa_view_ranks_across_chunks(self):
+        view = StudentGpaView()
+        view.student_rankings.CHUNK_SIZE = 2
+        grades = {student_id: (student_id * 37) % 101 for student_id in range(50)}
+        for sequence, (student_id, grade) in enumerate(grades.items(), 1):
+            view.apply(ChangeEvent(sequence, student_id % 3, AssignmentSubmitted(student_id, 1, grade)))
+        for sequence, student_id in enumerate(range(0, 50, 4), 100):
+            view.apply(ChangeEvent(sequence, student_id % 3, StudentDroppedOut(student_id)))
+
+        expected = sorted((student_id for student_id in grades if student_id % 4), key=lambda student_id: (-grades[student_id], student_id))
+        self.assertEqual(expected, view.get_top_students(50))
+        self.assertEqual(expected[:7], view.get_top_students(7))
+
+    def test_attached_views_catch_up_on_retained_events(self):
+        course_id = self.course_service.create_course("Test Course")
+        assignment_id = self.course_service.create_assignment(course_id, "Assignment 1")
+        self.course_service.enroll_students(course_id, [100, 200])
+        self.course_service.submit_assignments(course_id, [(100, assignment_id, 40), (200, assignment_id, 60)])
+        view = StudentGpaView()
+        self.change_feed.attach(view)
+        self.assertEqual([200, 100], view.get_top_students(2))
+
+        self.change_feed.detach(view)
+        self.course_service.dropout_student(course_id, 200)
+        self.assertEqual([200, 100], view.get_top_students(2))
+        self.change_feed.attach(view)
+        self.assertEqual([100], view.get_top_students(2))
+
+class TestCourseServiceImplPaging(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_service = CourseServiceImpl(CourseRepositoryImpl())
+        self.course_ids = [self.course_service.create_course(f"Course {number}") for number in range(7)]
+
+    def test_iter_courses_yields_every_course_in_id_order(self):
+        self.assertEqual(self.course_ids, [course.id for course in self.course_service.iter_courses(page_size=3)])
+
+    def test_iter_course_summaries_is_lazy(self):
+        course_summaries = self.course_service.iter_course_summaries(page_size=3)
+        first = next(course_summaries)
+        self.course_service.delete_course(self.course_ids[6])
+
+        self.assertEqual("Course 0", first.name)
+        self.assertEqual(self.course_ids[1:6], [course_summary.id for course_summary in course_summaries])
+
+    def test_get_course_summaries_from_cursor(self):
+        course_summaries = self.course_service.get_course_summaries(self.course_ids[4], 10)
+
+        self.assertEqual(self.course_ids[5:], [course_summary.id for course_summary in course_summaries])
+
+class TestCourseServiceImplConcurrency(unittest.TestCase):
+    def setUp(self) -> None:
+        self.course_service = CourseServiceImpl(CourseRepositoryImpl())
+        self.course_id = self.course_service.create_course("Test Course")
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6) # switch threads as often as possible to provoke interleaved read-modify-write cycles
+
+    def tearDown(self) -> None:
+        sys.setswitchinterval(self.switch_interval)
+
+    def test_concurrent_writes_to_one_course_are_not_lost(self):
+        number_of_threads = 16
+        number_of_students = 40
+        assignment_ids = self.course_service.create_assignments(self.course_id, ["First", "Second"])
+        self.run_in_threads(number_of_threads, lambda thread_number: [
+            self.course_service.enroll_student(self.course_id, thread_number * number_of_students + student_number)
+            for student_number in range(number_of_students)])
+        self.run_in_threads(number_of_threads, lambda thread_number: [
+            self.course_service.submit_assignment(self.course_id, thread_number * number_of_students + student_number, assignment_id, thread_number)
+            for student_number in range(number_of_students) for assignment_id in assignment_ids])
+
+        course = self.course_service.get_course_by_id(self.course_id)
+        self.assertEqual(number_of_threads * number_of_students, len(course.students))
+        self.assertEqual(number_of_threads * number_of_students * len(assignment_ids), len(course.submissions))
+        self.assertTrue(course.aggregates_are_consistent())
+
+    def run_in_threads(self, number_of_threads, work):
+        threads = [threading.Thread(target=work, args=(thread_number,)) for thread_number in range(number_of_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+class TestAsyncCourseServiceImpl(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.course_repository = MagicMock(wraps=CourseRepositoryImpl())
+        self.course_service = AsyncCourseServiceImpl(AsyncCourseRepositoryImpl(self.course_repository))
+        self.course_id = await self.course_service.create_course("Test Course")
+        self.assignment_id = await self.course_service.create_assignment(self.course_id, "Assignment 1")
+        self.course_repository.reset_mock()
+
+    async def test_batched_writes_are_published_together(self):
+        change_feed = ChangeFeed()
+        course_service = AsyncCourseServiceImpl(AsyncCourseRepositoryImpl(ChangeFeedRepository(self.course_repository, change_feed)))
+        await asyncio.gather(*[course_service.enroll_student(self.course_id, student_id) for student_id in [100, 200]])
+
+        self.assertEqual([(1, StudentEnrolled(100)), (2, StudentEnrolled(200))], [(event.sequence, event.change) for event in change_feed.read(0)])
+
+    async def test_concurrent_writes_to_a_course_share_one_load_and_save(self):
+        enroll_results = await asyncio.gather(*[self.course_service.enroll_student(self.course_id, student_id) for student_id in [100, 200, 100]])
+
+        self.assertEqual([True, True, False], enroll_results)
+        self.course_repository.get_course.assert_called_once_with(self.course_id)
+        self.course_repository.save_course.assert_called_once()
+        self.assertEqual({100, 200}, (await self.course_service.get_course_by_id(self.course_id)).students)
+
+    async def test_failed_write_does_not_affect_the_others_in_its_cycle(self):
+        results = await asyncio.gather(
+            self.course_service.enroll_student(self.course_id, 100),
+            self.course_service.create_assignment(self.course_id, ""),
+            self.course_service.submit_assignment(self.course_id, 100, self.assignment_id, 80),
+            return_exceptions=True)
+
+        self.assertTrue(results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertTrue(results[2])
+        self.assertEqual(80, await self.course_service.get_student_grade_avg(self.course_id, 100))
+
+    async def test_failed_batch_stores_none_of_its_operations(self):
+        results = await asyncio.gather(
+            self.course_service.enroll_student(self.course_id, 100),
+            self.course_service.create_assignments(self.course_id, ["Assignment 2", ""]),
+            self.course_service.enroll_students(self.course_id, [200, 300]),
+            return_exceptions=True)
+
+        self.assertTrue(results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual([True, True], results[2])
+        course = await self.course_service.get_course_by_id(self.course_id)
+        self.assertEqual(["Assignment 1"], list(course.assignments.values()))
+        self.assertEqual({100, 200, 300}, course.students)
+
+    async def test_flushes_are_kept_until_they_complete(self):
+        enrolment = asyncio.ensure_future(self.course_service.enroll_student(self.course_id, 100))
+        await asyncio.sleep(0) # the write is queued and its flush started
+
+        self.assertEqual(1, len(self.course_service._tasks))
+        self.assertTrue(await enrolment)
+        await asyncio.sleep(0)
+        self.assertEqual(set(), self.course_service._tasks)
+
+    async def test_delete_course_is_ordered_with_queued_writes(self):
+        results = await asyncio.gather(
+            self.course_service.enroll_student(self.course_id, 100),
+            self.course_service.delete_course(self.course_id),
+            self.course_service.enroll_student(self.course_id, 200),
+            return_exceptions=True)
+
+        self.assertEqual([True, True], results[:2])
+        self.assertIsInstance(results[2], Exception)
+        self.assertEqual([], await self.course_service.get_courses())
+
+    async def test_student_queries(self):
+        await self.course_service.enroll_student(self.course_id, 100)
+        await self.course_service.submit_assignment(self.course_id, 100, self.assignment_id, 70)
+
+        self.assertEqual([self.course_id], [course.id for course in await self.course_service.get_courses_for_student(100)])
+        self.assertEqual([TranscriptEntry(self.course_id, "Test Course", 70, 1)], await self.course_service.get_student_transcript(100))
+
+    async def test_grade_distribution_queries(self):
+        await self.course_service.enroll_students(self.course_id, [100, 200])
+        await self.course_service.submit_assignments(self.course_id, [(100, self.assignment_id, 70), (200, self.assignment_id, 90)])
+
+        self.assertEqual(2, sum(await self.course_service.get_assignment_grade_distribution(self.course_id, self.assignment_id)))
+        self.assertEqual(70, await self.course_service.get_assignment_median(self.course_id, self.assignment_id))
+        self.assertEqual(90, await self.course_service.get_course_grade_percentile(self.course_id, 100))
+        self.assertEqual(1, (await self.course_service.get_course_grade_distribution(self.course_id))[90])
+
+    async def test_threshold_queries(self):
+        await self.course_service.enroll_students(self.course_id, [100, 200])
+        await self.course_service.submit_assignments(self.course_id, [(100, self.assignment_id, 55), (200, self.assignment_id, 90)])
+
+        self.assertEqual([100], await self.course_service.get_students_below_average(self.course_id, 60))
+        self.assertEqual([200], await self.course_service.get_students_between_averages(self.course_id, 60, 100))
+        self.assertEqual([(self.course_id, 200)], await self.course_service.get_students_above_average_in_all_courses(89.5))
+
+    async def test_iter_course_summaries(self):
+        second_course_id = await self.course_service.create_course("Second Course")
+
+        course_summaries = [course_summary async for course_summary in self.course_service.iter_course_summaries(page_size=1)]
+
+        self.assertEqual([self.course_id, second_course_id], [course_summary.id for course_summary in course_summaries])
+
+    async def test_identical_reads_in_flight_share_one_repository_call(self):
+        course_service = AsyncCourseServiceImpl(AsyncCourseRepositoryImpl(self.course_repository, ThreadPoolExecutor(max_workers=2)))
+        await course_service.enroll_students(self.course_id, [100, 200])
+        await course_service.submit_assignments(self.course_id, [(100, self.assignment_id, 70), (200, self.assignment_id, 90)])
+
+        top_students = await asyncio.gather(*[course_service.get_top_five_students(self.course_id) for _ in range(10)])
+
+        self.assertEqual([[200, 100]] * 10, top_students)
+        self.course_repository.get_top_k_students.assert_called_once_with(self.course_id, 5)
+
+    async def test_reads_in_flight_are_not_shared_after_a_write_completes(self):
+        read_started, release_read = asyncio.Event(), asyncio.Event()
+        get_top_k_students = self.course_repository.get_top_k_students
+        async def slow_get_top_k_students(course_id, k):
+            top_students = get_top_k_students(course_id, k)
+            read_started.set()
+            await release_read.wait()
+            return top_students
+        course_service = AsyncCourseServiceImpl(AsyncCourseRepositoryImpl(self.course_repository))
+        course_service.course_repository.get_top_k_students = slow_get_top_k_students
+        await course_service.enroll_student(self.course_id, 100)
+        await course_service.submit_assignment(self.course_id, 100, self.assignment_id, 70)
+
+        stale_read = asyncio.ensure_future(course_service.get_top_five_students(self.course_id))
+        await read_started.wait()
+        await course_service.enroll_student(self.course_id, 200)
+        await course_service.submit_assignment(self.course_id, 200, self.assignment_id, 90)
+        fresh_read = asyncio.ensure_future(course_service.get_top_five_students(self.course_id))
+        release_read.set()
+
+        self.assertEqual([100], await stale_read)
+        self.assertEqual([200, 100], await fresh_read)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file